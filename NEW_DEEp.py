@@ -1,12 +1,14 @@
 import streamlit as st
 from fpdf import FPDF
-import pandas as pd
-from num2words import num2words
 import datetime
 import io
-from PIL import Image
 import os
 import textwrap
+from lazy_imports import LazyModule, lazy_function
+
+pd = LazyModule("pandas")  # loaded on Excel upload
+Image = LazyModule("PIL.Image")  # loaded on image upload
+num2words = lazy_function("num2words", "num2words")  # loaded for amounts in words
 
 # --- Global Data and Configuration ---
 PRODUCT_CATALOG = {
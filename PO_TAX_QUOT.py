@@ -1,12 +1,40 @@
 import streamlit as st
 from fpdf import FPDF
-import pandas as pd
-from num2words import num2words
 import datetime
+import glob
 import io
-from PIL import Image
 import os
+import sqlite3
+import tempfile
 import textwrap
+from collections import ChainMap
+from functools import lru_cache
+from lazy_imports import LazyModule, lazy_function
+from layout_templates import get_template
+from unicode_fonts import DOCUMENT_FONT, UnicodeFontsMixin, sanitize_text
+from pdf_output import DeterministicMixin, document_creation_date, pdf_to_bytes
+from pdf_optimizer import PdfOptimizerMixin
+from pdf_preview import preview_png
+from html_preview import LivePreview
+from document_models import DocumentError, Invoice, PurchaseOrder, Quotation
+from document_worker import QUEUED, RUNNING, WorkerBusy, get_worker
+from document_export import batch_entries, write_zip
+from job_queue import JobQueue, start_batch
+from mail_merge import queue_mail_merge
+from document_store import DocumentStore
+from outbox import SMTP_SENDER, Outbox, default_recipients, start_sending
+from warmup import start_warm_up
+from master_data import cached_master_data, get_master_data, workbook_digest
+from vendor_registry import get_registry, name_key
+from margin_report import (MATCHED as MARGIN_MATCHED, NO_INVOICE as MARGIN_NO_INVOICE, NO_PO as MARGIN_NO_PO,
+                           PERIODS as MARGIN_PERIODS, deal_margins)
+from reconciliation import (MATCHED as RECON_MATCHED, NO_INVOICE as RECON_NO_INVOICE, NO_PO as RECON_NO_PO,
+                            QTY_MISMATCH as RECON_QTY_MISMATCH, Reconciler, is_reconciling, start_reconciling)
+from price_history import latest_prices
+from top_report import ALL as TOP_ALL, FAMILIES as PRODUCT_FAMILIES, OTHER as TOP_OTHER, top_n
+
+Image = LazyModule("PIL.Image")  # loaded on image upload
+num2words = lazy_function("num2words", "num2words")  # loaded for amounts in words
 
 # --- Global Data and Configuration ---
 PRODUCT_CATALOG = {
@@ -123,21 +151,22 @@ SALES_PERSON_MAPPING = {
 }
 
 # --- Helper Functions for Vendor Management ---
-def get_vendor_dropdown_options():
+def get_vendor_dropdown_options(registry):
     """Get vendor names for dropdown"""
-    return ["Select Vendor"] + list(VENDOR_DATABASE.keys())
+    return ["Select Vendor"] + list(registry.names())
 
-def update_vendor_fields(selected_vendor):
+def update_vendor_fields(selected_vendor, registry):
     """Update session state with vendor details when vendor is selected"""
     if selected_vendor and selected_vendor != "Select Vendor":
-        vendor_data = VENDOR_DATABASE.get(selected_vendor, {})
+        vendor_data = registry.get(selected_vendor, {})
         st.session_state.po_vendor_name = selected_vendor
-        st.session_state.po_vendor_address = vendor_data.get("address", "")
-        st.session_state.po_vendor_contact = vendor_data.get("contact", "")
-        st.session_state.po_vendor_mobile = vendor_data.get("mobile", "")
-        st.session_state.po_gst_no = vendor_data.get("gst_no", "")
-        st.session_state.po_pan_no = vendor_data.get("pan_no", "")
-        st.session_state.po_msme_no = vendor_data.get("msme_no", "")
+        st.session_state.po_vendor_address = vendor_data.get("address") or ""
+        st.session_state.po_vendor_contact = vendor_data.get("contact") or ""
+        st.session_state.po_vendor_mobile = vendor_data.get("mobile") or ""
+        st.session_state.po_vendor_email = vendor_data.get("email") or ""
+        st.session_state.po_gst_no = vendor_data.get("gst_no") or ""
+        st.session_state.po_pan_no = vendor_data.get("pan_no") or ""
+        st.session_state.po_msme_no = vendor_data.get("msme_no") or ""
 
 # --- Helper Functions for Quotation and PO ---
 def get_current_quarter():
@@ -223,6 +252,26 @@ def get_next_sequence_number(quotation_number):
     except:
         pass
     return 1
+
+def allocate_quotation_numbers(first_number, count):
+    """count unused quotation numbers from first_number on.
+
+    Numbers already stored (or queued in an unfinished batch) are skipped, so
+    a merge never replaces an earlier quotation. Raises ValueError unless
+    first_number is a full CMI/SP/Qn/date/years_NNN number.
+    """
+    base, _, sequence = first_number.rpartition("_")
+    if len(base.split("/")) != 5 or not sequence.isdigit():
+        raise ValueError(f"Quotation number '{first_number}' is not in the CMI/SD/Q1/DD-MM-YYYY/YYYY-YYYY_001 "
+                         "form; correct it before merging.")
+    taken = JobQueue().taken_numbers("quotation", base + "_")
+    numbers, next_sequence = [], int(sequence)
+    while len(numbers) < count:
+        number = f"{base}_{next_sequence:03d}"
+        if number not in taken:
+            numbers.append(number)
+        next_sequence += 1
+    return numbers
 # --- Helper Functions for Invoice ---
 def parse_invoice_number(invoice_number):
     """Parse invoice number to extract components"""
@@ -261,7 +310,7 @@ def get_next_sequence_number_invoice(invoice_number):
 
 
 # --- PDF Class for Two-Page Quotation (Matching Demo Format) ---
-class QUOTATION_PDF(FPDF):
+class QUOTATION_PDF(PdfOptimizerMixin, DeterministicMixin, UnicodeFontsMixin, FPDF):
     def __init__(self, quotation_number="Q-N/A", quotation_date="Date N/A", sales_person_code="CP"):
         super().__init__()
         self.set_auto_page_break(auto=True, margin=15)
@@ -270,44 +319,33 @@ class QUOTATION_PDF(FPDF):
         self.quotation_number = quotation_number
         self.quotation_date = quotation_date
         self.sales_person_code = sales_person_code
+        self.layout = get_template("quotation")
         
     def sanitize_text(self, text):
-        try:
-            return text.encode('latin-1', 'ignore').decode('latin-1')
-        except:
-            return text
+        return sanitize_text(text)
 
     def header(self):
         # Logo placement (top right) - FIXED
         if hasattr(self, 'logo_path') and self.logo_path and os.path.exists(self.logo_path):
             try:
-                self.image(self.logo_path, x=155, y=8, w=50)
+                self.image(self.logo_path, **self.layout.dims["logo"])
             except:
                 # If image fails, show placeholder
-                self.set_font("Helvetica", "B", 10)
-                self.set_xy(150, 8)
-                self.cell(40, 5, "[LOGO]", border=0, align="C")
+                box = self.layout.dims["logo_placeholder"]
+                self.layout.style(self, "placeholder")
+                self.set_xy(box["x"], box["y"])
+                self.cell(box["w"], box["h"], "[LOGO]", border=0, align="C")
             
         # Main Title (Centered)
-        self.set_font("Helvetica", "B", 16)
-        self.set_y(15)
-        self.ln(5)
+        self.layout.run(self, "page_header")
 
     def footer(self):
-        self.set_y(-18)
-        self.set_font("Helvetica", "", 10)
-        self.cell(0, 4, "E/402, Ganesh Glory 11, Near BSNL Office, Jagatpur - Chenpur Road, Jagatpur Village, Ahmedabad - 382481", ln=True, align="C")
-        
-        # Make footer emails and phone clickable - FIXED OVERLAP
-        self.set_text_color(0, 0, 255)  # Blue color for links
-        
-        # Website link
-        # self.cell(0, 4, "www.cminfotech.com", ln=True, align="C", link="https://www.cminfotech.com/")
+        # Address line, then blue underlined links
+        self.layout.run(self, "footer_address")
         
         # Email and phone on same line - FIXED
-        self.set_font("Helvetica", "U", 10)
-        email_text = " info@cminfotech.com "
-        phone_text = " +91 873 391 5721"
+        email_text = self.layout.text["footer_email"]
+        phone_text = self.layout.text["footer_phone"]
         
         # Calculate positions for proper alignment
         page_width = self.w - 2 * self.l_margin
@@ -323,34 +361,33 @@ class QUOTATION_PDF(FPDF):
         self.cell(separator_width, 4, " | ", ln=0)
         self.cell(phone_width, 4, phone_text, ln=True, link=f"tel:{phone_text.replace(' ', '').replace('+', '')}")
 
-        self.cell(0, 4, "www.cminfotech.com", ln=True, align="C", link="https://www.cminfotech.com/")
-        
-        self.set_text_color(0, 0, 0)  # Reset to black
+        # Website link, then reset to black
+        self.layout.run(self, "footer_web")
         # self.set_y(-8)
-        # self.set_font("Helvetica", "I", 7)
+        # self.set_font(DOCUMENT_FONT, "I", 7)
         # self.cell(0, 4, f"Page {self.page_no()}", 0, 0, 'C')
 
 # --- Page Content Generation Helpers ---
 
 def add_clickable_email(pdf, email, label="Email: "):
     """Add clickable email with label - FIXED OVERLAP"""
-    pdf.set_font("Helvetica", "B", 12)
+    pdf.set_font(DOCUMENT_FONT, "B", 12)
     label_width = pdf.get_string_width(label)
     pdf.cell(label_width, 4, label, ln=0)
     
     pdf.set_text_color(0, 0, 255)  # Blue for clickable
-    pdf.set_font("Helvetica", "", 12)
+    pdf.set_font(DOCUMENT_FONT, "", 12)
     pdf.cell(0, 4, email, ln=True, link=f"mailto:{email}")
     pdf.set_text_color(0, 0, 0)  # Reset to black
 
 def add_clickable_phone(pdf, phone, label="Mobile: "):
     """Add clickable phone number with label - FIXED OVERLAP"""
-    pdf.set_font("Helvetica", "B", 12)
+    pdf.set_font(DOCUMENT_FONT, "B", 12)
     label_width = pdf.get_string_width(label)
     pdf.cell(label_width, 4, label, ln=0)
     
     pdf.set_text_color(0, 0, 255)  # Blue for clickable
-    pdf.set_font("Helvetica", "", 12)
+    pdf.set_font(DOCUMENT_FONT, "", 12)
     # Remove spaces and + for tel link
     tel_number = phone.replace(' ', '').replace('+', '')
     pdf.cell(0, 4, phone, ln=True, link=f"tel:{tel_number}")
@@ -358,39 +395,39 @@ def add_clickable_phone(pdf, phone, label="Mobile: "):
 
 def add_page_one_intro(pdf, data):
     # Reference Number & Date (Top Right) - FIXED ALIGNMENT
-    pdf.set_font("Helvetica", "B", 12)
+    pdf.set_font(DOCUMENT_FONT, "B", 12)
     pdf.set_y(25)
-    pdf.cell(0, 5, f"REF NO.: {data['quotation_number']}", ln=True, align="L")
-    pdf.cell(0, 5, f"Date: {data['quotation_date']}", ln=True, align="L")
+    pdf.cell(0, 5, f"REF NO.: {data.quotation_number}", ln=True, align="L")
+    pdf.cell(0, 5, f"Date: {data.quotation_date}", ln=True, align="L")
     pdf.ln(5)
 
     # Recipient Details (Left Aligned) - FIXED ALIGNMENT
-    pdf.set_font("Helvetica", "", 12)
+    pdf.set_font(DOCUMENT_FONT, "", 12)
     pdf.cell(0, 5, "To,", ln=True)
-    pdf.set_font("Helvetica", "B", 12)
-    pdf.cell(0, 6, pdf.sanitize_text(data['vendor_name']), ln=True)
-    pdf.set_font("Helvetica", "", 12)
+    pdf.set_font(DOCUMENT_FONT, "B", 12)
+    pdf.cell(0, 6, data.vendor_name, ln=True)
+    pdf.set_font(DOCUMENT_FONT, "", 12)
     
     # Address handling
-    pdf.multi_cell(0, 4, pdf.sanitize_text(data['vendor_address']))
+    pdf.multi_cell(0, 4, data.vendor_address)
     
     pdf.ln(3)
     
     # Clickable Email - FIXED
-    if data.get('vendor_email'):
-        add_clickable_email(pdf, data['vendor_email'])
+    if data.vendor_email:
+        add_clickable_email(pdf, data.vendor_email)
     
     # Clickable Mobile - FIXED
-    if data.get('vendor_mobile'):
-        add_clickable_phone(pdf, data['vendor_mobile'])
+    if data.vendor_mobile:
+        add_clickable_phone(pdf, data.vendor_mobile)
     
-    pdf.set_font("Helvetica", "BU", 12)
-    pdf.cell(0, 5, f"Kind Attention :- {pdf.sanitize_text(data['vendor_contact'])}",align="C", ln=True)
+    pdf.set_font(DOCUMENT_FONT, "BU", 12)
+    pdf.cell(0, 5, f"Kind Attention :- {data.vendor_contact}",align="C", ln=True)
     pdf.ln(5)
 
     # Subject Line (from user input)
-    pdf.set_font("Helvetica", "BU", 12)
-    pdf.cell(0, 6, f"Subject :- {pdf.sanitize_text(data['subject'])}", ln=True)
+    pdf.set_font(DOCUMENT_FONT, "BU", 12)
+    pdf.cell(0, 6, f"Subject :- {data.subject}", ln=True)
     pdf.ln(5)
 
     # --- Simple and Reliable Paragraph Formatting ---
@@ -447,22 +484,22 @@ def add_page_one_intro(pdf, data):
                 for start, end, style in format_positions:
                     # Write text before formatting
                     if start > current_pos:
-                        pdf.set_font("Helvetica", "", 12)
+                        pdf.set_font(DOCUMENT_FONT, "", 12)
                         pdf.write(5, line[current_pos:start])
                     
                     # Write formatted text
                     formatted_text = line[start:end]
                     if style == "bold":
-                        pdf.set_font("Helvetica", "B", 12)
+                        pdf.set_font(DOCUMENT_FONT, "B", 12)
                     else:  # underline
-                        pdf.set_font("Helvetica", "BU", 12)
+                        pdf.set_font(DOCUMENT_FONT, "BU", 12)
                     pdf.write(5, formatted_text)
                     
                     current_pos = end
                 
                 # Write remaining text
                 if current_pos < len(line):
-                    pdf.set_font("Helvetica", "", 12)
+                    pdf.set_font(DOCUMENT_FONT, "", 12)
                     pdf.write(5, line[current_pos:])
                 
                 pdf.ln(5)
@@ -472,7 +509,7 @@ def add_page_one_intro(pdf, data):
     # --- Write all paragraphs with formatting ---
     
     # Write the user's custom intro paragraph
-    intro_text = pdf.sanitize_text(data.get("intro_paragraph", ""))
+    intro_text = data.intro_paragraph
     if intro_text:
         write_paragraph_with_formatting(pdf, intro_text)
 
@@ -492,13 +529,13 @@ def add_page_one_intro(pdf, data):
 
     # Contact Information - FIXED ALIGNMENT with clickable elements - FIXED OVERLAP
     page_width = pdf.w - 2 * pdf.l_margin
-    pdf.set_font("Helvetica", "", 12)
+    pdf.set_font(DOCUMENT_FONT, "", 12)
     pdf.set_text_color(0, 0, 0)
 
 
     # Contact Information - FIXED ALIGNMENT with clickable elements - FIXED OVERLAP
     page_width = pdf.w - 2 * pdf.l_margin
-    pdf.set_font("Helvetica", "", 12)
+    pdf.set_font(DOCUMENT_FONT, "", 12)
     pdf.set_text_color(0, 0, 0)
 
     # Normal text
@@ -506,36 +543,35 @@ def add_page_one_intro(pdf, data):
                 "at the below mentioned address or email at ")
 
     # Get sales person info dynamically
-    sales_person_code = data.get('sales_person_code', 'SD')
-    sales_person_info = SALES_PERSON_MAPPING.get(sales_person_code, SALES_PERSON_MAPPING['SD'])
+    sales_person_info = SALES_PERSON_MAPPING.get(data.sales_person_code, SALES_PERSON_MAPPING['SD'])
     
     # Email clickable - DYNAMIC from sales person
     pdf.set_text_color(0, 0, 255)
-    pdf.set_font("Helvetica", "U", 12)  # underline
+    pdf.set_font(DOCUMENT_FONT, "U", 12)  # underline
     pdf.write(5, sales_person_info["email"], link=f"mailto:{sales_person_info['email']}")
 
     # Back to normal for separator + Mobile:
     pdf.set_text_color(0, 0, 0)
-    pdf.set_font("Helvetica", "", 12)
+    pdf.set_font(DOCUMENT_FONT, "", 12)
     pdf.write(5, "  Mobile: ")
 
     # Mobile clickable - DYNAMIC from sales person
     pdf.set_text_color(0, 0, 255)
-    pdf.set_font("Helvetica", "U", 12)
+    pdf.set_font(DOCUMENT_FONT, "U", 12)
     pdf.write(5, sales_person_info["mobile"], link=f"tel:{sales_person_info['mobile'].replace(' ', '').replace('+', '')}")
 
     # Reset back to normal for anything after
     pdf.set_text_color(0, 0, 0)
-    pdf.set_font("Helvetica", "", 12)
+    pdf.set_font(DOCUMENT_FONT, "", 12)
     pdf.ln(10)
     
     pdf.ln(3)
-    pdf.set_font("Helvetica", "", 12)
+    pdf.set_font(DOCUMENT_FONT, "", 12)
     pdf.cell(0, 4, "For more information, please visit our web site & Social Media :-", ln=True)
-    pdf.set_font("Helvetica", "", 12)
+    pdf.set_font(DOCUMENT_FONT, "", 12)
     
     # Clickable website
-    pdf.set_font("Helvetica", "U", 12)
+    pdf.set_font(DOCUMENT_FONT, "U", 12)
     pdf.set_text_color(0, 0, 255)
     pdf.cell(0, 4, "https://www.cminfotech.com/", ln=True, link="https://www.cminfotech.com/")
     pdf.cell(0, 4, "https://www.linkedin.com/", ln=True, link="https://www.linkedin.com/")
@@ -547,54 +583,43 @@ def add_page_one_intro(pdf, data):
 
 def add_quotation_header(pdf, annexure_text, quotation_text):
     """Add dynamic quotation header with both annexure and title"""
-    pdf.set_font("Helvetica", "BU", 14)
-    pdf.cell(0, 8, annexure_text, ln=True, align="C")
-    pdf.set_font("Helvetica", "BU", 12)
-    pdf.cell(0, 6, quotation_text, ln=True, align="C")
-    pdf.ln(8)
+    pdf.layout.run(pdf, "annexure_header", {"annexure_text": annexure_text, "quotation_text": quotation_text})
 
-def add_page_two_commercials(pdf, data):
+def add_page_two_commercials(pdf, data, stamp_path=None):
     pdf.add_page()
     
     # Use dynamic header function
-    annexure_text = data.get('annexure_text', 'Annexure I - Commercials')
-    quotation_title = data.get('quotation_title', 'Quotation for Adobe Software')
-    
-    add_quotation_header(pdf, annexure_text, quotation_title)
+    add_quotation_header(pdf, data.annexure_text, data.quotation_title)
 
-    # --- Products Table - FIXED COLUMN WIDTHS (Wider Description) ---
-    col_widths = [70, 25, 25, 25, 15, 25]  # Increased Description from 70 to 100
-    headers = ["Description", "Basic Price", "GST Tax @ 18%", "Per Unit Price", "Qty.", "Total"]
-    
-    # Table Header
-    pdf.set_fill_color(220, 220, 220)
-    pdf.set_font("Helvetica", "B", 9)
-    for width, header in zip(col_widths, headers):
-        pdf.cell(width, 7, header, border=1, align="C", fill=True)
-    pdf.ln()
+    # --- Products Table - column geometry comes from the quotation template ---
+    layout = pdf.layout
+    table = layout.header(pdf, "products")
+    col_widths = table.widths
+    line_height = table.line_height
 
     # Table Rows
-    pdf.set_font("Helvetica", "", 9)
+    pdf.set_font(*table.row_style)
     grand_total = 0.0
     
-    for product in data["products"]:
-        basic_price = product["basic"]
-        qty = product["qty"]
+    for product in data.products:
+        basic_price = product.basic
+        qty = product.qty
         gst_amount = basic_price * 0.18
         per_unit_price = basic_price + gst_amount
         total = per_unit_price * qty
         grand_total += total
+        cells = table.format_cells((None, basic_price, gst_amount, per_unit_price, qty, total))
         
         # Get current position
         start_y = pdf.get_y()
         
         # Description cell (with proper text wrapping)
-        desc = product["name"]
-        pdf.set_font("Helvetica", "", 9)
+        desc = product.name
+        pdf.set_font(*table.row_style)
         
         # Calculate how many lines the description will take
-        desc_lines = pdf.multi_cell(col_widths[0], 6, desc, border=0, split_only=True)
-        desc_height = len(desc_lines) * 6
+        desc_lines = pdf.multi_cell(col_widths[0], line_height, desc, border=0, split_only=True)
+        desc_height = len(desc_lines) * line_height
         
         # Set position for description
         pdf.set_xy(pdf.l_margin, start_y)
@@ -602,75 +627,41 @@ def add_page_two_commercials(pdf, data):
         # Draw description cell with proper height
         if len(desc_lines) > 1:
             # Multi-line description
-            pdf.multi_cell(col_widths[0], 6, desc, border=1)
+            pdf.multi_cell(col_widths[0], line_height, desc, border=1)
             current_y = pdf.get_y()
             
             # Set positions for other cells
             pdf.set_xy(pdf.l_margin + col_widths[0], start_y)
-            pdf.cell(col_widths[1], desc_height, f"{basic_price:,.2f}", border=1, align="R")
-            pdf.cell(col_widths[2], desc_height, f"{gst_amount:,.2f}", border=1, align="R")
-            pdf.cell(col_widths[3], desc_height, f"{per_unit_price:,.2f}", border=1, align="R")
-            pdf.cell(col_widths[4], desc_height, f"{qty:.0f}", border=1, align="C")
-            pdf.cell(col_widths[5], desc_height, f"{total:,.2f}", border=1, align="R")
+            for col in range(1, len(col_widths)):
+                pdf.cell(col_widths[col], desc_height, cells[col], border=1, align=table.aligns[col])
             
             # Move to next row
             pdf.set_y(current_y)
         else:
             # Single line description
-            pdf.cell(col_widths[0], 6, desc, border=1)
-            pdf.cell(col_widths[1], 6, f"{basic_price:,.2f}", border=1, align="R")
-            pdf.cell(col_widths[2], 6, f"{gst_amount:,.2f}", border=1, align="R")
-            pdf.cell(col_widths[3], 6, f"{per_unit_price:,.2f}", border=1, align="R")
-            pdf.cell(col_widths[4], 6, f"{qty:.0f}", border=1, align="C")
-            pdf.cell(col_widths[5], 6, f"{total:,.2f}", border=1, align="R")
+            pdf.cell(col_widths[0], line_height, desc, border=1)
+            for col in range(1, len(col_widths)):
+                pdf.cell(col_widths[col], line_height, cells[col], border=1, align=table.aligns[col])
             pdf.ln()
 
     # Grand Total Row - FIXED ALIGNMENT
-    pdf.set_font("Helvetica", "B", 10)
-    pdf.cell(sum(col_widths[:-1]), 7, "Grand Total", border=1, align="R")
-    pdf.cell(col_widths[5], 7, f"{grand_total:,.2f}", border=1, align="R")
-    pdf.ln(15)
+    layout.run(pdf, "grand_total", {"grand_total": grand_total})
 
     # --- Enhanced Box for Terms & Conditions and Bank Details ---
-    pdf.set_font("Helvetica", "", 9)
-
-    # Terms & Conditions with ALL terms in bold
-    terms = [
-        ("1. Above charges are Inclusive of GST.", ""),
-        ("2. Any changes in Govt. duties, Taxes & Forex rate at the time of dispatch shall be applicable.", ""),
-        ("3. TDS should not be deducted at the time of payment as per Govt. NOTIFICATION NO. 21/2012 [F.No.142/10/2012-SO (TPL)] S.O. 1323(E), DATED 13-6-2012.", ""),
-        ("4. ELD licenses are paper licenses that do not contain media.", ""),
-        ("5. An Internet connection is required to access cloud services.", ""),
-        ("6. Training will be charged at extra cost depending on no. of participants.", ""),
-        ("7. Price Validity: ", "10 days from Quotation date"),
-        ("8. Payment: ", "100% Advance along with purchase order"),
-        ("9. Delivery period: ", "1-2 Weeks from the date of Purchase Order"),
-        ("10. Cheque to be issued on name of: ", '"CM INFOTECH"'),
-        ("11. Order to be placed on: ", "CM INFOTECH \nE/402, Ganesh Glory, Near BSNL Office,\nJagatpur - Chenpur Road, Jagatpur Village,\nAhmedabad - 382481")
-    ]
-
-    # Bank Details
-    bank_info = [
-        ("Name", "CM INFOTECH"),
-        ("Account Number", "88130420182"),
-        ("IFSC Code", "IDFB0040335"),
-        ("SWIFT Code", "IDFBINBBMUM"),
-        ("Bank Name", "IDFC FIRST"),
-        ("Branch", "AHMEDABAD - SHYAMAL BRANCH"),
-        ("MSME", "UDYAM-GJ-01-0117646"),
-        ("GSTIN", "24ANMPP4891R1ZX"),
-        ("PAN No", "ANMPP4891R")
-    ]
+    # Terms & Conditions (first few ALL bold) and Bank Details from the template
+    terms = layout.text["terms"]
+    bank_info = layout.text["bank"]
 
     # Box dimensions and styling
+    dims = layout.dims
     x_start = pdf.get_x()
     y_start = pdf.get_y()
-    page_width = pdf.w - 1.6 * pdf.l_margin
-    col1_width = page_width * 0.6  # 60% for Terms
-    col2_width = page_width * 0.4  # 40% for Bank Details
-    padding = 4
-    line_height = 4.5
-    section_spacing = 2
+    page_width = pdf.w - dims["box_width_margins"] * pdf.l_margin
+    col1_width = page_width * dims["terms_ratio"]  # 60% for Terms
+    col2_width = page_width * (1 - dims["terms_ratio"])  # 40% for Bank Details
+    padding = dims["padding"]
+    line_height = dims["line_height"]
+    section_spacing = dims["section_spacing"]
 
     # Calculate required height for both columns
     def calculate_column_height(items, col_width):
@@ -688,7 +679,7 @@ def add_page_two_commercials(pdf, data):
 
     # Calculate bank details height including signature section
     bank_items_height = calculate_column_height(bank_info, col2_width)
-    signature_height = 35  # Estimated height for signature section
+    signature_height = dims["signature_height"]  # Estimated height for signature section
     bank_height = bank_items_height + signature_height + padding
 
     # Use the maximum height
@@ -701,7 +692,7 @@ def add_page_two_commercials(pdf, data):
     pdf.line(x_start + col1_width, y_start, x_start + col1_width, y_start + box_height)
 
     # Add section headers
-    pdf.set_font("Helvetica", "B", 12)
+    layout.style(pdf, "box_heading")
 
     # Terms & Conditions header
     pdf.set_xy(x_start + padding, y_start + padding)
@@ -712,22 +703,22 @@ def add_page_two_commercials(pdf, data):
     for i, (label, value) in enumerate(terms):
         pdf.set_xy(x_start + padding, terms_y)
         
-        if i < 6:  # First 6 terms - ALL BOLD
-            pdf.set_font("Helvetica", "B", 10)
+        if i < dims["bold_terms"]:  # First 6 terms - ALL BOLD
+            layout.style(pdf, "box_value")
             pdf.multi_cell(col1_width - 2*padding, line_height, label)
             
         elif value:  # Terms 7-11 with mixed formatting (label + bold value)
             # Write the regular font part
-            pdf.set_font("Helvetica", "", 10)
+            layout.style(pdf, "box_label")
             pdf.cell(pdf.get_string_width(label), line_height, label, ln=0)
             
             # Write the bold part
-            pdf.set_font("Helvetica", "B", 10)
+            layout.style(pdf, "box_value")
             remaining_width = col1_width - 2*padding - pdf.get_string_width(label)
             pdf.multi_cell(remaining_width, line_height, value)
             
             # Reset to regular font
-            pdf.set_font("Helvetica", "", 10)
+            layout.style(pdf, "box_label")
         else:
             # Regular terms without special formatting
             pdf.multi_cell(col1_width - 2*padding, line_height, label)
@@ -735,10 +726,10 @@ def add_page_two_commercials(pdf, data):
         terms_y = pdf.get_y()
 
     # Bank Details header - INSIDE THE BOX
-    pdf.set_font("Helvetica", "B", 12)
+    layout.style(pdf, "box_heading")
     pdf.set_xy(x_start + col1_width + padding, y_start + padding)
     pdf.cell(col2_width - 2*padding, 5, "Bank Details:", ln=True)
-    pdf.set_font("Helvetica", "", 12)  # Set to regular for labels
+    pdf.set_font(layout.family, "", 12)  # Set to regular for labels
 
     # Bank details content - INSIDE THE BOX
     bank_y = pdf.get_y()
@@ -746,11 +737,11 @@ def add_page_two_commercials(pdf, data):
         pdf.set_xy(x_start + col1_width + padding, bank_y)
         
         # Write label in regular font
-        pdf.set_font("Helvetica", "", 10)
+        layout.style(pdf, "box_label")
         pdf.cell(pdf.get_string_width(f"{label}: "), line_height, f"{label}: ", ln=0)
         
         # Write value in BOLD font
-        pdf.set_font("Helvetica", "B", 10)
+        layout.style(pdf, "box_value")
         remaining_width = col2_width - 2*padding - pdf.get_string_width(f"{label}: ")
         pdf.multi_cell(remaining_width, line_height, value)
         
@@ -760,7 +751,7 @@ def add_page_two_commercials(pdf, data):
     # --- Signature Block INSIDE BANK DETAILS BOX ---
     signature_start_y = bank_y + 5
     
-    pdf.set_font("Helvetica", "B", 10)
+    layout.style(pdf, "box_value")
     pdf.set_xy(x_start + col1_width + padding, signature_start_y)
     pdf.cell(col2_width - 2*padding, 5, "Yours Truly,", ln=True)
     
@@ -768,24 +759,23 @@ def add_page_two_commercials(pdf, data):
     pdf.cell(col2_width - 2*padding, 5, "For CM INFOTECH", ln=True)
     
     # --- Signature Block with Dynamic Sales Person ---
-    sales_person_code = data.get('sales_person_code', 'SD')
-    sales_person_info = SALES_PERSON_MAPPING.get(sales_person_code, SALES_PERSON_MAPPING['SD'])
+    sales_person_info = SALES_PERSON_MAPPING.get(data.sales_person_code, SALES_PERSON_MAPPING['SD'])
     
     # Add stamp between "For CM INFOTECH" and sales person name
-    if data.get('stamp_path') and os.path.exists(data['stamp_path']):
+    if stamp_path and os.path.exists(stamp_path):
         try:
             # Position stamp centered between "For CM INFOTECH" and sales person name
             stamp_y = pdf.get_y() + 2  # Small space after "For CM INFOTECH"
             stamp_x = x_start + col1_width + padding# + (col2_width - 2*padding - 20) / 2  # Center the stamp
-            pdf.image(data['stamp_path'], x=stamp_x, y=stamp_y, w=20)
+            pdf.image(stamp_path, x=stamp_x, y=stamp_y, w=dims["stamp_width"])
             # Move cursor down after stamp
-            pdf.set_y(stamp_y + 25)  # Space for stamp + some padding
+            pdf.set_y(stamp_y + dims["stamp_gap"])  # Space for stamp + some padding
         except:
             pdf.set_y(pdf.get_y() + 8)  # If stamp fails, add some space
     else:
         pdf.set_y(pdf.get_y() + 8)  # Space if no stamp
     
-    pdf.set_font("Helvetica", "", 9)
+    layout.style(pdf, "signature")
     pdf.set_xy(x_start + col1_width + padding, pdf.get_y())
     pdf.cell(col2_width - 2*padding, 4, sales_person_info["name"], ln=True)
     
@@ -793,23 +783,23 @@ def add_page_two_commercials(pdf, data):
     pdf.cell(col2_width - 2*padding, 4, "Inside Sales Executive", ln=True)
     
     # Clickable email in signature
-    pdf.set_font("Helvetica", "", 9)
+    layout.style(pdf, "signature")
     pdf.set_text_color(0, 0, 0)
     pdf.set_xy(x_start + col1_width + padding, pdf.get_y())
     label = "Email: "
     pdf.cell(pdf.get_string_width(label), 4, label, ln=0)
-    pdf.set_font("Helvetica", "U", 9)
+    layout.style(pdf, "signature_link")
     pdf.set_text_color(0, 0, 255)
     pdf.cell(col2_width - 2*padding - pdf.get_string_width(label), 4, sales_person_info["email"], 
              ln=True, link=f"mailto:{sales_person_info['email']}")
     
     # Clickable phone in signature
     pdf.set_text_color(0, 0, 0)
-    pdf.set_font("Helvetica", "", 9)
+    layout.style(pdf, "signature")
     pdf.set_xy(x_start + col1_width + padding, pdf.get_y())
     label = "Mobile: "
     pdf.cell(pdf.get_string_width(label), 4, label, ln=0)
-    pdf.set_font("Helvetica", "U", 9)
+    layout.style(pdf, "signature_link")
     pdf.set_text_color(0, 0, 255)
     pdf.cell(col2_width - 2*padding - pdf.get_string_width(label), 4, sales_person_info["mobile"], 
              ln=True, link=f"tel:{sales_person_info['mobile'].replace(' ', '').replace('+', '')}")
@@ -819,394 +809,201 @@ def add_page_two_commercials(pdf, data):
     pdf.set_xy(x_start, y_start + box_height + 10)
 
     
-def create_quotation_pdf(quotation_data, logo_path=None, stamp_path=None):
-    """Orchestrates the creation of the two-page PDF."""
-    sales_person_code = quotation_data.get('sales_person_code', 'SD')
-    pdf = QUOTATION_PDF(quotation_number=quotation_data['quotation_number'], 
-                        quotation_date=quotation_data['quotation_date'],
-                        sales_person_code=sales_person_code)
+def create_quotation_pdf(quotation_data, logo_path=None, stamp_path=None, deterministic=False, finish=pdf_to_bytes):
+    """Orchestrates the creation of the two-page PDF.
+
+    With deterministic=True the same inputs always produce the same bytes.
+    finish turns the built document into the return value (bytes by default).
+    quotation_data may be a Quotation or its payload dict.
+    """
+    quotation = Quotation.coerce(quotation_data)
+    pdf = QUOTATION_PDF(quotation_number=quotation.quotation_number, 
+                        quotation_date=quotation.quotation_date,
+                        sales_person_code=quotation.sales_person_code)
+    if deterministic:
+        pdf.creation_date = document_creation_date(quotation.quotation_date)
     
     # Set logo path for header
     if logo_path and os.path.exists(logo_path):
         pdf.logo_path = logo_path
     
-    quotation_data['stamp_path'] = stamp_path
-
     pdf.add_page()
     
     # 1. Add Page 1 (Introduction Letter)
-    add_page_one_intro(pdf, quotation_data)
+    add_page_one_intro(pdf, quotation)
 
     # 2. Add Page 2 (Commercials, Terms, Bank Details)
-    add_page_two_commercials(pdf, quotation_data)
+    add_page_two_commercials(pdf, quotation, stamp_path)
     
-    # Handle PDF output properly
-    try:
-        pdf_output = pdf.output(dest='S')
-        
-        if isinstance(pdf_output, str):
-            return pdf_output.encode('latin-1')
-        elif isinstance(pdf_output, bytearray):
-            return bytes(pdf_output)
-        elif isinstance(pdf_output, bytes):
-            return pdf_output
-        else:
-            return str(pdf_output).encode('latin-1')
-            
-    except Exception:
-        # Fallback method
-        try:
-            buffer = io.BytesIO()
-            pdf.output(dest=buffer)
-            return buffer.getvalue()
-        except Exception as e:
-            st.error(f"PDF generation failed: {e}")
-            return b""
+    return finish(pdf)
 
 from fpdf import FPDF
 
 # --- PDF Class for Tax Invoice ---
 from fpdf import FPDF
 
-class PDF(FPDF):
+class PDF(PdfOptimizerMixin, DeterministicMixin, UnicodeFontsMixin, FPDF):
     def __init__(self):
         super().__init__()
-        self.set_font("Helvetica", "", 8)
+        self.layout = get_template("invoice")
+        self.layout.style(self, "body")
         self.set_left_margin(15)
         self.set_right_margin(15)
 
     def header(self):
-        self.set_font("Helvetica", "B", 12)
-        self.cell(0, 6, "TAX INVOICE", ln=True, align="C")
-        self.ln(3)
+        self.layout.run(self, "page_header")
+
+
+def _label_value_rows(pdf, layout, rows, label_border, value_border):
+    """Bold label + regular value rows in the left column"""
+    left_margin = layout.dims["left_margin"]
+    left_width = layout.dims["left_width"]
+    row_height = layout.dims["label_row_height"]
+    for label, value in rows:
+        pdf.set_x(left_margin)
+        layout.style(pdf, "label")
+        label_width = pdf.get_string_width(label)
+        pdf.cell(label_width, row_height, label, border=label_border, ln=0)
+        layout.style(pdf, "body")
+        pdf.cell(left_width - label_width, row_height, value, border=value_border, ln=1)
 
 
 # --- Function to Create Invoice PDF ---
-def create_invoice_pdf(invoice_data, logo_file="logo_final.jpg", stamp_file="stamp.jpg"):
+def create_invoice_pdf(invoice_data, logo_file="logo_final.jpg", stamp_file="stamp.jpg", deterministic=False, finish=pdf_to_bytes):
+    invoice = Invoice.coerce(invoice_data)
     pdf = PDF()
+    if deterministic:
+        pdf.creation_date = document_creation_date(invoice.date)
+    layout = pdf.layout
+    dims = layout.dims
+    text = layout.text
     pdf.set_auto_page_break(auto=False, margin=10)
     pdf.add_page()
 
         # --- Logo on top right ---
     if logo_file:
         try:
-            pdf.image(logo_file, x=160, y=2.5, w=35)
+            pdf.image(logo_file, **dims["logo"])
         except Exception as e:
             st.warning(f"Could not add logo: {e}")
 
     # === HEADER (Vendor + Invoice Details) ===
-    pdf.set_font("Helvetica", "B", 10)
-    pdf.cell(92, 8, "CM Infotech.", border=1, ln=0)
-    pdf.cell(44, 8, "Invoice No.", border=1, ln=0, align="C")
-    pdf.cell(44, 8, "Invoice Date", border=1, ln=1, align="C")
+    layout.run(pdf, "seller_header")
 
     y_left_start = pdf.get_y()
 
     # --- Left Side (Vendor Details) ---
-    pdf.set_font("Helvetica", "", 8)
-    pdf.multi_cell(92, 4, "E/402, Ganesh Glory 11, Near BSNL Office, Jagatpur,\nChenpur Road, Jagatpur Village, Ahmedabad - 382481", border="LB")
+    layout.style(pdf, "body")
+    pdf.multi_cell(dims["left_width"], 4, text["seller_address"], border="LB")
     
     # Vendor details lines
     vendor_lines = [
-        ("GST No.:", invoice_data['vendor']['gst']),
-        ("MSME Registration No.:", invoice_data['vendor']['msme']),
-        ("E-Mail:", "cm.infotech2014@gmail.com"),
-        ("Mobile No.:", "8733915721"),
+        ("GST No.:", invoice.vendor.gst),
+        ("MSME Registration No.:", invoice.vendor.msme),
+        ("E-Mail:", text["seller_email"]),
+        ("Mobile No.:", text["seller_mobile"]),
     ]
-    
-    for i, (label, value) in enumerate(vendor_lines):
-        pdf.set_x(15)
-        pdf.set_font("Helvetica", "B", 8)
-        label_width = pdf.get_string_width(label)
-        pdf.cell(label_width, 6, label, border="LB", ln=0)
-        pdf.set_font("Helvetica", "", 8)
-        border = "RB" if i < len(vendor_lines) - 1 else "RB"
-        pdf.cell(92 - label_width, 6, value, border=border, ln=1)
-
-    y_left_end = pdf.get_y()
+    _label_value_rows(pdf, layout, vendor_lines, "LB", "RB")
 
     # --- Right Side (Invoice Details) ---
-    pdf.set_xy(107, y_left_start)
-    pdf.set_font("Helvetica", "", 8)
-    pdf.cell(44, 8, invoice_data['invoice']['invoice_no'], border="LR", ln=0, align="C")
-    pdf.cell(44, 8, invoice_data['invoice']['date'], border="R", ln=1, align="C")
-
-    # Payment terms
-    pdf.set_x(107)
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(44, 8, "Mode/Terms of Payment:", border="LRT", ln=0)
-    pdf.set_font("Helvetica", "", 8)
-    pdf.cell(44, 8, "100% Advance with Purchase", border="RT", ln=1)
-
-    # Supplier's reference
-    pdf.set_x(107)
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(44, 8, "Supplier's Reference:", border="LRT", ln=0)
-    pdf.set_font("Helvetica", "", 8)
-    other_ref_value = invoice_data['Reference']['Suppliers_Reference']
-    pdf.cell(44, 8, other_ref_value, border="LRTB", ln=1)
-
-    # Other's reference
-    pdf.set_x(107)
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(44, 8, "Other's Reference:", border="RTB", ln=0)
-    pdf.set_font("Helvetica", "", 8)
-    other_ref_value = invoice_data['Reference']['Other']
-    pdf.cell(44, 8, other_ref_value, border="LRTB", ln=1)
-
-    # # Empty closing row
-    # pdf.set_x(110)
-    # pdf.cell(94, 6, "", border="LRB", ln=1)
-
-    # pdf.ln(6)
+    layout.run(pdf, "invoice_meta", ChainMap({"y": y_left_start}, invoice))
 
     # === BUYER SECTION ===
-    pdf.set_font("Helvetica", "B", 10)
-    pdf.cell(92, 8, "Buyer", border=1, ln=0)
-    pdf.cell(44, 8, "Buyer's Order No.", border=1, ln=0, align="C")
-    pdf.cell(44, 8, "Buyer's Order Date", border=1, ln=1, align="C")
-
-    y_buyer_start = pdf.get_y()
+    layout.run(pdf, "buyer_header")
 
     # --- Buyer Left Details ---
     # Store starting position for left buyer block
-    y_left_buyer_start = pdf.get_y()
-    
-    # Buyer name and address
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(92, 5, invoice_data['buyer']['name'], border="LR", ln=1)
-    
-    pdf.set_font("Helvetica", "", 8)
-    pdf.multi_cell(92, 4, invoice_data['buyer']['address'], border="LRB")
+    y_buyer_start = pdf.get_y()
+    layout.run(pdf, "buyer_left", invoice.buyer)
     
     # Buyer contact details
     buyer_lines = [
-        ("Email:", "dmistry@baseengr.com"),
-        ("Tel No.:", "98987 91813"),
-        ("GST No.:", invoice_data['buyer']['gst']),
+        ("Email:", invoice.buyer.email or text["buyer_email"]),
+        ("Tel No.:", text["buyer_tel"]),
+        ("GST No.:", invoice.buyer.gst),
     ]
-    
-    for i, (label, value) in enumerate(buyer_lines):
-        pdf.set_x(15)
-        pdf.set_font("Helvetica", "B", 8)
-        label_width = pdf.get_string_width(label)
-        pdf.cell(label_width, 6, label, border="LBT", ln=0)
-        pdf.set_font("Helvetica", "", 8)
-        border = "RB" if i < len(buyer_lines) - 1 else "RB"
-        pdf.cell(92 - label_width, 6, value, border=border, ln=1)
+    _label_value_rows(pdf, layout, buyer_lines, "LBT", "RB")
 
-    y_buyer_left_end = pdf.get_y()
-    
     # Calculate total height of left buyer block
-    total_left_buyer_height = y_buyer_left_end - y_left_buyer_start
+    total_left_buyer_height = pdf.get_y() - y_buyer_start
 
     # --- Buyer Right Details ---
-    pdf.set_xy(107, y_buyer_start)
-    
     # Row 1: Buyer's Order No/Date - FIXED POSITION (doesn't stretch with address)
-    pdf.set_font("Helvetica", "", 8)
-    pdf.cell(44, 4, invoice_data['invoice_details']['buyers_order_no'], border="RB", ln=0, align="C")
-    pdf.cell(44, 4, invoice_data['invoice_details']['buyers_order_date'], border="RB", ln=1, align="C")
-
-    # Calculate remaining height needed for address space
-    name_height = 5  # Height of buyer name
-    contact_lines_height = 18  # Height of 3 contact lines (6mm each)
-    remaining_height_for_address = total_left_buyer_height - name_height - contact_lines_height
-    
+    layout.run(pdf, "buyer_order", ChainMap({"y": y_buyer_start}, invoice))
+
     # Add empty space for address if needed
+    remaining_height_for_address = total_left_buyer_height - dims["buyer_name_height"] - dims["buyer_contact_height"]
     if remaining_height_for_address > 0:
-        pdf.set_x(107)
-        pdf.cell(88, remaining_height_for_address, "", border="R", ln=1)
-
-    # Row 2: Dispatched Through
-    pdf.set_x(107)
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(44, 6, "Dispatched Through", border="LRT", ln=0)
-    pdf.set_font("Helvetica", "", 8)
-    pdf.cell(44, 6, invoice_data['invoice_details']['dispatched_through'], border="RT", ln=1)
-
-    # Row 3: Destination
-    pdf.set_x(107)
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(44, 6, "Destination", border="LRT", ln=0)
-    pdf.set_font("Helvetica", "", 8)
-    pdf.cell(44, 6, invoice_data['invoice_details']['destination'], border="RT", ln=1)
-
-    # Row 4: Terms of delivery
-    pdf.set_x(107)
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(44, 6, "Terms of delivery", border="LRT", ln=0)
-    pdf.set_font("Helvetica", "", 8)
-    pdf.cell(44, 6, invoice_data['invoice_details']['terms_of_delivery'], border="RT", ln=1)
-
-    # Closing row
-    pdf.set_x(107)
-    pdf.cell(88, 1, "", border="LRB", ln=1)
+        pdf.set_x(dims["right_x"])
+        pdf.cell(dims["right_width"], remaining_height_for_address, "", border="R", ln=1)
+
+    # Rows 2-4: Dispatched Through, Destination, Terms of delivery + closing row
+    layout.run(pdf, "dispatch", invoice)
 
     # --- Item Table Header ---
     pdf.ln(2)
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(10, 5, "Sr. No.", border=1, align="C")
-    pdf.cell(75, 5, "Description of Goods", border=1, align="C")#-5
-    pdf.cell(20, 5, "HSN/SAC", border=1, align="C")
-    pdf.cell(20, 5, "Quantity", border=1, align="C")
-    pdf.cell(24, 5, "Unit Rate", border=1, align="C")#-1
-    pdf.cell(31, 5, "Amount", border=1, ln=True, align="C")#-2
+    table = layout.header(pdf, "items")
 
     # --- Items ---
-    pdf.set_font("Helvetica", "", 8)
-    col_widths = [10, 75, 20, 20, 24, 31]
-    line_height = 4
+    pdf.set_font(*table.row_style)
+    col_widths = table.widths
+    offsets = table.offsets
+    line_height = table.line_height
 
-    for i, item in enumerate(invoice_data["items"], start=1):
+    for i, item in enumerate(invoice.items, start=1):
         x_start = pdf.get_x()
         y_start = pdf.get_y()
 
         # Description
-        pdf.set_xy(x_start + col_widths[0], y_start)
-        pdf.multi_cell(col_widths[1], line_height, item['description'], border=1)
-        y_after_desc = pdf.get_y()
-        
-        row_height = y_after_desc - y_start
-        
+        pdf.set_xy(x_start + offsets[1], y_start)
+        pdf.multi_cell(col_widths[1], line_height, item.description, border=1)
+        row_height = pdf.get_y() - y_start
+
         # Other cells for the row
-        pdf.set_xy(x_start, y_start)
-        pdf.multi_cell(col_widths[0], row_height, str(i), border=1, align="C")
-        
-        pdf.set_xy(x_start + col_widths[0] + col_widths[1], y_start)
-        pdf.multi_cell(col_widths[2], row_height, item['hsn'], border=1, align="C")
-        
-        pdf.set_xy(x_start + sum(col_widths[:3]), y_start)
-        pdf.multi_cell(col_widths[3], row_height, str(item['quantity']), border=1, align="C")
-        
-        pdf.set_xy(x_start + sum(col_widths[:4]), y_start)
-        pdf.multi_cell(col_widths[4], row_height, f"{item['unit_rate']:.2f}", border=1, align="R")
-        
-        amount = item['quantity'] * item['unit_rate']
-        pdf.set_xy(x_start + sum(col_widths[:-1]), y_start)
-        pdf.multi_cell(col_widths[5], row_height, f"{amount:.2f}", border=1, align="R")
+        cells = table.format_cells((i, None, item.hsn, item.quantity, item.unit_rate, item.amount))
+        for col in (0, 2, 3, 4, 5):
+            pdf.set_xy(x_start + offsets[col], y_start)
+            pdf.multi_cell(col_widths[col], row_height, cells[col], border=1, align=table.aligns[col])
 
         pdf.set_xy(x_start, y_start + row_height)
 
-    # --- Totals ---
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(sum(col_widths[:5]), 5, "Basic Amount", border=1, align="L")
-    pdf.cell(31, 5, f"{invoice_data['totals']['basic_amount']:.2f}", border=1, ln=True, align="R")
-    
-    pdf.cell(sum(col_widths[:5]), 5, "SGST @ 9%", border=1, align="L")
-    pdf.cell(31, 5, f"{invoice_data['totals']['sgst']:.2f}", border=1, ln=True, align="R")
-    
-    pdf.cell(sum(col_widths[:5]), 5, "CGST @ 9%", border=1, align="L")
-    pdf.cell(31, 5, f"{invoice_data['totals']['cgst']:.2f}", border=1, ln=True, align="R")
-
-    pdf.cell(sum(col_widths[:5]), 5, "Final Amount to be Paid", border=1, align="L")
-    pdf.cell(31, 5, f"{invoice_data['totals']['final_amount']:.2f}", border=1, ln=True, align="R")
-    
-    # --- Amount in Words ---
-    pdf.ln(2)
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(180, 5, f"Amount Chargeable (in words): {invoice_data['totals']['amount_in_words']}", ln=True, border=1)
+    # --- Totals + Amount in Words ---
+    layout.run(pdf, "totals", invoice)
 
     # --- Tax Summary Table ---
-    pdf.ln(2)
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(33, 5, "HSN/SAN", border=1, align="C")
-    pdf.cell(33, 5, "Taxable Value", border=1, align="C")
-    pdf.cell(58, 5, "Central Tax", border=1, align="C")
-    pdf.cell(56, 5, "State Tax", border=1, ln=True, align="C")
-
-    pdf.cell(33, 5, "", border="L", ln=False)
-    pdf.cell(33, 5, "", border="L", ln=False)
-    pdf.cell(29, 5, "Rate", border="L", align="C")
-    pdf.cell(29, 5, "Amount", border="LR", align="C")
-    pdf.cell(29, 5, "Rate", border="L", align="C")
-    pdf.cell(27, 5, "Amount", border="LR", ln=True, align="C")
-
-    pdf.set_font("Helvetica", "", 8)
-    hsn_tax_value = sum(item['quantity'] * item['unit_rate'] for item in invoice_data["items"])
-    hsn_sgst = hsn_tax_value * 0.09
-    hsn_cgst = hsn_tax_value * 0.09
-    
-    pdf.cell(33, 5, "997331", border=1, align="C")
-    pdf.cell(33, 5, f"{hsn_tax_value:.2f}", border=1, align="C")
-    pdf.cell(29, 5, "9%", border=1, align="C")
-    pdf.cell(29, 5, f"{hsn_sgst:.2f}", border=1, align="C")
-    pdf.cell(29, 5, "9%", border=1, align="C")
-    pdf.cell(27, 5, f"{hsn_cgst:.2f}", border=1, ln=True, align="C")
-
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(33, 5, "Total", border=1, align="C")
-    pdf.cell(33, 5, f"{hsn_tax_value:.2f}", border=1, align="C")
-    pdf.cell(29, 5, "", border=1, align="C")
-    pdf.cell(29, 5, f"{hsn_sgst:.2f}", border=1, align="C")
-    pdf.cell(29, 5, "", border=1, align="C")
-    pdf.cell(27, 5, f"{hsn_cgst:.2f}", border=1, ln=True, align="C")
-    
-    pdf.ln(2)
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(180, 5, f"Tax Amount (in words): {invoice_data['totals']['tax_in_words']}", ln=True, border=1)
+    hsn_tax_value = invoice.taxable_value
+    layout.run(pdf, "tax_summary", {
+        "hsn": "997331",
+        "taxable_value": hsn_tax_value,
+        "sgst": hsn_tax_value * 0.09,
+        "cgst": hsn_tax_value * 0.09,
+        "tax_in_words": invoice.tax_in_words,
+    })
 
     # --- Reserve footer space ---
-    needed_space = 70
+    needed_space = dims["footer_reserve"]
     if pdf.get_y() + needed_space > pdf.h - pdf.b_margin:
         pdf.set_y(pdf.h - pdf.b_margin - needed_space)
 
-    # # --- Bank Details ---
-    # pdf.ln(3)
-    # pdf.set_font("Helvetica", "B", 8)
-    # pdf.cell(0, 5, "Company's Bank Details", ln=True)
-    # pdf.set_font("Helvetica", "", 8)
-    # pdf.multi_cell(0, 4,
-    #         f"Bank Nmae : IDFC FIRST\n"
-    #         "Branch        : AHMEDABAD Shyamal Branch\n"
-    #         "Account No : 88130420182\n"
-    #         "IFS Code    : IDFB0040335")
-    # #     f"Bank Name: {invoice_data['bank']['name']}\n"
-    # #     f"Branch: {invoice_data['bank']['branch']}\n"
-    # #     f"Account No.: {invoice_data['bank']['account_no']}\n"
-    # #     f"IFS Code: {invoice_data['bank']['ifsc']}"
-    # # )
-
-    # # --- Declaration ---
-    # pdf.ln(2)
-    # pdf.set_font("Helvetica", "B", 8)
-    # pdf.cell(0, 5, "Declaration:", ln=True)
-    # pdf.set_font("Helvetica", "", 8)
-    # pdf.multi_cell(0, 4, invoice_data['declaration'])
     # --- Bank Details & Declaration (Side by Side) ---
-    # pdf.ln(5)
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(90, 5, "Company's Bank Details", ln=0)  # left side
-    pdf.cell(90, 5, "Declaration:", ln=1)             # right side
-
-    pdf.set_font("Helvetica", "", 8)
-
-    # Left column (bank)
-    bank_text = (
-        "Bank Name : IDFC FIRST\n"
-        "Branch        : AHMEDABAD Shyamal Branch\n"
-        "Account No : 88130420182\n"
-        "IFS Code    : IDFB0040335"
-    )
+    layout.run(pdf, "bank_declaration_header")
 
     # Save current Y position
     y_before = pdf.get_y()
     x_left = pdf.get_x()
 
     # Left cell (Bank)
-    pdf.multi_cell(92, 4, bank_text, border=0)
+    pdf.multi_cell(dims["bank_width"], 4, text["bank"], border=0)
     # Go back up for right cell
-    pdf.set_xy(x_left + 90, y_before)
-    pdf.multi_cell(90, 4, invoice_data['declaration'], border=0)
+    pdf.set_xy(x_left + dims["declaration_offset"], y_before)
+    pdf.multi_cell(dims["declaration_width"], 4, invoice.declaration, border=0)
 
     # --- Signature ---
-    pdf.ln(1)
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(0, 5, "For CM Infotech.", ln=True, align="R")
+    layout.run(pdf, "signature_head")
 
     if stamp_file:
         try:
-            stamp_width = 25
+            stamp_width = dims["stamp_width"]
             stamp_x = pdf.w - pdf.r_margin - stamp_width
             stamp_y = pdf.get_y()
             pdf.image(stamp_file, x=stamp_x, y=stamp_y, w=stamp_width)
@@ -1216,160 +1013,69 @@ def create_invoice_pdf(invoice_data, logo_file="logo_final.jpg", stamp_file="sta
     else:
         pdf.ln(15)
         
-    pdf.set_font("Helvetica", "", 8)
-    pdf.cell(0, 5, "Authorized Signatory", ln=True, align="R")
+    layout.run(pdf, "signature_foot")
     
     # --- Footer with clickable email and mobile ---
-    pdf.set_y(-24)
-    pdf.set_font("Helvetica", "U", 8)
-    pdf.cell(0, 4, "This is a Computer Generated Invoice", ln=True, align="C")
-    
-    # Company address
-    pdf.set_y(-18)
-    pdf.set_font("Helvetica", "", 8)
-    pdf.cell(0, 4, "E/402, Ganesh Glory 11, Near BSNL Office, Jagatpur - Chenpur Road, Jagatpur Village, Ahmedabad - 382481", ln=True, align="C")
-    
-    # Clickable email and mobile
-    pdf.set_font("Helvetica", "U", 8)
-    pdf.set_text_color(0, 0, 255)
-    email1 = "info@cminfotech.com "
-    phone_number = " +91 873 391 5721"
-    pdf.cell(0, 4, f"{email1} | {phone_number}", ln=True, align="C", link=f"mailto:{email1}")
-    pdf.cell(0, 4, "www.cminfotech.com", ln=True, align="C", link="https://www.cminfotech.com/")
-    pdf.set_x((pdf.w - 80) / 2)
-    pdf.cell(0, 0, "", link=f"tel:{phone_number}")
-    pdf.set_text_color(0, 0, 0)
-
-    pdf_bytes = pdf.output(dest="S").encode('latin-1') if isinstance(pdf.output(dest="S"), str) else pdf.output(dest="S")
-    return pdf_bytes
-
+    layout.run(pdf, "footer", {"tel_x": (pdf.w - 80) / 2})
 
+    return finish(pdf)
 # --- PDF Class ---
-class PO_PDF(FPDF):
+class PO_PDF(PdfOptimizerMixin, DeterministicMixin, UnicodeFontsMixin, FPDF):
     def __init__(self):
         super().__init__()
         self.set_auto_page_break(auto=False, margin=10)
         self.set_left_margin(15)
         self.set_right_margin(15)
+        self.layout = get_template("po")
         self.logo_path = os.path.join(os.path.dirname(__file__),"logo_final.jpg")
-        font_dir = os.path.join(os.path.dirname(__file__), "fonts")
-        # Comment out font loading to avoid errors if fonts don't exist
-        # self.add_font("Calibri", "", os.path.join(font_dir, "calibri.ttf"), uni=True)
-        # self.add_font("Calibri", "B", os.path.join(font_dir, "calibrib.ttf"), uni=True)
-        # self.add_font("Calibri", "I", os.path.join(font_dir, "calibrii.ttf"), uni=True)
-        # self.add_font("Calibri", "BI", os.path.join(font_dir, "calibriz.ttf"), uni=True)
         self.website_url = "https://cminfotech.com/"
+        self.po_number = ""
+        self.po_date = ""
     def header(self):
         if self.page_no() == 1:
             # Logo (if available)
             if self.logo_path and os.path.exists(self.logo_path):
-                self.image(self.logo_path, x=162.5, y=2.5, w=45,link=self.website_url)
-                # self.image(self.logo_path, x=150, y=10, w=40)
+                self.image(self.logo_path, **self.layout.dims["logo"], link=self.website_url)
 
-            
-            # Title
-            self.set_font("Helvetica", "B", 15)
-            self.cell(0, 15, "PURCHASE ORDER", ln=True, align="C")
-            self.ln(1)
-
-            # PO info
-            self.set_font("Helvetica", "", 12)
-            # PO Number (right aligned)
-            self.set_xy(140,25)
-            self.multi_cell(60,4,
-                            f"PO No: {self.sanitize_text(st.session_state.po_number)}\n"
-                            f"Date: {self.sanitize_text(st.session_state.po_date)}")
-            # self.cell(0, 8, f"PO No: {self.sanitize_text(st.session_state.po_number)}", ln=1, align='R')
-            # # Date (right aligned, under PO Number)
-            # self.cell(0, 8, f"Date: {self.sanitize_text(st.session_state.po_date)}", ln=0, align='R')
-            # self.ln(4)
+            # Title + PO info (right aligned)
+            self.layout.run(self, "page_header", {
+                "po_number": self.po_number,
+                "po_date": self.po_date,
+            })
 
     def footer(self):
-        self.set_y(-18)
-        self.set_font("Helvetica", "", 10)
-        self.multi_cell(0, 4, "E402, Ganesh Glory 11, Near BSNL Office, Jagatpur - Chenpur Road, Ahmedabad - 382481\n", align="C")
-        self.set_text_color(0, 0, 255)
-        self.set_font("Helvetica", "U", 10)
-        # email1 = "cad@cmi.com"
-        email1 = "info@cminfotech.com "
-        phone_number =" +91 873 391 5721"
-        self.set_text_color(0, 0, 255)
-        self.cell(0, 4, f"{email1} | {phone_number}", ln=True, align="C", link=f"mailto:{email1}")
-        self.set_x((self.w - 80) / 2)
-        self.cell(0, 0, "", link=f"tel:{phone_number}")
-        self.set_x((self.w - 60) / 2)
-        website ="www.cminfotech.com"
-        self.set_text_color(0, 0, 255)
-        self.cell(60, 4, f"{website}", ln=True, align="C", link=website)
-        self.set_text_color(0, 0, 0)
+        self.layout.run(self, "footer", {"tel_x": (self.w - 80) / 2, "web_x": (self.w - 60) / 2})
 
     def section_title(self, title):
-        self.set_font("Helvetica", "B", 12)
-        self.cell(0, 6, self.sanitize_text(title), ln=True)
-        self.ln(1)
+        self.layout.run(self, "section_title", {"title": self.sanitize_text(title)})
 
     def sanitize_text(self, text):
-        return text.encode('ascii', 'ignore').decode('ascii')
+        return sanitize_text(text)
 
-def create_po_pdf(po_data, logo_path = "logo_final.jpg"):
+def create_po_pdf(po_data, logo_path = "logo_final.jpg", deterministic=False, finish=pdf_to_bytes):
+    po = PurchaseOrder.coerce(po_data)
     pdf = PO_PDF()
+    layout = pdf.layout
     pdf.logo_path = logo_path
+    pdf.po_number = po.po_number
+    pdf.po_date = po.po_date
+    if deterministic:
+        pdf.creation_date = document_creation_date(po.po_date)
     pdf.add_page()
 
-    
-    # Sanitize all input strings
-    sanitized_vendor_name = pdf.sanitize_text(po_data['vendor_name'])
-    sanitized_vendor_address = pdf.sanitize_text(po_data['vendor_address'])
-    sanitized_vendor_contact = pdf.sanitize_text(po_data['vendor_contact'])
-    sanitized_vendor_mobile = pdf.sanitize_text(po_data['vendor_mobile'])
-    sanitized_gst_no = pdf.sanitize_text(po_data['gst_no'])
-    sanitized_pan_no = pdf.sanitize_text(po_data['pan_no'])
-    sanitized_msme_no = pdf.sanitize_text(po_data['msme_no'])
-    sanitized_bill_to_company = pdf.sanitize_text(po_data['bill_to_company'])
-    sanitized_bill_to_address = pdf.sanitize_text(po_data['bill_to_address'])
-    sanitized_ship_to_company = pdf.sanitize_text(po_data['ship_to_company'])
-    sanitized_ship_to_address = pdf.sanitize_text(po_data['ship_to_address'])
-    sanitized_end_company = pdf.sanitize_text(po_data['end_company'])
-    sanitized_end_address = pdf.sanitize_text(po_data['end_address'])
-    sanitized_end_person = pdf.sanitize_text(po_data['end_person'])
-    sanitized_end_mobile = pdf.sanitize_text(po_data['end_mobile'])
-    sanitized_end_email = pdf.sanitize_text(po_data['end_email'])
-    sanitized_payment_terms = pdf.sanitize_text(po_data['payment_terms'])
-    sanitized_delivery_terms = pdf.sanitize_text(po_data['delivery_terms'])
-    sanitized_prepared_by = pdf.sanitize_text(po_data['prepared_by'])
-    sanitized_authorized_by = pdf.sanitize_text(po_data['authorized_by'])
-    sanitized_company_name = pdf.sanitize_text(po_data['company_name'])
-    
     # --- Vendor & Bill/Ship ---
     pdf.section_title("Vendor & Addresses")
-    pdf.set_font("Helvetica", "", 10)
-    pdf.multi_cell(95, 5, f"{sanitized_vendor_name}\n{sanitized_vendor_address}\nKind Attend: {sanitized_vendor_contact}\nMobile: {sanitized_vendor_mobile}")
-    pdf.ln(7)
-    # pdf.set_xy(110, pdf.get_y() - 20)
-    pdf.multi_cell(95, 5, f"Bill To: \n{sanitized_bill_to_company}\n{sanitized_bill_to_address}")
-    pdf.set_xy(120, pdf.get_y() - 20)
-    pdf.multi_cell(0, 5, f"Ship To: \n{sanitized_ship_to_company}\n{sanitized_ship_to_address}")
-    # pdf.ln(2)
-    pdf.multi_cell(0, 5, f"GST NO: {sanitized_gst_no}\nPAN NO: {sanitized_pan_no}\nMSME Registration No: {sanitized_msme_no}")
-    pdf.ln(2)
+    layout.run(pdf, "addresses", po)
 
     # --- Products Table ---
     pdf.section_title("Products & Services")
-    col_widths = [65, 22, 30, 25, 15, 22]
-    headers = ["Product", "Basic", "GST TAX @ 18%", "Per Unit Price", "Qty", "Total"]
-    pdf.set_fill_color(220, 220, 220)
-    pdf.set_font("Helvetica", "B", 10)
-    for h, w in zip(headers, col_widths):
-        pdf.cell(w, 6, pdf.sanitize_text(h), border=1, align="C", fill=True)
-    pdf.ln()
-
-    pdf.set_font("Helvetica", "", 10)
-    line_height = 5
-    for p in po_data["products"]:
-        gst_amt = p["basic"] * p["gst_percent"] / 100
-        per_unit_price = p["basic"] + gst_amt
-        total = per_unit_price * p["qty"]
-        name = pdf.sanitize_text(p["name"])
+    table = layout.header(pdf, "products")
+    col_widths = table.widths
+
+    pdf.set_font(*table.row_style)
+    line_height = table.line_height
+    for p in po.products:
+        name = p.name
 
         num_lines = pdf.multi_cell(col_widths[0], line_height, name, border=0, split_only=True)
         max_lines = max(len(num_lines), 1)
@@ -1380,108 +1086,387 @@ def create_po_pdf(po_data, logo_path = "logo_final.jpg"):
 
         pdf.multi_cell(col_widths[0], line_height, name, border=1)
         pdf.set_xy(x_start + col_widths[0], y_start)
-        pdf.cell(col_widths[1], row_height, f"{p['basic']:.2f}", border=1, align="R")
-        pdf.cell(col_widths[2], row_height, f"{gst_amt:.2f}", border=1, align="R")
-        pdf.cell(col_widths[3], row_height, f"{per_unit_price:.2f}", border=1, align="R")
-        pdf.cell(col_widths[4], row_height, f"{p['qty']:.2f}", border=1, align="C")
-        pdf.cell(col_widths[5], row_height, f"{total:.2f}", border=1, align="R")
+        cells = table.format_cells((name, p.basic, p.gst_amount, p.unit_price, p.qty, p.total))
+        for col in range(1, len(col_widths)):
+            pdf.cell(col_widths[col], row_height, cells[col], border=1, align=table.aligns[col])
         pdf.ln(row_height)
 
-    # Grand Total Row
-    pdf.set_font("Helvetica", "B", 10)
-    pdf.cell(sum(col_widths[:-1]), 6, "Grand Total", border=1, align="R")
-    pdf.cell(col_widths[5], 6, f"{po_data['grand_total']:.2f}", border=1, align="R")
-    pdf.ln(4)
-
-    # --- Amount in Words ---
-    pdf.ln(5)
-    pdf.set_font("Helvetica", "B", 10)
-    pdf.cell(0, 5, "Amount in Words:", ln=True)
-    pdf.set_font("Helvetica", "", 10)
-    pdf.multi_cell(0, 5, pdf.sanitize_text(po_data['amount_words']))
-    pdf.ln(4)
-
-    # # --- Terms ---
-    # pdf.section_title("Terms & Conditions")
-    # pdf.set_font("Helvetica", "", 10)
-    # pdf.multi_cell(0, 4, f"Taxes            : As specified above\nPayment                     : {sanitized_payment_terms}\nDelivery                      : {sanitized_delivery_terms}")
-    # pdf.ln(2)
-
-    # # --- End User ---
-    # pdf.section_title("End User Details")
-    # pdf.set_font("Helvetica", "", 10)
-    # pdf.multi_cell(0, 4, f"Company Name         :{sanitized_end_company}\nCompany Address   :{sanitized_end_address}\nContact                       : {sanitized_end_person} | {sanitized_end_contact}\nEmail                           : {sanitized_end_email}")
-    # pdf.ln(2)
-
+    # Grand Total Row + Amount in Words
+    layout.run(pdf, "grand_total", po)
 
     # --- Terms & Conditions ---
     pdf.section_title("Terms & Conditions")
-    pdf.set_font("Helvetica", "", 10)
-
-    # Taxes
-    pdf.cell(45, 4, "Taxes")
-    pdf.cell(5, 4, ":")
-    pdf.multi_cell(0, 4, f"As specified above")
-
-    # Payment
-    pdf.cell(45, 4, "Payment")
-    pdf.cell(5, 4, ":")
-    pdf.multi_cell(0, 4, f"{sanitized_payment_terms}")
-
-    # Delivery
-    pdf.cell(45, 4, "Delivery")
-    pdf.cell(5, 4, ":")
-    pdf.multi_cell(0, 4, f"{sanitized_delivery_terms}")
-
-    pdf.ln(2)
+    layout.run(pdf, "terms", po)
 
     # --- End User ---
     pdf.section_title("End User Details")
-    pdf.set_font("Helvetica", "", 10)
-
-    # Company Name
-    pdf.cell(45, 4, "Company Name")
-    pdf.cell(5, 4, ":")
-    pdf.multi_cell(0, 4, f"{sanitized_end_company}")
-
-    # Company Address
-    pdf.cell(45, 4, "Company Address")
-    pdf.cell(5, 4, ":")
-    pdf.multi_cell(0, 4, f"{sanitized_end_address}")
-
-    # Contact
-    pdf.cell(45, 4, "Contact")
-    pdf.cell(5, 4, ":")
-    pdf.multi_cell(0, 4, f"{sanitized_end_person} | {sanitized_end_mobile}")
-
-    # Email
-    pdf.cell(45, 4, "Email")
-    pdf.cell(5, 4, ":")
-    pdf.multi_cell(0, 4, f"{sanitized_end_email}")
-
-    pdf.ln(2)
-    # Authorization Section
-    # pdf.set_font("Helvetica", "", 10)
-    # pdf.set_x(pdf.l_margin)
-    # pdf.cell(0, 5, f"Prepared By: {sanitized_prepared_by}", ln=1, border=0)
-
-    # pdf.set_x(pdf.l_margin)
-    # pdf.cell(0, 5, f"Authorized By: {sanitized_authorized_by}", ln=1, border=0)
+    layout.run(pdf, "end_user", po)
 
     # --- Footer (Company Name + Stamp) that floats) ---
-    pdf.ln(5)
-    pdf.set_font("Helvetica", "", 10)
-    pdf.cell(0, 5, f"For, {sanitized_company_name}", ln=True, border=0, align="L")
+    layout.run(pdf, "sign_off", po)
     stamp_path = os.path.join(os.path.dirname(__file__), "stamp.jpg")
     if os.path.exists(stamp_path):
         pdf.ln(2)
-        pdf.image(stamp_path, x=pdf.get_x(), y=pdf.get_y(), w=30)
+        pdf.image(stamp_path, x=pdf.get_x(), y=pdf.get_y(), w=layout.dims["stamp_width"])
         pdf.ln(15)
 
-    pdf_bytes = pdf.output(dest="S").encode('latin-1')
-    return pdf_bytes
+    return finish(pdf)
 
 # --- Utility to safely get string from session_state ---
+# --- Amounts in Words ---
+@lru_cache(maxsize=256)
+def in_words(amount, to="cardinal", currency=None):
+    """num2words for an amount, cached: the forms rebuild their payload on every rerun"""
+    if currency:
+        return num2words(amount, to=to, currency=currency).title()
+    return num2words(amount, to=to).title()
+
+
+# --- Live HTML Preview ---
+def show_html_preview(key, kind, payload):
+    """Draw this tab's live preview of payload.
+
+    Streamlit reruns once per committed edit, so the preview renders in that
+    rerun (no timer); LivePreview re-renders only the blocks whose inputs changed.
+    """
+    state_key = f"{key}_html_preview"
+    if state_key not in st.session_state:
+        st.session_state[state_key] = LivePreview(kind)
+    preview = st.session_state[state_key]
+    preview.submit(payload)
+    st.html(preview.html(force=True))
+
+
+# --- Raster PDF Preview ---
+def show_pdf_preview(key, builder, payload, *images):
+    """The PDF as it will print, built only while its toggle is on"""
+    if not st.toggle("👁 PDF Preview", key=f"{key}_pdf_preview"):
+        return
+    try:
+        st.image(preview_png(builder, payload, *images), use_container_width=True)
+    except DocumentError as e:
+        st.warning(f"Preview unavailable: {e}")
+
+
+# --- Background Generation ---
+JOB_POLL_SECONDS = 0.5
+
+
+def start_generation(key, kind, payload, *images):
+    """Queue a deterministic build; its job id is kept in session_state[key]"""
+    try:
+        st.session_state[key] = get_worker().submit(kind, payload, *images, deterministic=True)
+        # Snapshot of what was submitted, stored with the PDF once it's done
+        st.session_state[f"{key}_document"] = DOCUMENT_MODELS[kind].from_dict(payload)
+    except (WorkerBusy, DocumentError) as e:
+        st.error(str(e))
+
+
+def finished_generation(key):
+    """The finished Job under key (returned once), or None while it is pending"""
+    job_id = st.session_state.get(key)
+    if not job_id:
+        return None
+    job = get_worker().status(job_id)
+    if job is not None and job.state in (QUEUED, RUNNING):
+        _generation_progress(key)
+        return None
+    del st.session_state[key]
+    return get_worker().collect(job_id)
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def _generation_progress(key):
+    job = get_worker().status(st.session_state.get(key))
+    if job is None or job.state not in (QUEUED, RUNNING):
+        # Full rerun so the tab collects the result
+        st.rerun()
+    label = "Waiting for a free worker..." if job.state == QUEUED else f"Generating {job.number} ({job.elapsed:.1f}s)"
+    st.progress(job.progress, text=label)
+
+
+# --- Master Data ---
+def shared_master_data(uploaded_file):
+    """Process-wide MasterData for an uploaded workbook, hashed once per upload"""
+    upload = st.session_state.get("master_upload")
+    if upload is None or upload[0] != uploaded_file.file_id:
+        upload = (uploaded_file.file_id, workbook_digest(uploaded_file.getbuffer()))
+        st.session_state.master_upload = upload
+    master = cached_master_data(upload[1])
+    if master is not None:
+        return master
+
+    bar = st.progress(0.0, text="Reading workbook...")
+
+    def on_progress(sheet, rows, total):
+        bar.progress(min(rows / total, 1.0) if total else 0.0, text=f"Reading {sheet}: {rows:,} rows")
+
+    master = get_master_data(uploaded_file.getbuffer(), upload[1], on_progress)
+    bar.empty()
+    return master
+
+
+# --- Document Store ---
+DOCUMENT_MODELS = {"invoice": Invoice, "po": PurchaseOrder, "quotation": Quotation}
+
+
+def store_generated(key, job):
+    """Keep the document generated under key and its PDF (this updates the dashboard); returns its id"""
+    document = st.session_state.pop(f"{key}_document", None)
+    if document is None:
+        return None
+    try:
+        document_id = DocumentStore().put(document, job.result)
+    except sqlite3.Error as e:
+        st.warning(f"The document was generated but could not be saved: {e}")
+        return None
+    start_reconciling()
+    return document_id
+
+
+# --- Vendor Prices ---
+def vendor_offers(products):
+    """Latest stored price per vendor for each product name (one lookup for the whole PO)"""
+    try:
+        return latest_prices([p["name"] for p in products])
+    except sqlite3.Error:
+        return {}
+
+
+def show_vendor_offer(offers, basic, vendor):
+    """The cheapest recent vendor for one PO line, highlighted when it beats this line"""
+    if not offers:
+        return
+    best = offers[0]
+    text = (f"💡 Cheapest recent vendor: **{best['vendor']}** at ₹{best['unit_price']:,.2f} "
+            f"({best['number']}, {best['doc_date']})")
+    if name_key(best["vendor"]) != name_key(vendor) and best["unit_price"] < basic:
+        st.info(f"{text} - ₹{basic - best['unit_price']:,.2f} below this line's price")
+    else:
+        st.caption(text)
+    if len(offers) > 1:
+        st.caption("Others: " + ", ".join(f"{o['vendor']} ₹{o['unit_price']:,.2f}" for o in offers[1:4]))
+
+
+# --- Dashboard ---
+DASHBOARD_KINDS = {"Invoices (revenue)": "invoice", "Quotations (pipeline)": "quotation", "Purchase Orders": "po"}
+DASHBOARD_DIMENSIONS = {"quarter": "Quarter", "sales_person": "Sales Person", "customer": "Customer",
+                        "product": "Product"}
+
+
+def show_dashboard():
+    """Totals per quarter, sales person, customer and product from the stored rollups"""
+    label = st.radio("Documents", list(DASHBOARD_KINDS), horizontal=True, key="dashboard_kind")
+    kind = DASHBOARD_KINDS[label]
+    store = DocumentStore()
+    totals = store.rollup_totals(kind)
+    if not totals["documents"]:
+        st.info("Nothing generated yet. Documents appear here as soon as they are generated.")
+        return
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Documents", totals["documents"])
+    col2.metric("Taxable Amount", f"₹{totals['amount']:,.2f}")
+    col3.metric("GST", f"₹{totals['gst']:,.2f}")
+    col4.metric("Total", f"₹{totals['total']:,.2f}")
+
+    for dimension, title in DASHBOARD_DIMENSIONS.items():
+        rows = store.rollup(dimension, kind)
+        if dimension == "quarter":
+            rows.sort(key=lambda row: row["key"])
+        if dimension == "sales_person":
+            for row in rows:
+                row["key"] = SALES_PERSON_MAPPING.get(row["key"], {}).get("name", row["key"])
+        st.subheader(f"By {title}")
+        if dimension == "quarter":
+            st.bar_chart({row["key"]: row["total"] for row in rows})
+        st.dataframe([{title: row["key"], "Documents": row["documents"], "Quantity": row["quantity"],
+                       "Taxable (₹)": row["amount"], "GST (₹)": row["gst"], "Total (₹)": row["total"]}
+                      for row in rows], use_container_width=True, hide_index=True)
+
+
+@st.cache_data(max_entries=16, show_spinner="Ranking products and customers...")
+def cached_top_n(since, until, n, by, generation):
+    """top_n, reused by every rerun until the next document is stored (generation)"""
+    return top_n(since, until, n, by)
+
+
+@st.cache_data(max_entries=16, show_spinner="Joining POs to invoices...")
+def cached_deal_margins(since, until, period, generation):
+    """deal_margins, reused by every rerun until the next document is stored (generation)"""
+    return deal_margins(since, until, period)
+
+
+def show_top_report():
+    """Top products and customers by revenue or margin, per product family"""
+    today = datetime.date.today()
+    col1, col2, col3, col4 = st.columns(4)
+    period = col1.date_input("Period", (today.replace(month=1, day=1), today), key="top_period")
+    by = col2.selectbox("Rank by", ["revenue", "margin", "quantity"], format_func=str.title, key="top_by")
+    family = col3.selectbox("Product family", [TOP_ALL] + [name for name, _ in PRODUCT_FAMILIES] + [TOP_OTHER],
+                            key="top_family")
+    n = col4.number_input("Top", min_value=1, max_value=100, value=10, key="top_n")
+    if len(period) != 2:
+        return
+    report = cached_top_n(period[0].isoformat(), period[1].isoformat(), int(n), by, DocumentStore().generation())
+    st.caption("Margin is invoiced revenue minus what POs in the same period paid vendors for the same product or end customer.")
+    for section, label in (("products", "Product"), ("customers", "Customer")):
+        rows = report[section].get(family, [])
+        st.subheader(f"Top {label}s")
+        if not rows:
+            st.info("No invoices or POs in this period.")
+            continue
+        st.dataframe([{label: row[section[:-1]], "Family": row["family"], "Revenue (₹)": row["revenue"],
+                       "Cost (₹)": row["cost"], "Margin (₹)": row["margin"], "Quantity": row["quantity"]}
+                      for row in rows], use_container_width=True, hide_index=True)
+
+
+def show_margin_report():
+    """Margin per deal and per product: POs joined to invoices by customer, product and period"""
+    today = datetime.date.today()
+    col1, col2 = st.columns(2)
+    dates = col1.date_input("Period", (today.replace(month=1, day=1), today), key="margin_dates")
+    period = col2.selectbox("Group deals by", MARGIN_PERIODS, index=1, format_func=str.title, key="margin_period")
+    if len(dates) != 2:
+        return
+    report = cached_deal_margins(dates[0].isoformat(), dates[1].isoformat(), period, DocumentStore().generation())
+    totals = report["totals"]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Matched Deals", totals["matched"])
+    col2.metric("Revenue", f"₹{totals['revenue']:,.2f}")
+    col3.metric("Vendor Cost", f"₹{totals['cost']:,.2f}")
+    col4.metric("Margin", f"₹{totals['margin']:,.2f}")
+    if totals["no_po"] or totals["no_invoice"]:
+        st.caption(f"{totals['no_po']} invoiced deal(s) have no PO and {totals['no_invoice']} PO deal(s) "
+                   "have no invoice in this period; they are listed below but not counted.")
+    if report["products"]:
+        st.subheader("Margin by Product")
+        st.dataframe([{"Product": row["product"], "Deals": row["deals"], "Revenue (₹)": row["revenue"],
+                       "Cost (₹)": row["cost"], "Margin (₹)": row["margin"], "Margin %": row["margin_percent"]}
+                      for row in report["products"]], use_container_width=True, hide_index=True)
+    statuses = st.multiselect("Deals", [MARGIN_MATCHED, MARGIN_NO_PO, MARGIN_NO_INVOICE], default=[MARGIN_MATCHED],
+                              key="margin_statuses")
+    st.dataframe([{"Period": deal["period"], "Customer": deal["customer"], "Product": deal["product"],
+                   "Status": deal["status"], "Invoiced Qty": deal["invoiced_qty"], "PO Qty": deal["bought_qty"],
+                   "Revenue (₹)": deal["revenue"], "Cost (₹)": deal["cost"], "Margin (₹)": deal["margin"],
+                   "Margin %": deal["margin_percent"]}
+                  for deal in report["deals"] if deal["status"] in statuses], use_container_width=True, hide_index=True)
+
+
+RECON_ROWS = 1000
+
+
+def show_reconciliation():
+    """Invoice lines without a matching PO line (and the reverse), reconciled in the background"""
+    generation = DocumentStore().generation()
+    if st.session_state.get("recon_generation") != generation:
+        start_reconciling()  # picks up documents stored elsewhere (batches, the CLI)
+        st.session_state.recon_generation = generation
+    if is_reconciling():
+        st.caption("Reconciling new documents in the background; switch this section off and on to refresh.")
+    reconciler = Reconciler()
+    summary = reconciler.summary()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Matched Invoice Lines", summary["invoice"].get(RECON_MATCHED, 0))
+    col2.metric("Quantity Mismatches", summary["invoice"].get(RECON_QTY_MISMATCH, 0))
+    col3.metric("Invoice Lines without PO", summary["invoice"].get(RECON_NO_PO, 0))
+    col4.metric("PO Lines without Invoice", summary["po"].get(RECON_NO_INVOICE, 0))
+    statuses = st.multiselect("Show", [RECON_QTY_MISMATCH, RECON_NO_PO, RECON_NO_INVOICE],
+                              default=[RECON_QTY_MISMATCH], key="recon_statuses")
+    if statuses:
+        rows = reconciler.findings(tuple(statuses), limit=RECON_ROWS)
+        st.dataframe([{"Date": row["doc_date"], "Document": f"{row['kind'].upper()} {row['number']}",
+                       "Customer": row["customer"], "Product": row["product"], "Qty": row["quantity"],
+                       "Status": row["status"], "Matched With": row["match"], "Matched Qty": row["match_quantity"]}
+                      for row in rows], use_container_width=True, hide_index=True)
+        if len(rows) == RECON_ROWS:
+            st.caption(f"Showing the latest {RECON_ROWS} lines; run `python reconciliation.py list` for all of them.")
+
+
+DASHBOARD_SECTIONS = (
+    ("📊 Dashboard", "dashboard", show_dashboard),
+    ("🏆 Top Products & Customers", "top", show_top_report),
+    ("💰 Deal Margins", "margin", show_margin_report),
+    ("🔎 PO ↔ Invoice Reconciliation", "recon", show_reconciliation),
+)
+
+
+def show_dashboard_tab():
+    """Each section reads the store only while it is switched on (Streamlit runs every tab on every rerun)"""
+    for title, key, show in DASHBOARD_SECTIONS:
+        st.header(title)
+        if not st.toggle("Show", key=f"{key}_open"):
+            continue
+        try:
+            show()
+        except sqlite3.Error as e:
+            st.warning(f"Could not read the document store: {e}")
+
+
+# --- Email ---
+def queue_emails(document_ids, sales_person):
+    """Queue stored documents for their recipients, cc the sales person; returns (queued, skipped)"""
+    info = SALES_PERSON_MAPPING.get(sales_person, SALES_PERSON_MAPPING['SD'])
+    outbox = Outbox()
+    queued = skipped = 0
+    for document_id in document_ids:
+        to, cc = default_recipients(outbox.store.get(document_id))
+        try:
+            outbox.enqueue(document_id, to, cc + [info["email"]], sender=SMTP_SENDER or info["email"])
+            queued += 1
+        except ValueError:
+            skipped += 1
+    if queued:
+        start_sending()
+    return queued, skipped
+
+
+# --- Mail Merge ---
+def show_mail_merge(batch_id, sales_person):
+    """Progress of a mail-merge batch, then its ZIP download"""
+    progress = JobQueue().progress(batch_id)
+    if progress["queued"] or progress["running"]:
+        start_batch(batch_id)  # no-op while running; resumes a batch cut off by a restart
+        _mail_merge_progress(batch_id)
+        return
+    st.success(f"✅ {progress['done']} quotations generated" +
+               (f", {progress['failed']} failed" if progress["failed"] else ""))
+    for seq, number, error in JobQueue().failures(batch_id):
+        st.warning(f"Row {seq + 1} ({number}): {error}")
+    if progress["done"]:
+        # Named by the batch's version, so a stale ZIP (re-generated documents, another store) is never served
+        zip_path = os.path.join(tempfile.gettempdir(), f"mail_merge_{batch_id}_{JobQueue().version(batch_id)}.zip")
+        if not os.path.exists(zip_path):
+            for stale in glob.glob(os.path.join(tempfile.gettempdir(), f"mail_merge_{batch_id}_*.zip")):
+                os.remove(stale)
+            write_zip(zip_path, batch_entries(batch_id))
+        with open(zip_path, "rb") as f:
+            st.download_button("⬇ Download All Quotations (ZIP)", data=f, file_name=f"Quotations_mail_merge_{batch_id}.zip",
+                               mime="application/zip", use_container_width=True)
+        if st.button(f"📧 Email All {progress['done']} Quotations", key="merge_email",
+                     disabled=st.session_state.get("merge_emailed") == batch_id):
+            document_ids = [doc_id for (doc_id,) in JobQueue().conn.execute(
+                "SELECT document_id FROM batch_items WHERE batch_id = ? AND document_id IS NOT NULL ORDER BY seq",
+                (batch_id,))]
+            queued, skipped = queue_emails(document_ids, sales_person)
+            st.session_state.merge_emailed = batch_id
+            st.success(f"📧 {queued} emails queued" + (f"; {skipped} rows have no email address" if skipped else ""))
+    if st.button("Start a New Mail Merge", key="merge_reset"):
+        del st.session_state["merge_batch"]
+        st.rerun()
+
+
+@st.fragment(run_every=1.0)
+def _mail_merge_progress(batch_id):
+    progress = JobQueue().progress(batch_id)
+    finished = progress["done"] + progress["failed"]
+    if finished >= progress["total"]:
+        st.rerun()
+    eta = progress["eta_seconds"]
+    st.progress(finished / max(progress["total"], 1),
+                text=f"{finished}/{progress['total']} quotations · {progress['per_second']}/s"
+                     + (f" · about {eta // 60}m {eta % 60}s left" if eta is not None else ""))
+
+
 def safe_str_state(key, default=""):
     """Ensure session_state value exists and is always a string."""
     if key not in st.session_state or not isinstance(st.session_state[key], str):
@@ -1492,6 +1477,7 @@ def safe_str_state(key, default=""):
 def main():
     st.set_page_config(page_title="Document Generator", page_icon="📑", layout="wide")
     st.title("📑 Document Generator - Invoice, PO & Quotation")
+    start_warm_up()  # first session after a deploy: load fonts, images and builders in the background
 
     # --- Initialize Session State ---
     if "quotation_seq" not in st.session_state:
@@ -1540,6 +1526,8 @@ def main():
         st.session_state.po_vendor_contact = "Ms/Mr"
     if "po_vendor_mobile" not in st.session_state:
         st.session_state.po_vendor_mobile = "+91 1234567890"
+    if "po_vendor_email" not in st.session_state:
+        st.session_state.po_vendor_email = ""
     if "po_gst_no" not in st.session_state:
         st.session_state.po_gst_no = "24ANMPP4891R1ZX"
     if "po_pan_no" not in st.session_state:
@@ -1548,53 +1536,63 @@ def main():
         st.session_state.po_msme_no = "UDYAM-GJ-01-0117646"
 
     # --- Upload Excel and Load Vendor/End User ---
-    uploaded_excel = st.file_uploader("📂 Upload Vendor & End User Excel", type=["xlsx"])
+    master = None
+    end_user = {}
+    uploaded_excel = st.file_uploader("📂 Upload Vendor & End User Excel", type=["xlsx", "xls"])
 
     if uploaded_excel:
-        vendors_df = pd.read_excel(uploaded_excel, sheet_name="Vendors", dtype={"Mobile": str})
-        endusers_df = pd.read_excel(uploaded_excel, sheet_name="EndUsers")
-
-        st.success("✅ Excel loaded successfully!")
-
-        # --- Select Vendor ---
-        vendor_name = st.selectbox("Select Vendor", vendors_df["Vendor Name"].unique())
-        vendor = vendors_df[vendors_df["Vendor Name"] == vendor_name].iloc[0]
+        try:
+            master = shared_master_data(uploaded_excel)
+        except ValueError as e:
+            st.error(f"Could not read the Excel: {e}")
 
-        # --- Select End User ---
-        end_user_name = st.selectbox("Select End User", endusers_df["End User Company"].unique())
-        end_user = endusers_df[endusers_df["End User Company"] == end_user_name].iloc[0]
+    # Built-in vendors merged with the workbook's, shared per workbook
+    vendors = get_registry(VENDOR_DATABASE, master)
 
-        # --- Clean and Convert Mobile (avoid float or NaN issues) ---
-        def safe_strip(value):
-            """Safely convert any value to string and strip whitespace."""
-            try:
-                if pd.isna(value):
-                    return ""
-                return str(value).split(".")[0].strip()
-            except Exception:
-                return ""
-
-        vendor_mobile = safe_strip(vendor.get("Mobile", ""))
-        End_user_mobile = safe_strip(end_user.get("End Mobile", ""))
-
-
-        # Save to session_state (so Invoice & PO can use)
-        st.session_state.po_vendor_name = vendor["Vendor Name"]
-        st.session_state.po_vendor_address = vendor["Vendor Address"]
-        st.session_state.po_vendor_contact = vendor["Contact Person"]
-        st.session_state.po_vendor_mobile = vendor_mobile
-        st.session_state.po_end_company = end_user["End User Company"]
-        st.session_state.po_end_address = end_user["End User Address"]
-        st.session_state.po_end_person = end_user["End User Contact"]
-        st.session_state.po_end_mobile = End_user_mobile
-        st.session_state.po_end_email = end_user["End User Email"]
-        st.session_state.po_end_gst_no = end_user["GST NO"]
-
-        st.info("Vendor & End User details auto-filled from Excel ✅")
+    if master is not None:
+        st.success("✅ Excel loaded successfully!")
+        duplicates = [d for d in vendors.duplicates if not d["merged"]]
+        if duplicates:
+            with st.expander(f"⚠️ {len(duplicates)} GST No. shared by different vendors"):
+                for duplicate in duplicates:
+                    st.write(f"{duplicate['key']}: " + ", ".join(duplicate["names"]))
+
+        # --- Select Vendor / End User (the session keeps only these keys) ---
+        empty = [sheet for sheet, table in (("Vendors", master.vendors), ("EndUsers", master.end_users))
+                 if not table.keys()]
+        if empty:
+            st.error(f"No rows in the {' and '.join(empty)} sheet of the Excel; add them to auto-fill the PO.")
+        else:
+            vendor_name = st.selectbox("Select Vendor", master.vendors.keys())
+            end_user_name = st.selectbox("Select End User", master.end_users.keys())
+            vendor = vendors[vendor_name]
+            end_user = master.end_users[end_user_name]
+
+            # Fill the PO form from the selected rows (normalized when the workbook
+            # was loaded) when the selection changes; form edits are kept until then
+            selection = (master.digest, vendor_name, end_user_name)
+            if st.session_state.get("master_selection") != selection:
+                st.session_state.master_selection = selection
+                st.session_state.po_vendor_name = vendor["name"]
+                st.session_state.po_vendor_address = vendor["address"]
+                st.session_state.po_vendor_contact = vendor["contact"]
+                st.session_state.po_vendor_mobile = vendor["mobile"]
+                st.session_state.po_vendor_email = vendor["email"] or ""
+                for field in ("gst_no", "pan_no", "msme_no"):
+                    if vendor[field]:
+                        st.session_state[f"po_{field}"] = vendor[field]
+                st.session_state.po_end_company = end_user.get("End User Company")
+                st.session_state.po_end_address = end_user.get("End User Address")
+                st.session_state.po_end_person = end_user.get("End User Contact")
+                st.session_state.po_end_mobile = end_user.get("End Mobile")
+                st.session_state.po_end_email = end_user.get("End User Email")
+
+            st.info("Vendor & End User details auto-filled from Excel ✅")
     
 
     # Create tabs for different document types
-    tab1, tab2, tab3 = st.tabs(["Tax Invoice Generator", "Purchase Order Generator", "Quotation Generator"])
+    tab1, tab2, tab3, tab4 = st.tabs(["Tax Invoice Generator", "Purchase Order Generator", "Quotation Generator",
+                                      "📊 Dashboard"])
 
         # --- Tab 1: Tax Invoice Generator ---
     with tab1:
@@ -1726,7 +1724,11 @@ def main():
             )
             buyer_gst = st.text_input(
                 "Buyer GST No.",
-                value=st.session_state.get("po_end_gst_no","24AAHCB9")
+                value=end_user.get("GST NO") or "24AAHCB9"
+            )
+            buyer_email = st.text_input(
+                "Buyer Email",
+                value=st.session_state.get("po_end_email") or ""
             )
 
             st.subheader("Products")
@@ -1748,40 +1750,43 @@ def main():
             stamp_file = st.file_uploader("Upload your company stamp (PNG, JPG)", type=["png", "jpg", "jpeg"], key="invoice_stamp")
 
             
-            st.subheader("Invoice Preview & Download")
-            if st.button("Generate Invoice", key="generate_invoice_button"):
-                basic_amount = sum(item['quantity'] * item['unit_rate'] for item in items)
-                sgst = basic_amount * 0.09
-                cgst = basic_amount * 0.09
-                final_amount = basic_amount + sgst + cgst
+            basic_amount = sum(item['quantity'] * item['unit_rate'] for item in items)
+            sgst = basic_amount * 0.09
+            cgst = basic_amount * 0.09
+            final_amount = basic_amount + sgst + cgst
                 
-                amount_in_words = num2words(final_amount, to="cardinal").title() + " Only/-"
-                tax_in_words = num2words(sgst + cgst, to="cardinal").title()+" Only/-"
-
-                invoice_data = {
-                    "invoice": {"invoice_no": invoice_no, "date": invoice_date},
-                    "Reference": {"Suppliers_Reference":Suppliers_Reference, "Other": Others_Reference},
-                    "vendor": {"name": vendor_name, "address": vendor_address, "gst": vendor_gst, "msme": vendor_msme},
-                    "buyer": {"name": buyer_name, "address": buyer_address, "gst": buyer_gst},
-                    "invoice_details": {
-                        "buyers_order_no": buyers_order_no,
-                        "buyers_order_date": buyers_order_date,
-                        "dispatched_through": dispatched_through,
-                        "terms_of_delivery": terms_of_delivery,
-                        "destination": destination
-                    },
-                    "items": items,
-                    "totals": {
-                        "basic_amount": basic_amount,
-                        "sgst": sgst,
-                        "cgst": cgst,
-                        "final_amount": final_amount,
-                        "amount_in_words": amount_in_words,
-                        "tax_in_words": tax_in_words
-                    },
-                    "declaration": declaration
-                }
+            amount_in_words = in_words(final_amount) + " Only/-"
+            tax_in_words = in_words(sgst + cgst) + " Only/-"
+
+            invoice_data = {
+                "invoice": {"invoice_no": invoice_no, "date": invoice_date},
+                "Reference": {"Suppliers_Reference":Suppliers_Reference, "Other": Others_Reference},
+                "vendor": {"name": vendor_name, "address": vendor_address, "gst": vendor_gst, "msme": vendor_msme},
+                "buyer": {"name": buyer_name, "address": buyer_address, "gst": buyer_gst, "email": buyer_email},
+                "invoice_details": {
+                    "buyers_order_no": buyers_order_no,
+                    "buyers_order_date": buyers_order_date,
+                    "dispatched_through": dispatched_through,
+                    "terms_of_delivery": terms_of_delivery,
+                    "destination": destination
+                },
+                "items": items,
+                "totals": {
+                    "basic_amount": basic_amount,
+                    "sgst": sgst,
+                    "cgst": cgst,
+                    "final_amount": final_amount,
+                    "amount_in_words": amount_in_words,
+                    "tax_in_words": tax_in_words
+                },
+                "declaration": declaration
+            }
 
+            st.subheader("Invoice Preview & Download")
+            show_html_preview("invoice", "invoice", invoice_data)
+            show_pdf_preview("invoice", create_invoice_pdf, invoice_data, None, None)
+
+            if st.button("Generate Invoice", key="generate_invoice_button"):
                 # Handle logo and stamp files
                 logo_path = None
                 stamp_path = None
@@ -1808,15 +1813,28 @@ def main():
                     except Exception as e:
                         st.warning(f"Could not process stamp: {e}")
 
-                pdf_file = create_invoice_pdf(invoice_data, logo_path, stamp_path)
+                start_generation("invoice_job", "invoice", invoice_data, logo_path, stamp_path)
+
+                # Clean up temporary files (the job keeps its own copies)
+                for path in ["temp_invoice_logo.jpg", "temp_invoice_stamp.jpg"]:
+                    if os.path.exists(path):
+                        try:
+                            os.remove(path)
+                        except:
+                            pass
 
+            job = finished_generation("invoice_job")
+            if job and job.error:
+                st.error(f"Error generating invoice: {job.error}")
+            elif job:
+                store_generated("invoice_job", job)
                 # Store the last invoice number for sequence tracking
-                st.session_state.last_invoice_number = invoice_no
+                st.session_state.last_invoice_number = job.number
                 
                 # Auto-increment for next invoice
                 if invoice_auto_increment:
                     try:
-                        next_sequence = get_next_sequence_number_invoice(invoice_no)
+                        next_sequence = get_next_sequence_number_invoice(job.number)
                         # Update the sequence in session state for next time
                         st.session_state.invoice_seq = next_sequence
                     except:
@@ -1826,18 +1844,11 @@ def main():
                 
                 st.download_button(
                     "⬇ Download Invoice PDF",
-                    data=pdf_file,
-                    file_name=f"Invoice_{invoice_no.replace('/', '_')}.pdf",
+                    data=job.result,
+                    file_name=f"Invoice_{job.number.replace('/', '_')}.pdf",
                     mime="application/pdf",
                     key="invoice_download_button")
-                
-                # Clean up temporary files
-                for path in ["temp_invoice_logo.jpg", "temp_invoice_stamp.jpg"]:
-                    if os.path.exists(path):
-                        try:
-                            os.remove(path)
-                        except:
-                            pass                
+
     # --- Tab 2: Purchase Order Generator ---
     with tab2:
         st.header("Purchase Order Generator")
@@ -1923,6 +1934,9 @@ def main():
                 new_quarter = st.text_input("Quarter", value=current_q, key="po_quarter_edit")
             
             with col4:
+                if "quote_seq_next" in st.session_state:
+                    # Numbers up to here were taken by a mail merge
+                    st.session_state.quote_seq_edit = st.session_state.pop("quote_seq_next")
                 new_sequence = st.number_input("Sequence", 
                                             min_value=1, 
                                             value=int(current_seq), 
@@ -1964,13 +1978,13 @@ def main():
                 # Vendor Dropdown
                 selected_vendor = st.selectbox(
                     "Select Vendor", 
-                    options=get_vendor_dropdown_options(),
+                    options=get_vendor_dropdown_options(vendors),
                     key="vendor_dropdown_po"
                 )
                 
                 # Update vendor fields when dropdown selection changes
                 if selected_vendor and selected_vendor != "Select Vendor":
-                    update_vendor_fields(selected_vendor)
+                    update_vendor_fields(selected_vendor, vendors)
                 
                 st.subheader("Vendor Details")
                 vendor_name = st.text_input(
@@ -1993,6 +2007,11 @@ def main():
                     value=st.session_state.get("po_vendor_mobile", "+91 1234567890"),
                     key="po_vendor_mobile"
                 )
+                vendor_email = st.text_input(
+                    "Vendor Email",
+                    value=st.session_state.get("po_vendor_email", ""),
+                    key="po_vendor_email"
+                )
                 
                 st.subheader("End User Details")
                 end_company = st.text_input(
@@ -2078,12 +2097,14 @@ def main():
             if st.button("➕ Add Empty Product", key="po_add_empty_product"):
                 st.session_state.products.append({"name": "New Product", "basic": 0.0, "gst_percent": 18.0, "qty": 1.0})
 
+            offers = vendor_offers(st.session_state.products)
             for i, p in enumerate(st.session_state.products):
                 with st.expander(f"Product {i+1}: {p['name']}", expanded=i == 0):
                     st.session_state.products[i]["name"] = st.text_input("Name", p["name"], key=f"po_name_{i}")
                     st.session_state.products[i]["basic"] = st.number_input("Basic (₹)", p["basic"], format="%.2f", key=f"po_basic_{i}")
                     st.session_state.products[i]["gst_percent"] = st.number_input("GST %", p["gst_percent"], format="%.1f", key=f"po_gst_{i}")
                     st.session_state.products[i]["qty"] = st.number_input("Qty", p["qty"], format="%.2f", key=f"po_qty_{i}")
+                    show_vendor_offer(offers.get(p["name"]), p["basic"], vendor_name)
                     # FIXED: Added unique key to the remove button
                     if st.button("Remove", key=f"po_remove_{i}"):
                         st.session_state.products.pop(i)
@@ -2110,7 +2131,7 @@ def main():
             total_base = sum(p["basic"] * p["qty"] for p in st.session_state.products)
             total_gst = sum(p["basic"] * p["gst_percent"] / 100 * p["qty"] for p in st.session_state.products)
             grand_total = total_base + total_gst
-            amount_words = num2words(grand_total, to="currency", currency="INR").title()
+            amount_words = in_words(grand_total, to="currency", currency="INR")
             st.metric("Grand Total", f"₹{grand_total:,.2f}")
 
             logo_file = st.file_uploader("Upload Company Logo", type=["png", "jpg", "jpeg"], key="po_logo_uploader")
@@ -2120,46 +2141,55 @@ def main():
                 with open(logo_path, "wb") as f:
                     f.write(logo_file.getbuffer())
             
+            po_data = {
+                "po_number": st.session_state.po_number,
+                "po_date": st.session_state.po_date,
+                "vendor_name": vendor_name,
+                "vendor_address": vendor_address,
+                "vendor_contact": vendor_contact,
+                "vendor_mobile": vendor_mobile,
+                "vendor_email": vendor_email,
+                "gst_no": gst_no,
+                "pan_no": pan_no,
+                "msme_no": msme_no,
+                "bill_to_company": bill_to_company,
+                "bill_to_address": bill_to_address,
+                "ship_to_company": ship_to_company,
+                "ship_to_address": ship_to_address,
+                "end_company": end_company,
+                "end_address":end_address,
+                "end_person": end_person,
+                "end_mobile": end_mobile,
+                "end_email": end_email,
+                "products": st.session_state.products,
+                "grand_total": grand_total,
+                "amount_words": amount_words,
+                "payment_terms": payment_terms,
+                "delivery_terms": delivery_terms,
+                "prepared_by": prepared_by,
+                "authorized_by": authorized_by,
+                "company_name": st.session_state.company_name
+            }
+
+            show_html_preview("po", "po", po_data)
+            show_pdf_preview("po", create_po_pdf, po_data, logo_path)
+
             # FIXED: Added unique key to the generate PO button
             if st.button("Generate PO", type="primary", key="po_generate_button"):
-                po_data = {
-                    "po_number": st.session_state.po_number,
-                    "po_date": st.session_state.po_date,
-                    "vendor_name": vendor_name,
-                    "vendor_address": vendor_address,
-                    "vendor_contact": vendor_contact,
-                    "vendor_mobile": vendor_mobile,
-                    "gst_no": gst_no,
-                    "pan_no": pan_no,
-                    "msme_no": msme_no,
-                    "bill_to_company": bill_to_company,
-                    "bill_to_address": bill_to_address,
-                    "ship_to_company": ship_to_company,
-                    "ship_to_address": ship_to_address,
-                    "end_company": end_company,
-                    "end_address":end_address,
-                    "end_person": end_person,
-                    "end_mobile": end_mobile,
-                    "end_email": end_email,
-                    "products": st.session_state.products,
-                    "grand_total": grand_total,
-                    "amount_words": amount_words,
-                    "payment_terms": payment_terms,
-                    "delivery_terms": delivery_terms,
-                    "prepared_by": prepared_by,
-                    "authorized_by": authorized_by,
-                    "company_name": st.session_state.company_name
-                }
-
-                pdf_bytes = create_po_pdf(po_data, logo_path)
+                start_generation("po_job", "po", po_data, logo_path)
 
+            job = finished_generation("po_job")
+            if job and job.error:
+                st.error(f"Error generating PO: {job.error}")
+            elif job:
+                store_generated("po_job", job)
                 # Store the last PO number for sequence tracking
-                st.session_state.last_po_number = st.session_state.po_number
+                st.session_state.last_po_number = job.number
                 
                 # Auto-increment for next PO
                 if po_auto_increment:
                     try:
-                        next_sequence = get_next_sequence_number_po(st.session_state.po_number)
+                        next_sequence = get_next_sequence_number_po(job.number)
                         # Update the sequence in session state for next time
                         st.session_state.po_seq = next_sequence
                     except:
@@ -2170,8 +2200,8 @@ def main():
                 
                 st.download_button(
                     "⬇ Download Purchase Order",
-                    data=pdf_bytes,
-                    file_name=f"PO_{st.session_state.po_number.replace('/', '_')}.pdf",
+                    data=job.result,
+                    file_name=f"PO_{job.number.replace('/', '_')}.pdf",
                     mime="application/pdf"
                 )
 
@@ -2297,17 +2327,19 @@ def main():
             # Vendor Dropdown for Quotation
             selected_vendor_quote = st.selectbox(
                 "Select Company", 
-                options=get_vendor_dropdown_options(),
+                options=get_vendor_dropdown_options(vendors),
                 key="vendor_dropdown_quote"
             )
             
             # Update vendor fields when dropdown selection changes for quotation
             if selected_vendor_quote and selected_vendor_quote != "Select Vendor":
-                vendor_data = VENDOR_DATABASE.get(selected_vendor_quote, {})
+                vendor_data = vendors.get(selected_vendor_quote, {})
                 st.session_state.quote_vendor_name = selected_vendor_quote
-                st.session_state.quote_vendor_address = vendor_data.get("address", "")
-                st.session_state.quote_vendor_contact = vendor_data.get("contact", "")
-                st.session_state.quote_vendor_mobile = vendor_data.get("mobile", "")
+                st.session_state.quote_vendor_address = vendor_data.get("address") or ""
+                st.session_state.quote_vendor_contact = vendor_data.get("contact") or ""
+                st.session_state.quote_vendor_mobile = vendor_data.get("mobile") or ""
+                if vendor_data.get("email"):
+                    st.session_state.quote_vendor_email = vendor_data["email"]
             
             vendor_name = st.text_input("Company Name", 
                                       value=st.session_state.get("quote_vendor_name", "Creation Studio"), 
@@ -2458,58 +2490,114 @@ def main():
                 st.warning(f"Could not process stamp: {e}")
                 stamp_path = None
         
+        quotation_data = {
+            "quotation_number": st.session_state.quotation_number,
+            "quotation_date": today.strftime("%d-%m-%Y"),
+            "vendor_name": vendor_name,
+            "vendor_address": vendor_address,
+            "vendor_email": vendor_email,
+            "vendor_contact": vendor_contact,
+            "vendor_mobile": vendor_mobile,
+            "products": st.session_state.quotation_products,
+            "price_validity": price_validity,
+            "grand_total": grand_total,
+            "subject": subject_line,
+            "intro_paragraph": intro_paragraphs_1,
+            "product_name": selected_product if selected_product else "Software",   
+            "sales_person_code": sales_person,  
+            "annexure_text": annexure_text,  
+            "quotation_title": quotation_title
+        }
+
+        if st.session_state.quotation_products:
+            show_html_preview("quotation", "quotation", quotation_data)
+            show_pdf_preview("quotation", create_quotation_pdf, quotation_data, logo_path, stamp_path)
+
+        email_quote = st.checkbox(f"📧 Email the quotation to {vendor_email or 'the company email'} (cc {current_sales_person_info['email']})",
+                                  value=False, key="quote_email")
         if st.button("Generate Quotation PDF", type="primary", use_container_width=True, key="generate_quote"):
             if not st.session_state.quotation_products:
                 st.error("Please add at least one product to generate the quotation.")
             else:
-                quotation_data = {
-                    "quotation_number": st.session_state.quotation_number,
-                    "quotation_date": today.strftime("%d-%m-%Y"),
-                    "vendor_name": vendor_name,
-                    "vendor_address": vendor_address,
-                    "vendor_email": vendor_email,
-                    "vendor_contact": vendor_contact,
-                    "vendor_mobile": vendor_mobile,
-                    "products": st.session_state.quotation_products,
-                    "price_validity": price_validity,
-                    "grand_total": grand_total,
-                    "subject": subject_line,
-                    "intro_paragraph": intro_paragraphs_1,
-                    "product_name": selected_product if selected_product else "Software",   
-                    "sales_person_code": sales_person,  
-                    "annexure_text": annexure_text,  
-                    "quotation_title": quotation_title
-                }
-                
+                start_generation("quote_job", "quotation", quotation_data, logo_path, stamp_path)
+
+        job = finished_generation("quote_job")
+        if job and job.error:
+            st.error(f"Error generating PDF: {job.error}")
+        elif job:
+            document_id = store_generated("quote_job", job)
+            # Store the last quotation number for sequence tracking
+            st.session_state.last_quotation_number = job.number
+            
+            # Auto-increment for next quotation
+            if quotation_auto_increment:
                 try:
-                    pdf_bytes = create_quotation_pdf(quotation_data, logo_path, stamp_path)
-                    
-                    # Store the last quotation number for sequence tracking
-                    st.session_state.last_quotation_number = st.session_state.quotation_number
-                    
-                    # Auto-increment for next quotation
-                    if quotation_auto_increment:
-                        try:
-                            next_sequence = get_next_sequence_number(st.session_state.quotation_number)
-                            # Update the sequence in session state for next time
-                            st.session_state.quotation_seq = next_sequence
-                        except:
-                            st.session_state.quotation_seq += 1
-                    
-                    st.success("✅ Quotation generated successfully!")
-                    st.info(f"📧 Sales Person: {current_sales_person_info['name']}")
-                    
-                    # Download button
-                    st.download_button(
-                        "⬇ Download Quotation PDF",
-                        data=pdf_bytes,
-                        file_name=f"Quotation_{st.session_state.quotation_number.replace('/', '_')}.pdf",
-                        mime="application/pdf",
-                        use_container_width=True
-                    )
-                    
-                except Exception as e:
-                    st.error(f"Error generating PDF: {str(e)}")
+                    next_sequence = get_next_sequence_number(job.number)
+                    # Update the sequence in session state for next time
+                    st.session_state.quotation_seq = next_sequence
+                except:
+                    st.session_state.quotation_seq += 1
+            
+            st.success("✅ Quotation generated successfully!")
+            st.info(f"📧 Sales Person: {current_sales_person_info['name']}")
+            if email_quote and document_id:
+                if queue_emails([document_id], sales_person)[0]:
+                    st.info(f"📧 Email to {vendor_email} queued")
+                else:
+                    st.warning("No valid email address to send the quotation to")
+            
+            # Download button
+            st.download_button(
+                "⬇ Download Quotation PDF",
+                data=job.result,
+                file_name=f"Quotation_{job.number.replace('/', '_')}.pdf",
+                mime="application/pdf",
+                use_container_width=True
+            )
+
+        # --- Mail Merge ---
+        st.header("📬 Mail Merge from EndUsers Sheet")
+        if "merge_batch" in st.session_state:
+            show_mail_merge(st.session_state.merge_batch, sales_person)
+        elif master is None:
+            st.info("Upload the Vendor & End User Excel to send this quotation to many end users at once.")
+        elif not master.end_users.keys():
+            st.info("The EndUsers sheet of the Excel has no rows to merge.")
+        elif not st.session_state.quotation_products:
+            st.info("Add products above; every merged quotation uses this form as its template.")
+        else:
+            companies = master.end_users.keys()
+            merge_all = st.checkbox(f"All end users ({len(companies)})", value=True, key="merge_all")
+            chosen = companies if merge_all else st.multiselect("End Users", companies, key="merge_selection")
+            # Every EndUsers row of a chosen company (Table lookups return only its first row)
+            chosen = set(chosen)
+            rows = [row for row in master.end_users.rows() if row.get(master.end_users.key) in chosen]
+            try:
+                numbers = allocate_quotation_numbers(st.session_state.quotation_number, len(rows) + 1)
+            except ValueError as e:
+                st.error(str(e))
+                rows, numbers = [], []
+            if rows:
+                st.caption(f"{len(rows)} quotations, numbered {numbers[0]} to {numbers[-2]}. "
+                           "Use {company}, {contact} or {address} in the subject or introduction to personalize them.")
+            if st.button(f"Generate {len(rows)} Quotations", disabled=not rows, use_container_width=True, key="merge_generate"):
+                try:
+                    batch_id = queue_mail_merge(quotation_data, rows, numbers, (logo_path, stamp_path),
+                                                name=f"Mail merge {numbers[0]}")
+                except (DocumentError, ValueError) as e:
+                    st.error(str(e))
+                else:
+                    start_batch(batch_id)
+                    st.session_state.merge_batch = batch_id
+                    st.session_state.last_quotation_number = numbers[-2]
+                    st.session_state.quotation_seq = get_next_sequence_number(numbers[-2])
+                    st.session_state.quotation_number = numbers[-1]
+                    st.session_state.quote_seq_next = st.session_state.quotation_seq
+                    st.rerun()
+
+    # --- Tab 4: Dashboard ---
+    with tab4:
+        show_dashboard_tab()
 
     # Clean up temporary files
     for path in ["temp_logo.jpg", "temp_stamp.jpg", "temp_logo_quote.jpg", "temp_stamp_quote.jpg"]:
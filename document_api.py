@@ -0,0 +1,296 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from document_codec import decode, encode_payload, peek
+from document_export import batch_entries, iter_zip, store_entries
+from document_models import DocumentError
+from document_store import DocumentStore, pdf_filename
+from document_worker import BUILDERS, DEFAULT_IMAGES, make_pool, render_blob
+
+# --- Document Generation HTTP API ---
+# A small asyncio HTTP/1.1 service so other systems (the ERP) can request
+# documents without the Streamlit form:
+#
+#   POST /v1/invoice | /v1/po | /v1/quotation   JSON payload -> application/pdf
+#   GET  /v1/export.zip?kind=&since=&until=    stored PDFs as a streamed ZIP
+#        /v1/export.zip?batch=ID                 (or one batch's PDFs)
+#   GET  /metrics                               counters and latency percentiles
+#   GET  /healthz
+#
+# Every rendered document is stored (with its PDF) in the document store, so
+# API documents reach the dashboard rollups, reports, reconciliation and the
+# export like the ones made in the app.
+#
+# Rendering runs on a worker pool. At most `workers` renders run at once and
+# at most `queue` more may wait; anything beyond that is refused with 503 and
+# Retry-After instead of piling up. Run with: python document_api.py
+
+MAX_BODY = 2 * 1024 * 1024
+MAX_HEADER_LINES = 100
+LATENCY_WINDOW = 1000
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def render_and_store(kind, blob, images, options, store_path=None):
+    """Worker entry point: render the document, then store it and its PDF"""
+    pdf_bytes, seconds = render_blob(kind, blob, images, options)
+    DocumentStore(store_path).put(decode(blob), pdf_bytes)
+    return pdf_bytes, seconds
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class Metrics:
+    """Request counters and a sliding window of latencies per endpoint"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.counts = {}
+        self.latency = {}
+        self.render = {kind: deque(maxlen=LATENCY_WINDOW) for kind in BUILDERS}
+        self.rejected = 0
+
+    def observe(self, endpoint, status, seconds):
+        key = f"{endpoint} {status}"
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.latency.setdefault(endpoint, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    @staticmethod
+    def summary(samples):
+        if not samples:
+            return {"count": 0}
+        ordered = sorted(samples)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+        return {"count": len(ordered), "p50_ms": pick(0.50), "p90_ms": pick(0.90),
+                "p99_ms": pick(0.99), "max_ms": round(ordered[-1] * 1000, 2)}
+
+    def snapshot(self, service):
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "in_flight": service.in_flight,
+            "waiting": service.waiting,
+            "rejected": self.rejected,
+            "requests": self.counts,
+            "latency": {endpoint: self.summary(s) for endpoint, s in self.latency.items()},
+            "render": {kind: self.summary(s) for kind, s in self.render.items()},
+        }
+
+
+class DocumentService:
+    """Admission control in front of a render pool"""
+
+    def __init__(self, workers=2, queue=8, mode="thread", store_path=None):
+        self.executor = make_pool(workers, mode)
+        self.store_path = store_path
+        self.slots = asyncio.Semaphore(workers)
+        self.max_waiting = queue
+        self.in_flight = 0
+        self.waiting = 0
+        self.metrics = Metrics()
+
+    async def render(self, kind, payload, deterministic=True):
+        try:
+            blob = encode_payload(kind, payload)
+        except DocumentError as e:
+            raise HttpError(400, str(e))
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            raise HttpError(400, f"Missing or malformed field: {e}")
+
+        if self.slots.locked():
+            if self.waiting >= self.max_waiting:
+                self.metrics.rejected += 1
+                raise HttpError(503, "Render queue is full", {"Retry-After": "1"})
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            pdf_bytes, seconds = await loop.run_in_executor(
+                self.executor, render_and_store, kind, blob, DEFAULT_IMAGES[kind], {"deterministic": deterministic},
+                self.store_path)
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+        self.metrics.render[kind].append(seconds)
+        return peek(blob)[1], pdf_bytes
+
+    def export(self, query):
+        arg = lambda name: query.get(name, [None])[0]
+        if arg("batch"):
+            try:
+                entries = batch_entries(int(arg("batch")))
+            except ValueError:
+                raise HttpError(400, "batch must be a batch id")
+            filename = f"batch_{int(arg('batch'))}.zip"
+        else:
+            if arg("kind") and arg("kind") not in BUILDERS:
+                raise HttpError(400, f"Unknown document kind '{arg('kind')}'")
+            entries = store_entries(DocumentStore(self.store_path), kind=arg("kind"),
+                                    since=arg("since"), until=arg("until"))
+            filename = f"{arg('kind') or 'documents'}.zip"
+        return 200, "application/zip", iter_zip(entries), {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+    async def handle(self, method, target, body):
+        url = urlsplit(target)
+        path = url.path.rstrip("/") or "/"
+        if path == "/healthz":
+            return 200, "application/json", b'{"status":"ok"}', {}
+        if path == "/metrics":
+            if method != "GET":
+                raise HttpError(405, "Use GET")
+            return 200, "application/json", json.dumps(self.metrics.snapshot(self)).encode("utf-8"), {}
+        if path == "/v1/export.zip":
+            if method != "GET":
+                raise HttpError(405, "Use GET")
+            return self.export(parse_qs(url.query))
+        parts = path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "v1" or parts[1] not in BUILDERS:
+            raise HttpError(404, f"No route for {path}")
+        if method != "POST":
+            raise HttpError(405, "Use POST with a JSON payload")
+        try:
+            payload = json.loads(body)
+        except ValueError as e:
+            raise HttpError(400, f"Body is not valid JSON: {e}")
+        if not isinstance(payload, dict):
+            raise HttpError(400, "Body must be a JSON object")
+        query = parse_qs(url.query)
+        deterministic = query.get("deterministic", ["1"])[0] not in ("0", "false")
+        number, pdf_bytes = await self.render(parts[1], payload, deterministic)
+        filename = pdf_filename(parts[1], number)
+        return 200, "application/pdf", pdf_bytes, {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+
+async def _read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, version = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", "0") or 0)
+        if length < 0:
+            raise ValueError(length)
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length")
+    if length > MAX_BODY:
+        raise HttpError(413, f"Body larger than {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b""
+    keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+    return method.upper(), target, body, keep_alive
+
+
+def _response(status, content_type, body, headers, keep_alive):
+    """Status line and headers, plus the body unless it is streamed (body=None)"""
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+             f"Content-Type: {content_type}",
+             "Transfer-Encoding: chunked" if body is None else f"Content-Length: {len(body)}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b"")
+
+
+async def _stream(writer, chunks):
+    """Send a generator of bytes as a chunked body.
+
+    The generator reads SQLite on its own thread (connections are
+    per-thread), one chunk at a time, and waits for the client to drain.
+    """
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        try:
+            while True:
+                chunk = await loop.run_in_executor(reader, next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    await writer.drain()
+        finally:
+            await loop.run_in_executor(reader, chunks.close)
+    writer.write(b"0\r\n\r\n")
+
+
+def make_handler(service):
+    async def handle_connection(reader, writer):
+        try:
+            while True:
+                started = time.perf_counter()
+                endpoint, keep_alive = "?", False
+                try:
+                    request = await _read_request(reader)
+                    if request is None:
+                        break
+                    method, target, body, keep_alive = request
+                    endpoint = f"{method} {urlsplit(target).path}"
+                    status, content_type, payload, headers = await service.handle(method, target, body)
+                except HttpError as e:
+                    status, content_type, headers = e.status, "application/json", e.headers
+                    payload = json.dumps({"error": str(e)}).encode("utf-8")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    status, content_type, headers = 500, "application/json", {}
+                    payload = json.dumps({"error": f"{type(e).__name__}: {e}"}).encode("utf-8")
+                if isinstance(payload, bytes):
+                    writer.write(_response(status, content_type, payload, headers, keep_alive))
+                else:
+                    writer.write(_response(status, content_type, None, headers, keep_alive))
+                    await _stream(writer, payload)
+                await writer.drain()
+                service.metrics.observe(endpoint, status, time.perf_counter() - started)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+    return handle_connection
+
+
+async def serve(host="127.0.0.1", port=8502, workers=2, queue=8, mode="thread", store_path=None):
+    service = DocumentService(workers=workers, queue=queue, mode=mode, store_path=store_path)
+    server = await asyncio.start_server(make_handler(service), host, port)
+    print(f"Document API on http://{host}:{port} ({workers} {mode} workers, queue {queue})")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API for invoice, PO and quotation PDFs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--workers", type=int, default=2, help="concurrent renders")
+    parser.add_argument("--queue", type=int, default=8, help="requests allowed to wait for a worker")
+    parser.add_argument("--mode", choices=("thread", "process"), default="thread")
+    parser.add_argument("--db", help="document store path")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.queue, args.mode, args.db))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
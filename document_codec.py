@@ -0,0 +1,184 @@
+import struct
+import zlib
+
+from document_models import Invoice, LineItem, Party, Product, PurchaseOrder, Quotation
+
+# --- Compact Binary Document Encoding ---
+# Documents are encoded against their model schema, so field names never go
+# on the wire: a record is its fields in schema order. Text is a varint
+# length plus UTF-8; numbers are fixed-point zigzag varints (money in paise,
+# quantities in thousandths). A blob starts with a magic, the document kind
+# and a CRC of the schema, so a blob written under a different field layout
+# is rejected instead of misread. Text fields a model lists in ADDED came
+# after the first stored layout: blobs written before them (matching the
+# legacy CRC) still decode, with those fields blank. Decoding reads straight
+# from a memoryview and builds the slotted models without re-validating them.
+
+MAGIC = b"DOC"
+FORMAT_VERSION = 1
+
+# Fixed-point scale per numeric field (default: money, 2 decimals)
+SCALES = {"quantity": 1000, "qty": 1000, "gst_percent": 1000}
+MONEY_SCALE = 100
+
+KINDS = {1: Invoice, 2: PurchaseOrder, 3: Quotation}
+KIND_CODES = {cls: code for code, cls in KINDS.items()}
+
+# Nested fields per model: (attribute, model, is_sequence)
+NESTED = {
+    Invoice: (("vendor", Party, False), ("buyer", Party, False), ("items", LineItem, True)),
+    PurchaseOrder: (("products", Product, True),),
+    Quotation: (("products", Product, True),),
+}
+
+_HEADER = struct.Struct("<3sBBI")
+
+
+class CodecError(ValueError):
+    """Raised for blobs that are truncated, corrupt or from another schema"""
+
+
+def _schema_crc(cls, legacy=False):
+    text = [name for name in cls.TEXT if not (legacy and name in cls.ADDED)]
+    parts = [cls.__name__, *text, *(f"{n}*{SCALES.get(n, MONEY_SCALE)}" for n in cls.NUMBERS)]
+    crc = zlib.crc32("|".join(parts).encode("ascii"))
+    for name, model, many in NESTED.get(cls, ()):
+        crc = zlib.crc32(f"{name}:{int(many)}:{_schema_crc(model, legacy)}".encode("ascii"), crc)
+    return crc
+
+
+SCHEMA_CRCS = {code: _schema_crc(cls) for code, cls in KINDS.items()}
+LEGACY_CRCS = {code: _schema_crc(cls, True) for code, cls in KINDS.items()}  # layouts without ADDED fields
+
+
+# --- Encoding ---
+
+def _varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _fixed(out, value, scale):
+    number = int(round(value * scale))
+    _varint(out, (number << 1) ^ (number >> 63))  # zigzag
+
+
+def _text(out, value):
+    data = value.encode("utf-8")
+    _varint(out, len(data))
+    out += data
+
+
+def _encode_record(out, record):
+    cls = type(record)
+    for name in cls.TEXT:
+        _text(out, getattr(record, name))
+    for name in cls.NUMBERS:
+        _fixed(out, getattr(record, name), SCALES.get(name, MONEY_SCALE))
+    for name, model, many in NESTED.get(cls, ()):
+        value = getattr(record, name)
+        if many:
+            _varint(out, len(value))
+            for item in value:
+                _encode_record(out, item)
+        else:
+            _encode_record(out, value)
+
+
+def encode(document):
+    """Binary encoding of an Invoice, PurchaseOrder or Quotation"""
+    code = KIND_CODES.get(type(document))
+    if code is None:
+        raise CodecError(f"Cannot encode {type(document).__name__}")
+    out = bytearray(_HEADER.pack(MAGIC, FORMAT_VERSION, code, SCHEMA_CRCS[code]))
+    _encode_record(out, document)
+    return bytes(out)
+
+
+def encode_payload(kind, payload):
+    """encode() for a payload dict; kind is "invoice", "po" or "quotation" """
+    model = {"invoice": Invoice, "po": PurchaseOrder, "quotation": Quotation}[kind]
+    return encode(model.from_dict(payload))
+
+
+# --- Decoding ---
+
+class _Reader:
+    """Cursor over a memoryview; text is decoded without copying the slice"""
+    __slots__ = ("view", "pos")
+
+    def __init__(self, view, pos):
+        self.view = view
+        self.pos = pos
+
+    def varint(self):
+        view, pos = self.view, self.pos
+        result = shift = 0
+        try:
+            while True:
+                byte = view[pos]
+                pos += 1
+                result |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+        except IndexError:
+            raise CodecError("Truncated document blob")
+        self.pos = pos
+        return result
+
+    def fixed(self, scale):
+        raw = self.varint()
+        return ((raw >> 1) ^ -(raw & 1)) / scale
+
+    def text(self):
+        size = self.varint()
+        end = self.pos + size
+        if end > len(self.view):
+            raise CodecError("Truncated document blob")
+        value = str(self.view[self.pos:end], "utf-8")
+        self.pos = end
+        return value
+
+
+def _decode_record(reader, cls, legacy=False):
+    # Built without __init__: the blob was encoded from a validated model
+    record = cls.__new__(cls)
+    for name in cls.TEXT:
+        setattr(record, name, "" if legacy and name in cls.ADDED else reader.text())
+    for name in cls.NUMBERS:
+        setattr(record, name, reader.fixed(SCALES.get(name, MONEY_SCALE)))
+    for name, model, many in NESTED.get(cls, ()):
+        if many:
+            setattr(record, name, tuple(_decode_record(reader, model, legacy) for _ in range(reader.varint())))
+        else:
+            setattr(record, name, _decode_record(reader, model, legacy))
+    return record
+
+
+def _open(blob):
+    view = memoryview(blob)
+    if len(view) < _HEADER.size:
+        raise CodecError("Truncated document blob")
+    magic, version, code, crc = _HEADER.unpack_from(view)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise CodecError("Not a document blob (bad magic or version)")
+    if code not in KINDS:
+        raise CodecError(f"Unknown document kind {code}")
+    if crc != SCHEMA_CRCS[code] and crc != LEGACY_CRCS[code]:
+        raise CodecError(f"{KINDS[code].__name__} blob was written with a different schema")
+    return KINDS[code], _Reader(view, _HEADER.size), crc != SCHEMA_CRCS[code]
+
+
+def decode(blob):
+    """Model instance from bytes, bytearray, memoryview or mmap"""
+    cls, reader, legacy = _open(blob)
+    return _decode_record(reader, cls, legacy)
+
+
+def peek(blob):
+    """(model class, document number) read from the blob head only"""
+    cls, reader, _ = _open(blob)
+    return cls, reader.text()
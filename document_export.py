@@ -0,0 +1,170 @@
+import argparse
+import os
+import time
+import zipfile
+from collections import deque
+
+from document_codec import encode_payload, peek
+from document_store import DocumentStore, pdf_filename
+from document_worker import MAX_WORKERS, WORKER_MODE, make_pool, render_blob
+from job_queue import JobQueue
+
+# --- Streaming ZIP Export ---
+# Archives of thousands of PDFs are written as a stream. Entries are pulled
+# one at a time, either from the document store (read in chunks straight out
+# of the SQLite blob) or from renders still coming out of the worker pool,
+# and the archive bytes are handed on as soon as they are written. Memory
+# stays flat whatever the batch size; only the ZIP central directory (one
+# small record per file) grows with it.
+#
+#   python document_export.py renewals.zip --batch 3
+#   python document_export.py q3.zip --kind quotation --since 2026-10-01 --until 2026-12-31
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object that collects output until drained"""
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.size = 0
+        return data
+
+
+def _unique(name, seen):
+    if name not in seen:
+        seen.add(name)
+        return name
+    stem, ext = os.path.splitext(name)
+    n = 2
+    while f"{stem}_{n}{ext}" in seen:
+        n += 1
+    seen.add(f"{stem}_{n}{ext}")
+    return f"{stem}_{n}{ext}"
+
+
+def iter_zip(entries, compression=zipfile.ZIP_STORED, chunk_size=CHUNK_SIZE):
+    """Yield the bytes of a ZIP archive of entries, chunk by chunk.
+
+    entries yields (name, data) where data is bytes or (size, readable).
+    PDFs are already compressed, so entries are stored by default.
+    """
+    sink = _ChunkSink()
+    seen = set()
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(sink, "w", compression=compression) as archive:
+        for name, data in entries:
+            info = zipfile.ZipInfo(_unique(name, seen), date_time)
+            info.compress_type = compression
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                size, source = len(data), None
+            else:
+                size, source = data
+            info.file_size = size
+            with archive.open(info, "w", force_zip64=size > 0x7FFFFFFF) as dest:
+                if source is None:
+                    dest.write(data)
+                else:
+                    with source:
+                        for chunk in iter(lambda: source.read(chunk_size), b""):
+                            dest.write(chunk)
+                            if sink.size >= chunk_size:
+                                yield sink.drain()
+            if sink.size >= chunk_size:
+                yield sink.drain()
+    if sink.size:
+        yield sink.drain()
+
+
+def write_zip(path, entries, **options):
+    """Stream entries into a ZIP file at path; returns the archive size"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in iter_zip(entries, **options):
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return size
+
+
+# --- Entry sources ---
+
+def store_entries(store=None, kind=None, since=None, until=None, document_ids=None):
+    """Stored PDFs by filter (or an explicit id list), read lazily from the store"""
+    store = store or DocumentStore()
+    for doc_id in document_ids if document_ids is not None else store.document_ids(kind, since, until):
+        opened = store.open_pdf(doc_id)
+        if opened is not None:
+            name, size, blob = opened
+            yield name, (size, blob)
+
+
+def batch_entries(batch_id, path=None):
+    """PDFs of a batch's finished items, in batch order"""
+    queue = JobQueue(path)
+    rows = queue.conn.execute(
+        "SELECT document_id FROM batch_items WHERE batch_id = ? AND document_id IS NOT NULL ORDER BY seq",
+        (batch_id,))
+    yield from store_entries(queue.store, document_ids=(doc_id for (doc_id,) in rows))
+
+
+def render_entries(kind, payloads, images=(), workers=MAX_WORKERS, mode=WORKER_MODE, **options):
+    """Render payloads on a pool and yield each PDF as it is needed.
+
+    At most 2 * workers renders are ahead of the consumer, so a slow
+    download holds back rendering instead of buffering PDFs.
+    """
+    window = deque()
+    payloads = iter(payloads)
+    with make_pool(workers, mode) as executor:
+        while True:
+            while len(window) < workers * 2:
+                payload = next(payloads, None)
+                if payload is None:
+                    break
+                blob = encode_payload(kind, payload)
+                window.append((peek(blob)[1], executor.submit(render_blob, kind, blob, images, options)))
+            if not window:
+                return
+            number, future = window.popleft()
+            yield pdf_filename(kind, number), future.result()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export stored PDFs as a ZIP archive")
+    parser.add_argument("output", help="path of the .zip to write")
+    parser.add_argument("--batch", type=int, help="export a batch from job_queue.py")
+    parser.add_argument("--kind", choices=("invoice", "po", "quotation"))
+    parser.add_argument("--since", help="first document date, YYYY-MM-DD")
+    parser.add_argument("--until", help="last document date, YYYY-MM-DD")
+    args = parser.parse_args()
+    if args.batch is not None:
+        entries = batch_entries(args.batch)
+    else:
+        entries = store_entries(kind=args.kind, since=args.since, until=args.until)
+    started = time.perf_counter()
+    size = write_zip(args.output, entries)
+    print(f"Wrote {args.output} ({size / 1e6:.1f} MB) in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
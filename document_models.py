@@ -0,0 +1,224 @@
+import math
+
+from unicode_fonts import sanitize_text
+
+# --- Document Models ---
+# Typed, slotted records for invoices, purchase orders and quotations.
+# Text fields are sanitized for the document font and numbers validated once,
+# when the model is built; the PDF builders then read plain attributes.
+# from_dict()/to_dict() convert to and from the payload dicts the app
+# assembles, which stay the wire format for previews and storage.
+
+
+class DocumentError(ValueError):
+    """Raised when a document payload has a missing or invalid field"""
+
+
+def _number(value, field):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise DocumentError(f"{field} must be a number, got {value!r}")
+    if not math.isfinite(number) or number < 0:
+        raise DocumentError(f"{field} must be a non-negative number, got {value!r}")
+    return number
+
+
+class _Model:
+    """Base for the slotted models: TEXT fields are sanitized, NUMBERS are floats"""
+    __slots__ = ()
+    TEXT = ()
+    NUMBERS = ()
+    DEFAULTS = {}
+    REQUIRED = ()  # TEXT fields that may not be blank (document numbers and dates)
+    ADDED = ()  # TEXT fields newer than the first stored layout (see document_codec)
+
+    def __init__(self, **fields):
+        unknown = set(fields) - set(self.TEXT) - set(self.NUMBERS)
+        if unknown:
+            raise DocumentError(f"{type(self).__name__}: unknown field(s) {', '.join(sorted(unknown))}")
+        defaults = self.DEFAULTS
+        for name in self.TEXT:
+            setattr(self, name, sanitize_text(fields.get(name, defaults.get(name, ""))))
+        for name in self.REQUIRED:
+            if not getattr(self, name).strip():
+                raise DocumentError(f"{type(self).__name__}.{name} is required")
+        for name in self.NUMBERS:
+            if name not in fields and name not in defaults:
+                raise DocumentError(f"{type(self).__name__}.{name} is required")
+            setattr(self, name, _number(fields.get(name, defaults.get(name)), f"{type(self).__name__}.{name}"))
+
+    def __getitem__(self, key):
+        # Lets layout templates format fields by name ("{vendor_name}")
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    @classmethod
+    def _known(cls, data):
+        if not isinstance(data, dict):
+            raise DocumentError(f"{cls.__name__} must be an object, got {type(data).__name__}")
+        return {key: value for key, value in data.items() if key in cls.TEXT or key in cls.NUMBERS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**cls._known(data))
+
+    @classmethod
+    def coerce(cls, value):
+        """value itself if it is already a cls, else cls.from_dict(value)"""
+        return value if isinstance(value, cls) else cls.from_dict(value)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.TEXT + self.NUMBERS}
+
+
+class Party(_Model):
+    """Seller or buyer block of an invoice"""
+    TEXT = ("name", "address", "gst", "msme", "email")
+    __slots__ = TEXT
+    ADDED = ("email",)
+
+
+class LineItem(_Model):
+    """One invoice line"""
+    TEXT = ("description", "hsn")
+    NUMBERS = ("quantity", "unit_rate")
+    __slots__ = TEXT + NUMBERS
+
+    @property
+    def amount(self):
+        return self.quantity * self.unit_rate
+
+
+class Product(_Model):
+    """One PO or quotation line: basic price, GST percent and quantity"""
+    TEXT = ("name",)
+    NUMBERS = ("basic", "gst_percent", "qty")
+    __slots__ = TEXT + NUMBERS
+    DEFAULTS = {"gst_percent": 18.0}
+
+    @property
+    def gst_amount(self):
+        return self.basic * self.gst_percent / 100
+
+    @property
+    def unit_price(self):
+        return self.basic + self.gst_amount
+
+    @property
+    def total(self):
+        return self.unit_price * self.qty
+
+
+def _products(values, model):
+    if not isinstance(values, (list, tuple)):
+        raise DocumentError(f"{model.__name__} lines must be a list, got {type(values).__name__}")
+    return tuple(model.coerce(value) for value in values)
+
+
+class Invoice(_Model):
+    """Tax invoice; the nested payload sections are flattened into fields"""
+    TEXT = ("invoice_no", "date", "suppliers_reference", "other_reference",
+            "buyers_order_no", "buyers_order_date", "dispatched_through", "terms_of_delivery", "destination",
+            "amount_in_words", "tax_in_words", "declaration")
+    NUMBERS = ("basic_amount", "sgst", "cgst", "final_amount")
+    __slots__ = TEXT + NUMBERS + ("vendor", "buyer", "items")
+    REQUIRED = ("invoice_no", "date")
+
+    def __init__(self, vendor, buyer, items, **fields):
+        super().__init__(**fields)
+        self.vendor = Party.coerce(vendor)
+        self.buyer = Party.coerce(buyer)
+        self.items = _products(items, LineItem)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            invoice_no=data["invoice"]["invoice_no"],
+            date=data["invoice"]["date"],
+            suppliers_reference=data["Reference"]["Suppliers_Reference"],
+            other_reference=data["Reference"]["Other"],
+            vendor=data["vendor"],
+            buyer=data["buyer"],
+            items=data["items"],
+            declaration=data["declaration"],
+            **cls._known(data["invoice_details"]),
+            **cls._known(data["totals"]),
+        )
+
+    def to_dict(self):
+        return {
+            "invoice": {"invoice_no": self.invoice_no, "date": self.date},
+            "Reference": {"Suppliers_Reference": self.suppliers_reference, "Other": self.other_reference},
+            "vendor": self.vendor.to_dict(),
+            "buyer": self.buyer.to_dict(),
+            "invoice_details": {key: getattr(self, key) for key in (
+                "buyers_order_no", "buyers_order_date", "dispatched_through", "terms_of_delivery", "destination")},
+            "items": [item.to_dict() for item in self.items],
+            "totals": {key: getattr(self, key) for key in (
+                "basic_amount", "sgst", "cgst", "final_amount", "amount_in_words", "tax_in_words")},
+            "declaration": self.declaration,
+        }
+
+    @property
+    def taxable_value(self):
+        return sum(item.amount for item in self.items)
+
+
+class PurchaseOrder(_Model):
+    """Purchase order sent to a vendor"""
+    TEXT = ("po_number", "po_date", "vendor_name", "vendor_address", "vendor_contact", "vendor_mobile",
+            "gst_no", "pan_no", "msme_no", "bill_to_company", "bill_to_address",
+            "ship_to_company", "ship_to_address", "end_company", "end_address", "end_person",
+            "end_mobile", "end_email", "amount_words", "payment_terms", "delivery_terms",
+            "prepared_by", "authorized_by", "company_name", "vendor_email")
+    NUMBERS = ("grand_total",)
+    __slots__ = TEXT + NUMBERS + ("products",)
+    REQUIRED = ("po_number", "po_date")
+    ADDED = ("vendor_email",)
+
+    def __init__(self, products, **fields):
+        super().__init__(**fields)
+        self.products = _products(products, Product)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(products=data["products"], **cls._known(data))
+
+    def to_dict(self):
+        return dict(super().to_dict(), products=[p.to_dict() for p in self.products])
+
+
+class Quotation(_Model):
+    """Two-page quotation: intro letter plus commercials"""
+    TEXT = ("quotation_number", "quotation_date", "vendor_name", "vendor_address", "vendor_email",
+            "vendor_contact", "vendor_mobile", "price_validity", "subject", "intro_paragraph",
+            "product_name", "sales_person_code", "annexure_text", "quotation_title")
+    NUMBERS = ("grand_total",)
+    __slots__ = TEXT + NUMBERS + ("products",)
+    REQUIRED = ("quotation_number", "quotation_date")
+    DEFAULTS = {
+        "sales_person_code": "SD",
+        "annexure_text": "Annexure I - Commercials",
+        "quotation_title": "Quotation for Adobe Software",
+        "grand_total": 0.0,
+    }
+
+    def __init__(self, products, **fields):
+        super().__init__(**fields)
+        self.products = _products(products, Product)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(products=data["products"], **cls._known(data))
+
+    def to_dict(self):
+        return dict(super().to_dict(), products=[p.to_dict() for p in self.products])
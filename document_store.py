@@ -0,0 +1,251 @@
+import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import rollups
+from document_codec import decode, encode
+from pdf_output import DOCUMENT_DATE_FORMATS
+
+# --- Document Store ---
+# Generated documents in one SQLite file: each document row keeps its model
+# as a document_codec blob plus the sha256 of its PDF, and PDFs are stored
+# once per digest. Re-generating a number replaces that document's row.
+# Every thread gets its own connection; the database runs in WAL mode so
+# readers don't block the writer. The dashboard rollups (rollups.py) live in
+# the same file and are updated in the transaction that stores a document.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_PATH = os.environ.get("DOC_STORE_PATH", os.path.join(BASE_DIR, "documents.sqlite3"))
+KIND_NAMES = {"Invoice": "invoice", "PurchaseOrder": "po", "Quotation": "quotation"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdfs (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    number TEXT NOT NULL,
+    doc_date TEXT,
+    payload BLOB NOT NULL,
+    pdf_digest TEXT REFERENCES pdfs(digest),
+    created_at REAL NOT NULL,
+    UNIQUE (kind, number)
+);
+CREATE INDEX IF NOT EXISTS documents_kind_date ON documents (kind, doc_date);
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schemas = set()
+
+
+def connect(path=None):
+    """This thread's connection to the store at path (created on first use)"""
+    path = path or STORE_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        connections[path] = conn
+        ensure_schema(conn, path, SCHEMA)
+        ensure_schema(conn, path, rollups.SCHEMA)
+    return conn
+
+
+def ensure_schema(conn, path, script):
+    """Run a CREATE ... IF NOT EXISTS script once per database file and process"""
+    with _schema_lock:
+        if (path, script) not in _schemas:
+            conn.executescript(script)
+            _schemas.add((path, script))
+
+
+def kind_of(document):
+    """"invoice", "po" or "quotation" for a document model"""
+    return KIND_NAMES[type(document).__name__]
+
+
+def iso_date(text):
+    """Document date as YYYY-MM-DD, or None if it can't be parsed"""
+    for fmt in DOCUMENT_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(str(text).strip(), fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def document_date(document):
+    return iso_date(getattr(document, {"invoice": "date", "po": "po_date",
+                                       "quotation": "quotation_date"}[kind_of(document)]))
+
+
+def document_number(document):
+    return getattr(document, {"invoice": "invoice_no", "po": "po_number",
+                              "quotation": "quotation_number"}[kind_of(document)])
+
+
+def pdf_filename(kind, number):
+    """Download/archive name for a document's PDF"""
+    return f"{kind}_{number.replace('/', '_')}.pdf"
+
+
+class DocumentStore:
+    """Read/write access to stored documents and their PDFs"""
+
+    def __init__(self, path=None):
+        self.path = path or STORE_PATH
+
+    @property
+    def conn(self):
+        return connect(self.path)
+
+    def put(self, document, pdf_bytes=None, conn=None):
+        """Store a document model (and its PDF); returns the document id.
+
+        Pass conn to take part in a caller's transaction.
+        """
+        conn = conn or self.conn
+        own = not conn.in_transaction
+        if own:
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            doc_id = self._put(conn, document, pdf_bytes)
+            if own:
+                conn.execute("COMMIT")
+        except BaseException:
+            if own:
+                conn.execute("ROLLBACK")
+            raise
+        return doc_id
+
+    @staticmethod
+    def _put(conn, document, pdf_bytes):
+        kind, number, doc_date = kind_of(document), document_number(document), document_date(document)
+        digest = None
+        if pdf_bytes is not None:
+            digest = hashlib.sha256(pdf_bytes).hexdigest()
+            conn.execute("INSERT OR IGNORE INTO pdfs (digest, size, data) VALUES (?, ?, ?)",
+                         (digest, len(pdf_bytes), pdf_bytes))
+        old = conn.execute("SELECT doc_date, payload FROM documents WHERE kind = ? AND number = ?",
+                           (kind, number)).fetchone()
+        previous = decode(old[1]) if old is not None else None
+        if previous is not None:
+            rollups.apply(conn, kind, old[0], previous, -1)
+        row = conn.execute(
+            "INSERT INTO documents (kind, number, doc_date, payload, pdf_digest, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (kind, number) DO UPDATE SET doc_date=excluded.doc_date, "
+            "payload=excluded.payload, pdf_digest=excluded.pdf_digest, created_at=excluded.created_at "
+            "RETURNING id",
+            (kind, number, doc_date, encode(document), digest, time.time())).fetchone()
+        rollups.apply(conn, kind, doc_date, document)
+        rollups.index_lines(conn, row[0], kind, doc_date, document)
+        rollups.refresh_prices(conn, rollups.price_keys(kind, previous) | rollups.price_keys(kind, document))
+        rollups.touch(conn)
+        return row[0]
+
+    def get(self, doc_id):
+        """The document model for doc_id, or None"""
+        row = self.conn.execute("SELECT payload FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return decode(row[0]) if row else None
+
+    def find(self, kind, number):
+        """(doc_id, model) for a document number, or None"""
+        row = self.conn.execute("SELECT id, payload FROM documents WHERE kind = ? AND number = ?",
+                                (kind, number)).fetchone()
+        return (row[0], decode(row[1])) if row else None
+
+    def pdf(self, doc_id):
+        """PDF bytes of a document, or None"""
+        row = self.conn.execute(
+            "SELECT p.data FROM documents d JOIN pdfs p ON p.digest = d.pdf_digest WHERE d.id = ?",
+            (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    def open_pdf(self, doc_id):
+        """(file name, size, readable blob) for streaming a PDF without loading it"""
+        row = self.conn.execute(
+            "SELECT d.kind, d.number, p.id, p.size FROM documents d JOIN pdfs p ON p.digest = d.pdf_digest "
+            "WHERE d.id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return None
+        kind, number, pdf_rowid, size = row
+        return pdf_filename(kind, number), size, self.conn.blobopen("pdfs", "data", pdf_rowid, readonly=True)
+
+    @staticmethod
+    def _filters(kind, since, until):
+        sql, args = "", []
+        if kind:
+            sql += " AND kind = ?"
+            args.append(kind)
+        if since:
+            sql += " AND doc_date >= ?"
+            args.append(since)
+        if until:
+            sql += " AND doc_date <= ?"
+            args.append(until)
+        return sql, args
+
+    def document_ids(self, kind=None, since=None, until=None):
+        """Ids of stored documents in id order (a lazy cursor, not a list)"""
+        filters, args = self._filters(kind, since, until)
+        for (doc_id,) in self.conn.execute("SELECT id FROM documents WHERE 1" + filters + " ORDER BY id", args):
+            yield doc_id
+
+    def iter_documents(self, kind=None, since=None, until=None, after_id=0, batch_size=500):
+        """Stream (doc_id, doc_date, model) in id order, batch_size rows per query.
+
+        since/until are inclusive ISO dates.
+        """
+        filters, args = self._filters(kind, since, until)
+        sql = "SELECT id, doc_date, payload FROM documents WHERE id > ?" + filters + " ORDER BY id LIMIT ?"
+        last = after_id
+        while True:
+            rows = self.conn.execute(sql, [last, *args, batch_size]).fetchall()
+            if not rows:
+                return
+            for doc_id, doc_date, payload in rows:
+                yield doc_id, doc_date, decode(payload)
+            last = rows[-1][0]
+
+    def count(self, kind=None):
+        if kind:
+            return self.conn.execute("SELECT COUNT(*) FROM documents WHERE kind = ?", (kind,)).fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def generation(self):
+        """Number that changes whenever a document is stored (see rollups.generation)"""
+        return rollups.generation(self.conn)
+
+    def rollup(self, dimension, kind="invoice"):
+        """Materialized rollup rows for one dimension (see rollups.read)"""
+        self.ensure_rollups()
+        return rollups.read(self.conn, dimension, kind)
+
+    def rollup_totals(self, kind="invoice"):
+        self.ensure_rollups()
+        return rollups.totals(self.conn, kind)
+
+    def lines(self, kinds, since=None, until=None, columns="kind, customer, product, quantity, amount"):
+        """Cursor over the document_lines of kinds (see rollups.iter_lines)"""
+        self.ensure_rollups()
+        return rollups.iter_lines(self.conn, kinds, since, until, columns)
+
+    def ensure_rollups(self):
+        """Backfill the derived tables of a store written before them (or this VERSION of them)"""
+        if not rollups.is_built(self.conn):
+            rollups.rebuild(self.conn, ((doc_id, kind_of(model), doc_date, model)
+                                        for doc_id, doc_date, model in self.iter_documents()))
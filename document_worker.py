@@ -0,0 +1,226 @@
+import importlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from document_codec import decode, encode_payload, peek
+from pdf_optimizer import file_digest
+
+# --- Background Generation Worker ---
+# PDF builds run on a bounded pool instead of the Streamlit script thread.
+# submit() returns a job id at once; status() reports the state, and a
+# progress estimate based on recent build times for that document kind.
+# Payloads travel to workers as compact document blobs, and image files are
+# snapshotted to content-addressed copies so the caller may delete or
+# replace its temp files while the job is still queued. A finished job is
+# kept until its session collects it, or until it is RESULT_TTL seconds old
+# (a session that was closed never will).
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_IMAGES = {
+    "invoice": (os.path.join(BASE_DIR, "logo_final.jpg"), os.path.join(BASE_DIR, "stamp.jpg")),
+    "po": (os.path.join(BASE_DIR, "logo_final.jpg"),),
+    "quotation": (os.path.join(BASE_DIR, "logo_final.jpg"), os.path.join(BASE_DIR, "stamp.jpg")),
+}
+
+BUILDERS = {
+    "invoice": "PO_TAX_QUOT:create_invoice_pdf",
+    "po": "PO_TAX_QUOT:create_po_pdf",
+    "quotation": "PO_TAX_QUOT:create_quotation_pdf",
+}
+
+WORKER_MODE = os.environ.get("DOC_WORKER_MODE", "thread")  # "thread" or "process"
+MAX_WORKERS = int(os.environ.get("DOC_WORKER_THREADS", "2"))
+MAX_PENDING = int(os.environ.get("DOC_WORKER_MAX_PENDING", "16"))
+RESULT_TTL = float(os.environ.get("DOC_WORKER_RESULT_TTL", "3600"))
+SNAPSHOT_DIR = os.path.join(tempfile.gettempdir(), "doc_jobs")
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_builders = {}
+
+
+class WorkerBusy(RuntimeError):
+    """Raised by submit() when the pending-job limit is reached"""
+
+
+def resolve_builder(kind):
+    """Import the builder for kind ("module:function"), once per process"""
+    builder = _builders.get(kind)
+    if builder is None:
+        module_name, func_name = BUILDERS[kind].split(":")
+        builder = getattr(importlib.import_module(module_name), func_name)
+        _builders[kind] = builder
+    return builder
+
+
+def render_blob(kind, blob, images, options):
+    """Worker entry point: decode the document and run its builder"""
+    started = time.perf_counter()
+    pdf_bytes = resolve_builder(kind)(decode(blob), *images, **options)
+    return pdf_bytes, time.perf_counter() - started
+
+
+def make_pool(max_workers, mode=WORKER_MODE):
+    """Thread or process pool for renders, warmed up before the first job"""
+    from warmup import start_warm_up, warm_up
+    if mode == "process":
+        return ProcessPoolExecutor(max_workers=max_workers, initializer=warm_up)
+    start_warm_up()
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+def snapshot_image(path):
+    """Content-addressed copy of path that outlives the caller's temp file"""
+    if not path or not os.path.exists(path):
+        return path
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    target = os.path.join(SNAPSHOT_DIR, file_digest(path)[:32] + os.path.splitext(path)[1].lower())
+    if not os.path.exists(target):
+        tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+    return target
+
+
+class Job:
+    """State of one submitted build"""
+    __slots__ = ("job_id", "kind", "number", "state", "submitted", "started", "finished",
+                 "result", "error", "expected")
+
+    def __init__(self, job_id, kind, number, expected):
+        self.job_id = job_id
+        self.kind = kind
+        self.number = number
+        self.state = QUEUED
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.expected = expected
+
+    @property
+    def progress(self):
+        """0..1; estimated from typical build time while running"""
+        if self.state in (DONE, FAILED):
+            return 1.0
+        if self.state == QUEUED or not self.started:
+            return 0.0
+        return min(0.95, (time.monotonic() - self.started) / max(self.expected, 1e-3))
+
+    @property
+    def elapsed(self):
+        end = self.finished or time.monotonic()
+        return end - self.submitted
+
+
+class GenerationWorker:
+    """Bounded pool for PDF builds with job ids and status polling"""
+
+    def __init__(self, max_workers=MAX_WORKERS, max_pending=MAX_PENDING, mode=WORKER_MODE):
+        self.mode = mode
+        self.max_pending = max_pending
+        self._executor = make_pool(max_workers, mode)
+        self._jobs = OrderedDict()
+        self._durations = {kind: deque(maxlen=20) for kind in BUILDERS}
+        self._lock = threading.Lock()
+
+    def _expected(self, kind):
+        recent = self._durations[kind]
+        return sum(recent) / len(recent) if recent else 1.0
+
+    def pending(self):
+        return sum(1 for job in self._jobs.values() if job.state in (QUEUED, RUNNING))
+
+    def submit(self, kind, payload, *images, **options):
+        """Queue a build of payload and return its job id.
+
+        options are passed to the builder (e.g. deterministic=True). Raises
+        WorkerBusy when max_pending builds are already queued or running.
+        """
+        if kind not in BUILDERS:
+            raise ValueError(f"Unknown document kind '{kind}'")
+        blob = encode_payload(kind, payload)
+        images = tuple(snapshot_image(path) for path in images)
+        with self._lock:
+            if self.pending() >= self.max_pending:
+                raise WorkerBusy(f"{self.max_pending} documents are already being generated; try again shortly")
+            job = Job(uuid.uuid4().hex, kind, peek(blob)[1], self._expected(kind))
+            self._jobs[job.job_id] = job
+            self._trim()
+        if self.mode == "process":
+            # Workers can't report back when they start; assume at once
+            job.state, job.started = RUNNING, time.monotonic()
+            future = self._executor.submit(render_blob, kind, blob, images, options)
+        else:
+            future = self._executor.submit(self._run, job, blob, images, options)
+        future.add_done_callback(lambda f: self._finish(job, f))
+        return job.job_id
+
+    def _run(self, job, blob, images, options):
+        job.state, job.started = RUNNING, time.monotonic()
+        return render_blob(job.kind, blob, images, options)
+
+    def _finish(self, job, future):
+        error = future.exception()
+        with self._lock:
+            job.finished = time.monotonic()
+            if error is None:
+                job.result, duration = future.result()
+                self._durations[job.kind].append(duration)
+                job.state = DONE
+            else:
+                job.error = error
+                job.state = FAILED
+
+    def _trim(self):
+        cutoff = time.monotonic() - RESULT_TTL
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.state in (DONE, FAILED) and job.finished < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def status(self, job_id):
+        """The Job for job_id, or None if unknown or already discarded"""
+        return self._jobs.get(job_id)
+
+    def collect(self, job_id):
+        """Remove and return a finished Job; None if it is pending or unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state not in (DONE, FAILED):
+                return None
+            return self._jobs.pop(job_id)
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job finishes (for scripts and tests)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        job = self._jobs[job_id]
+        while job.state in (QUEUED, RUNNING):
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            time.sleep(0.01)
+        return job
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    """Process-wide worker, shared by every Streamlit session"""
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = GenerationWorker()
+    return _worker
@@ -0,0 +1,255 @@
+import hashlib
+import html
+import json
+import threading
+import time
+
+from layout_templates import get_template
+
+# --- Live HTML Preview ---
+# A lightweight HTML rendition of the same payloads the PDF builders take.
+# Each document is split into blocks; a block declares which payload keys it
+# reads and is re-rendered only when the digest of those keys changes.
+# Submissions are debounced: a burst of edits renders once, after the
+# payload has been quiet for DEBOUNCE_SECONDS.
+
+DEBOUNCE_SECONDS = 0.4
+
+PREVIEW_CSS = """<style>
+.doc-preview{font-family:Calibri,Arial,sans-serif;font-size:13px;color:#000;background:#fff;
+ padding:16px 20px;border:1px solid #ccc;max-width:800px}
+.doc-preview h3{text-align:center;margin:4px 0 10px}
+.doc-preview table{border-collapse:collapse;width:100%;margin:6px 0}
+.doc-preview td,.doc-preview th{border:1px solid #000;padding:2px 5px;vertical-align:top}
+.doc-preview th{background:#e6e6e6}
+.doc-preview .num{text-align:right}
+.doc-preview .muted{color:#555}
+.doc-preview .plain td{border:none;padding:1px 4px}
+</style>"""
+
+
+def _esc(value):
+    return html.escape("" if value is None else str(value)).replace("\n", "<br>")
+
+
+def _money(value):
+    try:
+        return f"{float(value):,.2f}"
+    except (TypeError, ValueError):
+        return _esc(value)
+
+
+def _rows(pairs):
+    return "".join(f"<tr><td><b>{_esc(k)}</b></td><td>{_esc(v)}</td></tr>" for k, v in pairs)
+
+
+def _table(headers, rows, numeric=()):
+    head = "".join(f"<th>{_esc(h)}</th>" for h in headers)
+    body = "".join(
+        "<tr>" + "".join(
+            f"<td class='num'>{cell}</td>" if i in numeric else f"<td>{cell}</td>"
+            for i, cell in enumerate(row)) + "</tr>"
+        for row in rows)
+    return f"<table><tr>{head}</tr>{body}</table>"
+
+
+# --- Invoice blocks ---
+
+def _invoice_header(d):
+    inv, ref = d["invoice"], d["Reference"]
+    return ("<h3>TAX INVOICE</h3><table class='plain'>"
+            + _rows([("Invoice No.", inv["invoice_no"]), ("Invoice Date", inv["date"]),
+                     ("Supplier's Reference", ref["Suppliers_Reference"]), ("Other's Reference", ref["Other"])])
+            + "</table>")
+
+
+def _invoice_parties(d):
+    v, b = d["vendor"], d["buyer"]
+    seller = _rows([("Seller", v["name"]), ("Address", v["address"]), ("GST No.", v["gst"]), ("MSME", v["msme"])])
+    buyer = _rows([("Buyer", b["name"]), ("Address", b["address"]), ("GST No.", b["gst"])])
+    return f"<table><tr><td><table class='plain'>{seller}</table></td><td><table class='plain'>{buyer}</table></td></tr></table>"
+
+
+def _invoice_details(d):
+    det = d["invoice_details"]
+    return "<table class='plain'>" + _rows([
+        ("Buyer's Order No.", det["buyers_order_no"]), ("Buyer's Order Date", det["buyers_order_date"]),
+        ("Dispatched Through", det["dispatched_through"]), ("Destination", det["destination"]),
+        ("Terms of delivery", det["terms_of_delivery"])]) + "</table>"
+
+
+def _invoice_items(d):
+    headers = get_template("invoice").tables["items"].headers
+    rows = [(i + 1, _esc(it["description"]), _esc(it["hsn"]), _esc(it["quantity"]),
+             _money(it["unit_rate"]), _money(it["quantity"] * it["unit_rate"]))
+            for i, it in enumerate(d["items"])]
+    return _table(headers, rows, numeric=(3, 4, 5))
+
+
+def _invoice_totals(d):
+    t = d["totals"]
+    return "<table>" + "".join(
+        f"<tr><td><b>{label}</b></td><td class='num'><b>{_money(t[key])}</b></td></tr>"
+        for label, key in (("Basic Amount", "basic_amount"), ("SGST @ 9%", "sgst"),
+                           ("CGST @ 9%", "cgst"), ("Final Amount to be Paid", "final_amount"))
+    ) + (f"</table><p>Amount Chargeable (in words): {_esc(t['amount_in_words'])}<br>"
+         f"Tax Amount (in words): {_esc(t['tax_in_words'])}</p>")
+
+
+def _invoice_declaration(d):
+    return f"<p><b>Declaration:</b><br><span class='muted'>{_esc(d['declaration'])}</span></p>"
+
+
+# --- PO blocks ---
+
+def _po_header(d):
+    return (f"<h3>PURCHASE ORDER</h3><p>PO No: <b>{_esc(d['po_number'])}</b><br>"
+            f"Date: {_esc(d['po_date'])}</p>")
+
+
+def _po_parties(d):
+    vendor = _rows([("Vendor", d["vendor_name"]), ("Address", d["vendor_address"]),
+                    ("Contact", d["vendor_contact"]), ("Mobile", d["vendor_mobile"]),
+                    ("GST No.", d["gst_no"]), ("PAN No.", d["pan_no"]), ("MSME", d["msme_no"])])
+    bill = _rows([("Bill To", d["bill_to_company"]), ("Address", d["bill_to_address"]),
+                  ("Ship To", d["ship_to_company"]), ("Address", d["ship_to_address"])])
+    return f"<table><tr><td><table class='plain'>{vendor}</table></td><td><table class='plain'>{bill}</table></td></tr></table>"
+
+
+def _product_rows(products):
+    for p in products:
+        gst = p["basic"] * p["gst_percent"] / 100
+        yield (_esc(p["name"]), _money(p["basic"]), _money(gst), _money(p["basic"] + gst),
+               _esc(p["qty"]), _money((p["basic"] + gst) * p["qty"]))
+
+
+def _po_products(d):
+    headers = get_template("po").tables["products"].headers
+    rows = _product_rows(d["products"])
+    return (_table(headers, rows, numeric=(1, 2, 3, 4, 5))
+            + f"<p><b>Grand Total: {_money(d['grand_total'])}</b><br>{_esc(d['amount_words'])}</p>")
+
+
+def _po_terms(d):
+    return "<table class='plain'>" + _rows([
+        ("Payment Terms", d["payment_terms"]), ("Delivery Terms", d["delivery_terms"]),
+        ("End User", d["end_company"]), ("Address", d["end_address"]),
+        ("Contact", f"{d['end_person']} {d['end_mobile']} {d['end_email']}"),
+        ("Prepared By", d["prepared_by"]), ("Authorized By", d["authorized_by"])]) + "</table>"
+
+
+# --- Quotation blocks ---
+
+def _quotation_header(d):
+    return (f"<p>REF NO.: <b>{_esc(d['quotation_number'])}</b><br>Date: {_esc(d['quotation_date'])}</p>"
+            f"<p>To,<br><b>{_esc(d['vendor_name'])}</b><br>{_esc(d['vendor_address'])}<br>"
+            f"Email: {_esc(d['vendor_email'])}<br>Mobile: {_esc(d['vendor_mobile'])}</p>"
+            f"<p><u>Kind Attention :- {_esc(d['vendor_contact'])}</u></p>")
+
+
+def _quotation_letter(d):
+    return (f"<p><b><u>Subject :- {_esc(d['subject'])}</u></b></p>"
+            f"<p>{_esc(d['intro_paragraph'])}</p>")
+
+
+def _quotation_products(d):
+    headers = get_template("quotation").tables["products"].headers
+    rows = _product_rows(d["products"])
+    return (f"<h3>{_esc(d['annexure_text'])}<br><small>{_esc(d['quotation_title'])}</small></h3>"
+            + _table(headers, rows, numeric=(1, 2, 3, 4, 5))
+            + f"<p class='num'><b>Grand Total: {_money(d['grand_total'])}</b></p>")
+
+
+def _quotation_terms(d):
+    text = get_template("quotation").text
+    terms = "".join(f"<li>{_esc(a)}{_esc(b)}</li>" for a, b in text["terms"])
+    bank = _rows(text["bank"])
+    return (f"<table><tr><td><b>Terms &amp; Conditions:</b><ul>{terms}</ul>"
+            f"<p>Price Validity: {_esc(d['price_validity'])}</p></td>"
+            f"<td><b>Bank Details:</b><table class='plain'>{bank}</table></td></tr></table>")
+
+
+# kind -> ((block name, payload keys it reads, renderer), ...)
+DOCUMENT_BLOCKS = {
+    "invoice": (
+        ("header", ("invoice", "Reference"), _invoice_header),
+        ("parties", ("vendor", "buyer"), _invoice_parties),
+        ("details", ("invoice_details",), _invoice_details),
+        ("items", ("items",), _invoice_items),
+        ("totals", ("totals",), _invoice_totals),
+        ("declaration", ("declaration",), _invoice_declaration),
+    ),
+    "po": (
+        ("header", ("po_number", "po_date"), _po_header),
+        ("parties", ("vendor_name", "vendor_address", "vendor_contact", "vendor_mobile", "gst_no", "pan_no",
+                     "msme_no", "bill_to_company", "bill_to_address", "ship_to_company", "ship_to_address"), _po_parties),
+        ("products", ("products", "grand_total", "amount_words"), _po_products),
+        ("terms", ("payment_terms", "delivery_terms", "end_company", "end_address", "end_person",
+                   "end_mobile", "end_email", "prepared_by", "authorized_by"), _po_terms),
+    ),
+    "quotation": (
+        ("header", ("quotation_number", "quotation_date", "vendor_name", "vendor_address",
+                    "vendor_email", "vendor_mobile", "vendor_contact"), _quotation_header),
+        ("letter", ("subject", "intro_paragraph"), _quotation_letter),
+        ("products", ("products", "grand_total", "annexure_text", "quotation_title"), _quotation_products),
+        ("terms", ("price_validity",), _quotation_terms),
+    ),
+}
+
+
+def _digest(payload, keys):
+    part = [payload.get(key) for key in keys]
+    return hashlib.sha1(json.dumps(part, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class LivePreview:
+    """Debounced, block-incremental HTML preview of one document.
+
+    submit() records the latest payload; blocks() renders it once the payload
+    has been unchanged for DEBOUNCE_SECONDS, re-rendering only the blocks
+    whose inputs changed, and otherwise returns the last rendered blocks.
+    """
+
+    def __init__(self, kind, debounce=DEBOUNCE_SECONDS):
+        if kind not in DOCUMENT_BLOCKS:
+            raise ValueError(f"Unknown document kind '{kind}'")
+        self.kind = kind
+        self.debounce = debounce
+        self.pending = None
+        self.changed_at = 0.0
+        self.rendered = {}          # block name -> (digest, html)
+        self.renders = 0            # block renders, for diagnostics
+        self._lock = threading.Lock()
+
+    def submit(self, payload, now=None):
+        """Queue a payload; a new payload restarts the quiet period"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if payload != self.pending:
+                self.pending = payload
+                self.changed_at = now
+
+    def blocks(self, now=None, force=False):
+        """[(block name, html)] for the latest settled payload"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            payload = self.pending
+            quiet = now - self.changed_at >= self.debounce
+            if payload is not None and (quiet or force or not self.rendered):
+                for name, keys, render in DOCUMENT_BLOCKS[self.kind]:
+                    digest = _digest(payload, keys)
+                    cached = self.rendered.get(name)
+                    if cached is None or cached[0] != digest:
+                        try:
+                            body = render(payload)
+                        except (KeyError, TypeError, ValueError) as e:
+                            body = f"<p class='muted'>Preview unavailable: {_esc(e)}</p>"
+                        self.rendered[name] = (digest, body)
+                        self.renders += 1
+            return [(name, self.rendered[name][1])
+                    for name, _, _ in DOCUMENT_BLOCKS[self.kind] if name in self.rendered]
+
+    def html(self, now=None, force=False):
+        """The whole preview as one HTML fragment"""
+        body = "".join(block for _, block in self.blocks(now, force))
+        return f"{PREVIEW_CSS}<div class='doc-preview'>{body}</div>"
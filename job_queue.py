@@ -0,0 +1,346 @@
+import argparse
+import hashlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from document_codec import decode, encode_payload
+from document_models import DocumentError
+from document_store import DocumentStore, connect, document_number, ensure_schema
+from document_worker import (BUILDERS, DEFAULT_IMAGES, DONE, FAILED, MAX_WORKERS, QUEUED, RUNNING, WORKER_MODE,
+                             make_pool, render_blob)
+
+# --- Persistent Batch Queue ---
+# Large batch runs (thousands of renewal quotations) are queued in the
+# document store's SQLite file, so a batch survives a crash and can be
+# resumed. Each item is claimed atomically by a runner, rendered by the usual
+# builders on a worker pool, and stored with its PDF in the same transaction
+# that marks it done. A failure is retried later with exponential backoff,
+# up to MAX_ATTEMPTS. Items left "running" by a runner that died go back to
+# the queue when the next run starts.
+#
+#   python job_queue.py enqueue renewals.jsonl --kind quotation
+#   python job_queue.py run 1 --workers 4
+#   python job_queue.py status 1
+
+MAX_ATTEMPTS = int(os.environ.get("BATCH_MAX_ATTEMPTS", "3"))
+BACKOFF_SECONDS = float(os.environ.get("BATCH_BACKOFF_SECONDS", "5"))
+BACKOFF_MAX_SECONDS = 300
+LEASE_SECONDS = 600  # a claim older than this is considered abandoned
+THROUGHPUT_WINDOW = 60
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    images TEXT NOT NULL,
+    options TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batch_items (
+    id INTEGER PRIMARY KEY,
+    batch_id INTEGER NOT NULL REFERENCES batches(id),
+    seq INTEGER NOT NULL,
+    number TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    claimed_at REAL,
+    finished_at REAL,
+    seconds REAL,
+    error TEXT,
+    document_id INTEGER,
+    UNIQUE (batch_id, seq)
+);
+CREATE INDEX IF NOT EXISTS batch_items_claim ON batch_items (batch_id, status, not_before);
+"""
+
+
+def runner_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def runner_alive(claimed_by):
+    """False only when claimed_by is a process on this host that has exited"""
+    host, _, pid = (claimed_by or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rpartition(")")[2].split()[0] != "Z"  # exited, not yet reaped
+    except (OSError, IndexError):
+        return True
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number attempts (1, 2, ...)"""
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_SECONDS * 2 ** (attempts - 1))
+
+
+class JobQueue:
+    """Batches and their items in the document store database"""
+
+    def __init__(self, path=None):
+        self.store = DocumentStore(path)
+        ensure_schema(self.conn, self.store.path, QUEUE_SCHEMA)
+
+    @property
+    def conn(self):
+        return connect(self.store.path)
+
+    def create_batch(self, kind, payloads, images=(), name="", **options):
+        """Validate and queue payloads as one batch; returns the batch id.
+
+        Nothing is queued if any payload is invalid (DocumentError names the row).
+        """
+        if kind not in BUILDERS:
+            raise ValueError(f"Unknown document kind '{kind}'")
+        rows = []
+        for seq, payload in enumerate(payloads):
+            try:
+                blob = encode_payload(kind, payload)
+            except (DocumentError, KeyError, TypeError) as e:
+                raise DocumentError(f"Row {seq + 1}: {e}")
+            rows.append((seq, decode(blob), blob))
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            batch_id = conn.execute(
+                "INSERT INTO batches (name, kind, images, options, total, created_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "RETURNING id",
+                (name, kind, json.dumps(list(images)), json.dumps(options), len(rows), time.time())).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO batch_items (batch_id, seq, number, payload) VALUES (?, ?, ?, ?)",
+                ((batch_id, seq, document_number(model), blob) for seq, model, blob in rows))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return batch_id
+
+    def batch(self, batch_id):
+        """(kind, images, options) of a batch"""
+        row = self.conn.execute("SELECT kind, images, options FROM batches WHERE id = ?", (batch_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"No batch {batch_id}")
+        return row[0], tuple(json.loads(row[1])), json.loads(row[2])
+
+    def taken_numbers(self, kind, prefix):
+        """Numbers starting with prefix that are stored or queued in an unfinished batch of kind"""
+        upper = prefix + "\U0010ffff"
+        return {number for (number,) in self.conn.execute(
+            "SELECT number FROM documents WHERE kind = ? AND number >= ? AND number < ? "
+            "UNION SELECT i.number FROM batch_items i JOIN batches b ON b.id = i.batch_id "
+            "WHERE b.kind = ? AND i.status IN (?, ?) AND i.number >= ? AND i.number < ?",
+            (kind, prefix, upper, kind, QUEUED, RUNNING, prefix, upper))}
+
+    def version(self, batch_id):
+        """Changes when the batch's finished documents change (cache key for its ZIP)"""
+        row = self.conn.execute(
+            "SELECT b.created_at, COUNT(d.id), MAX(d.created_at) FROM batches b "
+            "LEFT JOIN batch_items i ON i.batch_id = b.id AND i.status = ? "
+            "LEFT JOIN documents d ON d.id = i.document_id WHERE b.id = ?", (DONE, batch_id)).fetchone()
+        return hashlib.sha256(f"{self.store.path}|{row!r}".encode()).hexdigest()[:16]
+
+    def recover(self, batch_id, lease=LEASE_SECONDS):
+        """Requeue items whose runner died or whose claim expired; returns the count"""
+        conn = self.conn
+        stale = []
+        for item_id, claimed_by, claimed_at in conn.execute(
+                "SELECT id, claimed_by, claimed_at FROM batch_items WHERE batch_id = ? AND status = ?",
+                (batch_id, RUNNING)):
+            if not runner_alive(claimed_by) or (claimed_at or 0) < time.time() - lease:
+                stale.append((QUEUED, item_id, RUNNING))
+        conn.executemany("UPDATE batch_items SET status = ?, claimed_by = NULL WHERE id = ? AND status = ?", stale)
+        return len(stale)
+
+    def claim(self, batch_id, limit, claimed_by=None):
+        """Atomically mark up to limit due items as running; [(item_id, blob, attempts)]"""
+        now = time.time()
+        return self.conn.execute(
+            "UPDATE batch_items SET status = ?, claimed_by = ?, claimed_at = ?, attempts = attempts + 1 "
+            "WHERE id IN (SELECT id FROM batch_items WHERE batch_id = ? AND status = ? AND not_before <= ? "
+            "ORDER BY seq LIMIT ?) RETURNING id, payload, attempts",
+            (RUNNING, claimed_by or runner_id(), now, batch_id, QUEUED, now, limit)).fetchall()
+
+    def complete(self, item_id, document, pdf_bytes, seconds):
+        """Store the rendered document and mark the item done, in one transaction"""
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            document_id = self.store.put(document, pdf_bytes, conn=conn)
+            conn.execute(
+                "UPDATE batch_items SET status = ?, finished_at = ?, seconds = ?, error = NULL, document_id = ? "
+                "WHERE id = ?", (DONE, time.time(), seconds, document_id, item_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return document_id
+
+    def fail(self, item_id, error, attempts, max_attempts=MAX_ATTEMPTS):
+        """Requeue with backoff, or mark failed once max_attempts are used up"""
+        if attempts >= max_attempts:
+            self.conn.execute("UPDATE batch_items SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                              (FAILED, time.time(), error, item_id))
+        else:
+            self.conn.execute("UPDATE batch_items SET status = ?, not_before = ?, error = ? WHERE id = ?",
+                              (QUEUED, time.time() + backoff(attempts), error, item_id))
+
+    def retry_failed(self, batch_id):
+        """Give failed items a fresh set of attempts; returns the count"""
+        return self.conn.execute(
+            "UPDATE batch_items SET status = ?, attempts = 0, not_before = 0 WHERE batch_id = ? AND status = ?",
+            (QUEUED, batch_id, FAILED)).rowcount
+
+    def next_due(self, batch_id):
+        """Seconds until the next queued item may be claimed, or None if none are queued"""
+        row = self.conn.execute("SELECT MIN(not_before) FROM batch_items WHERE batch_id = ? AND status = ?",
+                                (batch_id, QUEUED)).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def progress(self, batch_id):
+        """Counts per state, recent throughput (documents/s) and ETA in seconds"""
+        counts = dict(self.conn.execute(
+            "SELECT status, COUNT(*) FROM batch_items WHERE batch_id = ? GROUP BY status", (batch_id,)).fetchall())
+        now = time.time()
+        recent, first = self.conn.execute(
+            "SELECT COUNT(*), MIN(finished_at) FROM batch_items WHERE batch_id = ? AND status = ? "
+            "AND finished_at >= ?", (batch_id, DONE, now - THROUGHPUT_WINDOW)).fetchone()
+        rate = recent / max(now - first, 1.0) if recent else 0.0
+        total = sum(counts.values())
+        remaining = counts.get(QUEUED, 0) + counts.get(RUNNING, 0)
+        return {
+            "total": total,
+            "done": counts.get(DONE, 0),
+            "failed": counts.get(FAILED, 0),
+            "running": counts.get(RUNNING, 0),
+            "queued": counts.get(QUEUED, 0),
+            "per_second": round(rate, 2),
+            "eta_seconds": round(remaining / rate) if rate else None,
+        }
+
+    def failures(self, batch_id):
+        """(seq, number, error) of failed items"""
+        return self.conn.execute(
+            "SELECT seq, number, error FROM batch_items WHERE batch_id = ? AND status = ? ORDER BY seq",
+            (batch_id, FAILED)).fetchall()
+
+
+def run_batch(batch_id, workers=MAX_WORKERS, mode=WORKER_MODE, path=None, on_progress=None,
+              progress_every=1.0):
+    """Render every queued item of a batch; returns the final progress().
+
+    Items are claimed a few at a time so a crash loses at most those in
+    flight; all database writes happen on this thread. on_progress(progress)
+    is called at most every progress_every seconds.
+    """
+    queue = JobQueue(path)
+    queue.recover(batch_id)
+    kind, images, options = queue.batch(batch_id)
+    claimer = runner_id()
+    running = {}
+    reported = 0.0
+    with make_pool(workers, mode) as executor:
+        while True:
+            free = workers * 2 - len(running)
+            if free > 0:
+                for item_id, blob, attempts in queue.claim(batch_id, free, claimer):
+                    future = executor.submit(render_blob, kind, blob, images, options)
+                    running[future] = (item_id, blob, attempts)
+            if not running:
+                due = queue.next_due(batch_id)
+                if due is None:
+                    break
+                time.sleep(min(due, 1.0))
+                continue
+            finished, _ = wait(running, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in finished:
+                item_id, blob, attempts = running.pop(future)
+                try:
+                    pdf_bytes, seconds = future.result()
+                except Exception as e:
+                    queue.fail(item_id, f"{type(e).__name__}: {e}", attempts)
+                else:
+                    queue.complete(item_id, decode(blob), pdf_bytes, seconds)
+            if on_progress and time.monotonic() - reported >= progress_every:
+                reported = time.monotonic()
+                on_progress(queue.progress(batch_id))
+    return queue.progress(batch_id)
+
+
+_runs = {}
+_runs_lock = threading.Lock()
+
+
+def start_batch(batch_id, workers=MAX_WORKERS, mode=WORKER_MODE, path=None):
+    """run_batch() on a background thread (once per batch and process); returns the thread"""
+    with _runs_lock:
+        thread = _runs.get(batch_id)
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=run_batch, args=(batch_id, workers, mode, path),
+                                      name=f"batch-{batch_id}", daemon=True)
+            thread.start()
+            _runs[batch_id] = thread
+    return thread
+
+
+def _print_progress(progress):
+    eta = progress["eta_seconds"]
+    print(f"{progress['done']}/{progress['total']} done, {progress['failed']} failed, "
+          f"{progress['per_second']}/s, ETA {'-' if eta is None else f'{eta}s'}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent batch queue for invoice, PO and quotation PDFs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue = commands.add_parser("enqueue", help="queue a JSON-lines file of payloads")
+    enqueue.add_argument("file")
+    enqueue.add_argument("--kind", choices=sorted(BUILDERS), required=True)
+    enqueue.add_argument("--name", default="")
+    run = commands.add_parser("run", help="render (or resume) a batch")
+    run.add_argument("batch_id", type=int)
+    run.add_argument("--workers", type=int, default=MAX_WORKERS)
+    run.add_argument("--mode", choices=("thread", "process"), default=WORKER_MODE)
+    status = commands.add_parser("status", help="show batch progress and failures")
+    status.add_argument("batch_id", type=int)
+    retry = commands.add_parser("retry", help="requeue a batch's failed items")
+    retry.add_argument("batch_id", type=int)
+    args = parser.parse_args()
+
+    queue = JobQueue()
+    if args.command == "enqueue":
+        with open(args.file, encoding="utf-8") as f:
+            payloads = [json.loads(line) for line in f if line.strip()]
+        try:
+            batch_id = queue.create_batch(args.kind, payloads, DEFAULT_IMAGES[args.kind],
+                                          name=args.name or os.path.basename(args.file), deterministic=True)
+        except DocumentError as e:
+            sys.exit(str(e))
+        print(f"Batch {batch_id}: {len(payloads)} {args.kind} documents queued")
+    elif args.command == "run":
+        _print_progress(run_batch(args.batch_id, args.workers, args.mode, on_progress=_print_progress))
+    elif args.command == "status":
+        _print_progress(queue.progress(args.batch_id))
+        for seq, number, error in queue.failures(args.batch_id):
+            print(f"  row {seq + 1} ({number}): {error}")
+    elif args.command == "retry":
+        print(f"{queue.retry_failed(args.batch_id)} items requeued")
+
+
+if __name__ == "__main__":
+    main()
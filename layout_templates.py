@@ -0,0 +1,229 @@
+import json
+import os
+import threading
+
+# --- Declarative Layout Templates ---
+# Each document type (invoice, po, quotation) has a template file under
+# templates/ describing text styles, tables and fixed blocks. A template is
+# compiled once into flat tuples of draw ops and cached per (name, version),
+# so a builder only walks precomputed ops instead of re-deriving coordinates.
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+TEMPLATE_EXTENSIONS = (".json", ".yaml", ".yml")
+
+# Maps template op names to the FPDF call they compile to and the argument
+# order of that call. Missing arguments fall back to the FPDF defaults.
+OP_SIGNATURES = {
+    "cell": ("cell", ("w", "h", "text", "border", "ln", "align", "fill", "link")),
+    "multi_cell": ("multi_cell", ("w", "h", "text", "border", "align", "fill")),
+    "ln": ("ln", ("h",)),
+    "x": ("set_x", ("x",)),
+    "y": ("set_y", ("y",)),
+    "xy": ("set_xy", ("x", "y")),
+    "fill": ("set_fill_color", ("r", "g", "b")),
+    "color": ("set_text_color", ("r", "g", "b")),
+    "draw_color": ("set_draw_color", ("r", "g", "b")),
+}
+OP_DEFAULTS = {"h": 0, "text": "", "border": 0, "ln": 0, "align": "", "fill": 0, "link": ""}
+
+_raw_cache = {}
+_compiled_cache = {}
+_cache_lock = threading.Lock()
+
+
+class TemplateError(ValueError):
+    """Raised when a layout template is missing or malformed"""
+
+
+class CompiledTable:
+    """Precomputed geometry for a table: widths, x offsets, formats and header ops"""
+    __slots__ = ("name", "widths", "offsets", "aligns", "formats", "headers",
+                 "total_width", "header_height", "line_height", "header_program", "row_style")
+
+    def __init__(self, name, spec, styles, family):
+        columns = spec.get("columns")
+        if not columns:
+            raise TemplateError(f"Table '{name}' has no columns")
+        self.name = name
+        self.widths = tuple(float(c["width"]) for c in columns)
+        offsets, x = [], 0.0
+        for w in self.widths:
+            offsets.append(x)
+            x += w
+        self.offsets = tuple(offsets)
+        self.total_width = x
+        self.aligns = tuple(c.get("align", "") for c in columns)
+        self.formats = tuple(c.get("format", "{}") for c in columns)
+        self.headers = tuple(c.get("header", "") for c in columns)
+        self.header_height = spec.get("header_height", 6)
+        self.line_height = spec.get("line_height", 5)
+        self.row_style = _resolve_style(spec.get("row_style", "body"), styles, family)
+
+        # Header row compiles to a fixed op sequence
+        ops = []
+        fill = 0
+        if spec.get("header_fill"):
+            ops.append(("set_fill_color", tuple(spec["header_fill"]), None))
+            fill = 1
+        ops.append(("set_font", _resolve_style(spec.get("header_style", "label"), styles, family), None))
+        header_align = spec.get("header_align", "C")
+        break_after = spec.get("header_break", "ln")
+        last = len(columns) - 1
+        for i, (w, text) in enumerate(zip(self.widths, self.headers)):
+            ln = 1 if (i == last and break_after == "cell") else 0
+            ops.append(("cell", (w, self.header_height, text, 1, ln, header_align, fill), None))
+        if break_after == "ln":
+            ops.append(("ln", (), None))
+        self.header_program = tuple(ops)
+
+    def span(self, start, stop=None):
+        """Width covered by columns[start:stop]"""
+        return sum(self.widths[start:stop])
+
+    def format_cells(self, values):
+        """Format one row of raw values with the column formats"""
+        return [fmt.format(v) for fmt, v in zip(self.formats, values)]
+
+
+class CompiledTemplate:
+    """A template compiled into draw programs; rendering is a loop over ops"""
+    __slots__ = ("name", "version", "family", "styles", "programs", "tables", "dims", "text")
+
+    def __init__(self, name, raw):
+        self.name = name
+        self.version = raw.get("version", 0)
+        self.family = raw.get("font_family", "Helvetica")
+        styles = raw.get("styles", {})
+        self.styles = {key: _resolve_style(key, styles, self.family) for key in styles}
+        self.dims = dict(raw.get("dims", {}))
+        self.text = dict(raw.get("text", {}))
+        self.tables = {key: CompiledTable(key, spec, styles, self.family)
+                       for key, spec in raw.get("tables", {}).items()}
+        self.programs = {key: _compile_block(name, key, ops, styles, self.family)
+                         for key, ops in raw.get("blocks", {}).items()}
+
+    def style(self, pdf, key):
+        """Apply a named text style"""
+        pdf.set_font(*self.styles[key])
+
+    def run(self, pdf, block, values=None):
+        """Execute a compiled block against an FPDF instance"""
+        try:
+            program = self.programs[block]
+        except KeyError:
+            raise TemplateError(f"Template '{self.name}' has no block '{block}'")
+        run_program(pdf, program, values)
+
+    def header(self, pdf, table):
+        """Draw the header row of a named table and return its geometry"""
+        compiled = self.tables[table]
+        run_program(pdf, compiled.header_program)
+        return compiled
+
+
+def _resolve_style(key, styles, family):
+    if isinstance(key, dict):
+        spec = key
+    else:
+        try:
+            spec = styles[key]
+        except KeyError:
+            raise TemplateError(f"Unknown text style '{key}'")
+    return (spec.get("family", family), spec.get("style", ""), spec.get("size", 10))
+
+
+def _compile_block(template_name, block_name, ops, styles, family):
+    program = []
+    for index, op in enumerate(ops):
+        kind = op.get("op")
+        if kind == "style":
+            program.append(("set_font", _resolve_style(op["name"], styles, family), None))
+            continue
+        if kind not in OP_SIGNATURES:
+            raise TemplateError(f"{template_name}.{block_name}[{index}]: unknown op '{kind}'")
+        method, params = OP_SIGNATURES[kind]
+        if kind in ("fill", "color", "draw_color"):
+            op = dict(zip(("r", "g", "b"), op["rgb"]))
+
+        # Only pass arguments up to the last one the template sets, so FPDF
+        # defaults (like ln()'s "last cell height") still apply.
+        present = [i for i, p in enumerate(params) if p in op or (p == "y" and "dy" in op)]
+        args, dynamic = [], []
+        for i, param in enumerate(params[:present[-1] + 1] if present else ()):
+            value = op.get(param, OP_DEFAULTS.get(param, 0))
+            if param == "y" and "dy" in op:
+                # Relative to the current y position at run time
+                dynamic.append((i, "dy", op["dy"]))
+                value = 0
+            elif isinstance(value, str) and value.startswith("$"):
+                dynamic.append((i, "value", value[1:]))
+            elif param in ("text", "link") and "{" in value:
+                dynamic.append((i, "format", value))
+            args.append(value)
+        program.append((method, tuple(args), tuple(dynamic) or None))
+    return tuple(program)
+
+
+def run_program(pdf, program, values=None):
+    """Tight loop over precompiled ops; dynamic slots are filled from values"""
+    for method, args, dynamic in program:
+        if dynamic:
+            args = list(args)
+            for i, kind, key in dynamic:
+                if kind == "format":
+                    args[i] = key.format_map(values)
+                elif kind == "value":
+                    args[i] = values[key]
+                else:
+                    args[i] = pdf.get_y() + key
+        getattr(pdf, method)(*args)
+
+
+def _template_path(name):
+    for ext in TEMPLATE_EXTENSIONS:
+        path = os.path.join(TEMPLATE_DIR, name + ext)
+        if os.path.exists(path):
+            return path
+    raise TemplateError(f"No layout template named '{name}' in {TEMPLATE_DIR}")
+
+
+def _load_raw(path):
+    with open(path, "r", encoding="utf-8") as fh:
+        if path.endswith(".json"):
+            return json.load(fh)
+        import yaml  # Optional: only needed for YAML templates
+        return yaml.safe_load(fh)
+
+
+def get_template(name):
+    """Return the compiled template for name, compiling once per version.
+
+    The file is re-read only when its mtime changes, and recompiled only when
+    the declared "version" is new.
+    """
+    path = _template_path(name)
+    stamp = os.stat(path).st_mtime_ns
+    raw_key = (path, stamp)
+    raw = _raw_cache.get(raw_key)
+    if raw is None:
+        with _cache_lock:
+            raw = _raw_cache.get(raw_key)
+            if raw is None:
+                raw = _load_raw(path)
+                _raw_cache[raw_key] = raw
+    key = (name, raw.get("version", 0))
+    compiled = _compiled_cache.get(key)
+    if compiled is None:
+        with _cache_lock:
+            compiled = _compiled_cache.get(key)
+            if compiled is None:
+                compiled = CompiledTemplate(name, raw)
+                _compiled_cache[key] = compiled
+    return compiled
+
+
+def clear_template_cache():
+    """Drop all cached templates (e.g. after editing template files)"""
+    with _cache_lock:
+        _raw_cache.clear()
+        _compiled_cache.clear()
@@ -0,0 +1,39 @@
+import importlib
+
+# --- Lazy Imports ---
+# pandas, num2words and PIL are only needed for an Excel upload, amounts in
+# words or an image upload, yet importing pandas alone takes about half a
+# second. The apps bind these names to proxies that import the real module
+# on first use, so a session that never uploads a sheet never pays for it.
+
+
+class LazyModule:
+    """Stands in for module name until one of its attributes is used"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded yet"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_function(module_name, func_name):
+    """A function that imports module_name.func_name on its first call"""
+    target = None
+
+    def call(*args, **kwargs):
+        nonlocal target
+        if target is None:
+            target = getattr(importlib.import_module(module_name), func_name)
+        return target(*args, **kwargs)
+
+    call.__name__ = func_name
+    return call
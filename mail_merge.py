@@ -0,0 +1,70 @@
+import math
+import re
+
+from document_models import DocumentError
+from document_worker import snapshot_image
+from job_queue import JobQueue
+
+# --- Quotation Mail Merge ---
+# One personalized quotation per EndUsers row: the row's company, address,
+# contact, mobile and email replace the recipient block of a template
+# quotation (the form as filled in), and {company} / {contact} / {address}
+# in the subject, intro or validity text are filled from the row; any other
+# braces are the user's own text and are left as typed. Every
+# quotation gets its own number and the whole set goes to the persistent
+# batch queue, so a run of 1,000 renders in parallel and survives a restart.
+
+# Quotation field -> EndUsers sheet column
+ENDUSER_COLUMNS = {
+    "vendor_name": "End User Company",
+    "vendor_address": "End User Address",
+    "vendor_contact": "End User Contact",
+    "vendor_mobile": "End Mobile",
+    "vendor_email": "End User Email",
+}
+PERSONALIZED_FIELDS = ("subject", "intro_paragraph", "price_validity")
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+def cell_text(value):
+    """Sheet cell as text: blanks become "", 9876543210.0 becomes "9876543210" """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def personalize(template, row, number):
+    """Quotation payload for one EndUsers row (a dict keyed by column name)"""
+    payload = dict(template, quotation_number=number)
+    for field, column in ENDUSER_COLUMNS.items():
+        payload[field] = cell_text(row.get(column))
+    values = {"company": payload["vendor_name"], "contact": payload["vendor_contact"],
+              "address": payload["vendor_address"]}
+    for field in PERSONALIZED_FIELDS:
+        text = payload.get(field)
+        if text is None:
+            continue
+        if not isinstance(text, str):
+            raise DocumentError(f"Mail merge {field} must be text")
+        payload[field] = _PLACEHOLDER.sub(lambda m: values.get(m.group(1), m.group(0)), text)
+    return payload
+
+
+def merge_payloads(template, rows, numbers):
+    """Payloads for rows, numbered in order from numbers"""
+    if len(numbers) < len(rows):
+        raise ValueError(f"{len(rows)} rows but only {len(numbers)} quotation numbers")
+    return [personalize(template, row, number) for row, number in zip(rows, numbers)]
+
+
+def queue_mail_merge(template, rows, numbers, images=(), name="Mail merge", path=None):
+    """Validate and queue the merged quotations; returns the batch id.
+
+    Images are snapshotted first so the batch still finds them after the
+    app's temporary uploads are removed.
+    """
+    payloads = merge_payloads(template, rows, numbers)
+    images = tuple(snapshot_image(image) for image in images)
+    return JobQueue(path).create_batch("quotation", payloads, images, name=name, deterministic=True)
@@ -0,0 +1,130 @@
+import re
+from functools import lru_cache
+
+from document_store import DocumentStore
+from rollups import fiscal_quarter
+from vendor_registry import name_key
+
+# --- Deal Margins ---
+# Joins what customers pay (invoice lines) to what we pay vendors for them
+# (PO lines: the PO's end_company is the customer) on end customer, product
+# and period. Both sides are streamed once from the document store's
+# document_lines: the PO side is hashed into per-key sums (the build side),
+# the invoice side is summed the same way and probed against it, so a full
+# year is two linear passes rather than a comparison of every pair.
+# Company names match on vendor_registry.name_key, so "Acme Pvt. Ltd." on
+# the PO and "ACME PVT LTD" on the invoice are the same customer.
+#
+#   python margin_report.py 2025-04-01 2026-03-31 --period month
+
+PERIODS = ("month", "quarter", "year")
+MATCHED = "matched"
+NO_PO = "no PO"
+NO_INVOICE = "no invoice"
+
+_SPACES = re.compile(r"\s+")
+
+
+def period_of(iso_date, period="quarter"):
+    """"2025-04", "FY2025-26 Q1" or "FY2025-26" for an ISO date"""
+    if period == "month":
+        return iso_date[:7] if iso_date else "Unknown"
+    label = fiscal_quarter(iso_date)
+    return label.split(" ")[0] if period == "year" and iso_date else label
+
+
+@lru_cache(maxsize=8192)
+def customer_key(name):
+    return name_key(name)
+
+
+@lru_cache(maxsize=8192)
+def product_key(name):
+    return _SPACES.sub(" ", name).strip().casefold()
+
+
+def _sum_lines(rows, period):
+    # {(customer_key, product_key, period): [quantity, amount, customer, product]}
+    sums = {}
+    for doc_date, customer, product, quantity, amount in rows:
+        key = (customer_key(customer), product_key(product), period_of(doc_date, period))
+        entry = sums.get(key)
+        if entry is None:
+            sums[key] = [quantity, amount, customer, product]
+        else:
+            entry[0] += quantity
+            entry[1] += amount
+    return sums
+
+
+def _deal(status, period, invoiced, bought):
+    revenue = invoiced[1] if invoiced else 0.0
+    cost = bought[1] if bought else 0.0
+    source = invoiced or bought
+    return {"customer": source[2], "product": source[3], "period": period, "status": status,
+            "invoiced_qty": invoiced[0] if invoiced else 0.0, "bought_qty": bought[0] if bought else 0.0,
+            "revenue": round(revenue, 2), "cost": round(cost, 2), "margin": round(revenue - cost, 2),
+            "margin_percent": round((revenue - cost) * 100 / revenue, 1) if revenue and bought else None}
+
+
+def deal_margins(since=None, until=None, period="quarter", path=None):
+    """{"deals": [...], "products": [...], "totals": {...}} for a date range.
+
+    A deal is one customer, product and period. Deals found on one side
+    only are kept with status NO_PO or NO_INVOICE and count towards neither
+    product margins nor the matched totals.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period '{period}'")
+    store = DocumentStore(path)
+    columns = "doc_date, customer, product, quantity, amount"
+    bought = _sum_lines(store.lines(("po",), since, until, columns), period)  # build side
+    invoiced = _sum_lines(store.lines(("invoice",), since, until, columns), period)  # probe side
+
+    deals, products = [], {}
+    for key, sold in invoiced.items():
+        match = bought.pop(key, None)
+        deal = _deal(MATCHED if match else NO_PO, key[2], sold, match)
+        deals.append(deal)
+        if match:
+            totals = products.setdefault(key[1], {"product": sold[3], "deals": 0, "revenue": 0.0, "cost": 0.0})
+            totals["deals"] += 1
+            totals["revenue"] += deal["revenue"]
+            totals["cost"] += deal["cost"]
+    deals.extend(_deal(NO_INVOICE, key[2], None, entry) for key, entry in bought.items())
+    deals.sort(key=lambda deal: (deal["period"], -deal["margin"]))
+
+    product_rows = []
+    for totals in products.values():
+        margin = totals["revenue"] - totals["cost"]
+        product_rows.append(dict(totals, revenue=round(totals["revenue"], 2), cost=round(totals["cost"], 2),
+                                 margin=round(margin, 2),
+                                 margin_percent=round(margin * 100 / totals["revenue"], 1) if totals["revenue"] else None))
+    product_rows.sort(key=lambda row: -row["margin"])
+
+    matched = [deal for deal in deals if deal["status"] == MATCHED]
+    revenue = sum(deal["revenue"] for deal in matched)
+    cost = sum(deal["cost"] for deal in matched)
+    return {"deals": deals, "products": product_rows, "totals": {
+        "matched": len(matched), "no_po": sum(deal["status"] == NO_PO for deal in deals),
+        "no_invoice": sum(deal["status"] == NO_INVOICE for deal in deals),
+        "revenue": round(revenue, 2), "cost": round(cost, 2), "margin": round(revenue - cost, 2)}}
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Margin per deal and per product (POs joined to invoices)")
+    parser.add_argument("since", nargs="?")
+    parser.add_argument("until", nargs="?")
+    parser.add_argument("--period", choices=PERIODS, default="quarter")
+    parser.add_argument("--db", help="document store path")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    report = deal_margins(args.since, args.until, args.period, args.db)
+    for row in report["products"]:
+        print(f"{row['product'][:50]:<52}{row['deals']:>6}{row['revenue']:>16,.2f}{row['margin']:>16,.2f}"
+              f"{row['margin_percent'] if row['margin_percent'] is not None else '-':>8}%")
+    print(report["totals"])
+    print(f"{len(report['deals'])} deals in {time.perf_counter() - started:.2f} s")
@@ -0,0 +1,143 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+
+import normalize
+from workbook_loader import WorkbookReader, read_columns
+
+# --- Shared Master Data ---
+# The Vendors and EndUsers sheets are parsed once per workbook (keyed by the
+# sha256 of the file) into immutable tables shared by every session in the
+# process. A session keeps only the workbook digest and the keys of the rows
+# it selected; rows are read-only mappings looked up by key. Sheets are read
+# by workbook_loader, keeping only the columns listed below, and every column
+# is cleaned by normalize at load time.
+
+MAX_WORKBOOKS = 4
+VENDOR_KEY = "Vendor Name"
+END_USER_KEY = "End User Company"
+VENDOR_COLUMNS = (VENDOR_KEY, "Vendor Address", "Contact Person", "Mobile", "Email",
+                  "GST NO", "PAN NO", "MSME NO", "Pincode")
+END_USER_COLUMNS = (END_USER_KEY, "End User Address", "End User Contact", "End Mobile",
+                    "End User Email", "GST NO", "PAN NO", "Pincode")
+NORMALIZERS = {
+    "Mobile": normalize.phone,
+    "End Mobile": normalize.phone,
+    "Email": normalize.email,
+    "End User Email": normalize.email,
+    "GST NO": normalize.gstin,
+    "PAN NO": normalize.pan,
+    "MSME NO": normalize.msme,
+    "Pincode": normalize.pincode,
+}
+
+_workbooks = OrderedDict()
+_lock = threading.Lock()
+_loading = {}
+
+
+class Table:
+    """Immutable columns with an index on the key column (first row wins)"""
+    __slots__ = ("columns", "key", "_data", "_index")
+
+    def __init__(self, columns, data, key):
+        self.columns = tuple(columns)
+        self.key = key
+        self._data = tuple(data)  # one sequence of values per column
+        index = {}
+        for i, value in enumerate(self.column(key)):
+            if value is not None and value != "" and value not in index:
+                index[value] = i
+        self._index = MappingProxyType(index)
+
+    def __len__(self):
+        return len(self._data[0]) if self._data else 0
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __getitem__(self, key):
+        return self._row(self._index[key])
+
+    def _row(self, i):
+        return MappingProxyType({name: values[i] for name, values in zip(self.columns, self._data)})
+
+    def get(self, key, default=None):
+        return self[key] if key in self._index else default
+
+    def keys(self):
+        """Distinct keys in sheet order"""
+        return tuple(self._index)
+
+    def column(self, name):
+        """All values of one column, in sheet order"""
+        return self._data[self.columns.index(name)]
+
+    def rows(self):
+        """Every row as a read-only mapping, in sheet order"""
+        for i in range(len(self)):
+            yield self._row(i)
+
+
+class MasterData:
+    """Vendors and end users of one workbook"""
+    __slots__ = ("digest", "vendors", "end_users", "loaded_at")
+
+    def __init__(self, digest, vendors, end_users):
+        self.digest = digest
+        self.vendors = vendors
+        self.end_users = end_users
+        self.loaded_at = time.time()
+
+
+def _table(book, sheet, columns, key, on_progress):
+    found, values = read_columns(book, sheet, columns, key, on_progress)
+    values = [normalize.normalize_column(column, NORMALIZERS.get(name, normalize.text))
+              for name, column in zip(found, values)]
+    return Table(found, values, key)
+
+
+def parse_workbook(data, digest, on_progress=None):
+    """MasterData from workbook bytes (.xlsx or .xls)"""
+    with WorkbookReader(data) as book:
+        return MasterData(digest,
+                          _table(book, "Vendors", VENDOR_COLUMNS, VENDOR_KEY, on_progress),
+                          _table(book, "EndUsers", END_USER_COLUMNS, END_USER_KEY, on_progress))
+
+
+def workbook_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_master_data(data, digest=None, on_progress=None):
+    """Shared MasterData for workbook bytes, parsed once per process.
+
+    Concurrent uploads of the same workbook wait for a single parse;
+    on_progress is passed to the loader of the one that parses it.
+    """
+    digest = digest or workbook_digest(data)
+    with _lock:
+        master = _workbooks.get(digest)
+        if master is not None:
+            _workbooks.move_to_end(digest)
+            return master
+        loading = _loading.setdefault(digest, threading.Lock())
+    with loading:
+        with _lock:
+            master = _workbooks.get(digest)
+        if master is None:
+            master = parse_workbook(bytes(data), digest, on_progress)
+            with _lock:
+                _workbooks[digest] = master
+                while len(_workbooks) > MAX_WORKBOOKS:
+                    _workbooks.popitem(last=False)
+                _loading.pop(digest, None)
+    return master
+
+
+def cached_master_data(digest):
+    """MasterData for digest if it is still loaded, else None"""
+    with _lock:
+        return _workbooks.get(digest)
@@ -0,0 +1,99 @@
+import re
+
+# --- Field Normalization ---
+# Cleans master-data columns once, when a workbook is loaded, instead of
+# repairing single values on every rerun. Excel hands back phone numbers
+# and pincodes as floats (9876543210.0), identifiers in mixed case with
+# stray spaces, and blanks as empty strings; every column is reduced to
+# clean text or None. Normalizers run per distinct value, so a column with
+# many repeats costs one call per distinct entry.
+
+DEFAULT_COUNTRY_CODE = "91"
+
+_NOT_DIGITS = re.compile(r"\D")
+_SPACES = re.compile(r"\s+")
+
+
+def text(value):
+    """Cell as stripped text; blanks, NaN and whole-number floats handled"""
+    if value is None or value != value:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    if value.endswith(".0") and value[:-2].isdigit():
+        value = value[:-2]
+    return value or None
+
+
+def phone(value):
+    """E.164 (+919876543210); 10-digit numbers get DEFAULT_COUNTRY_CODE.
+
+    Anything that doesn't look like a phone number is kept as plain text.
+    """
+    value = text(value)
+    if value is None:
+        return None
+    digits = _NOT_DIGITS.sub("", value)
+    if value.startswith("+") and 8 <= len(digits) <= 15:
+        return "+" + digits
+    if digits.startswith("00") and 10 <= len(digits) <= 17:
+        return "+" + digits[2:]
+    digits = digits.lstrip("0")
+    if len(digits) == 10:
+        return "+" + DEFAULT_COUNTRY_CODE + digits
+    if len(digits) == 10 + len(DEFAULT_COUNTRY_CODE) and digits.startswith(DEFAULT_COUNTRY_CODE):
+        return "+" + digits
+    return value
+
+
+def _identifier(value):
+    value = text(value)
+    return _SPACES.sub("", value).upper() if value is not None else None
+
+
+def gstin(value):
+    """Upper-case GSTIN without spaces"""
+    return _identifier(value)
+
+
+def pan(value):
+    """Upper-case PAN without spaces"""
+    return _identifier(value)
+
+
+def msme(value):
+    """Upper-case Udyam registration number without spaces"""
+    return _identifier(value)
+
+
+def email(value):
+    """Stripped address with the domain in lower case"""
+    value = text(value)
+    if value is None:
+        return None
+    if value.lower().startswith("mailto:"):
+        value = value[7:]
+    local, at, domain = value.strip().rpartition("@")
+    return f"{local}@{domain.lower()}" if at else value
+
+
+def pincode(value):
+    """Six-digit pincode as text"""
+    value = text(value)
+    if value is None:
+        return None
+    digits = _NOT_DIGITS.sub("", value)
+    return digits if len(digits) == 6 else value
+
+
+def normalize_column(values, normalizer=text):
+    """normalizer applied to a whole column, once per distinct value"""
+    done = {}
+    out = []
+    for value in values:
+        try:
+            out.append(done[value])
+        except KeyError:
+            out.append(done.setdefault(value, normalizer(value)))
+    return tuple(out)
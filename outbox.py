@@ -0,0 +1,489 @@
+import argparse
+import asyncio
+import json
+import os
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+from document_store import DocumentStore, connect, ensure_schema, kind_of
+from job_queue import runner_alive, runner_id
+
+# --- Email Outbox ---
+# Generated PDFs are queued for sending with their recipients in the
+# document store database (the attachment is read from the stored PDF at
+# send time). send_pending() delivers due messages over a small pool of SMTP
+# connections that are kept open and reused, paced by a token-bucket rate
+# limit. Temporary failures (4xx, dropped connections) are retried with
+# backoff; permanent ones (5xx) fail the message. A claimed message records
+# its sender process and claim time; another sender (the app's background
+# thread, the CLI, a second app process) only takes it back once that
+# process has exited or the claim is older than OUTBOX_LEASE_SECONDS. The
+# app's sender thread stays alive while retries are scheduled, sleeping until
+# the earliest one is due (or until another message is queued).
+#
+#   python outbox.py sink --port 8025     local stand-in server, saves .eml files
+#   SMTP_PORT=8025 python outbox.py send
+#   python outbox.py status
+
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "25"))
+SMTP_USER = os.environ.get("SMTP_USER", "")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "0") == "1"
+SMTP_SENDER = os.environ.get("SMTP_SENDER", "")  # default: the sales person's address
+SMTP_CONNECTIONS = int(os.environ.get("SMTP_CONNECTIONS", "2"))
+SMTP_RATE_PER_MINUTE = float(os.environ.get("SMTP_RATE_PER_MINUTE", "60"))
+SMTP_TIMEOUT = 30
+MESSAGES_PER_CONNECTION = 100  # reconnect after this many, as many servers require
+IDLE_SECONDS = 60  # connections unused for longer are checked with NOOP first
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", "900"))
+
+QUEUED, SENDING, SENT, FAILED = "queued", "sending", "sent", "failed"
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES documents(id),
+    sender TEXT NOT NULL,
+    recipients TEXT NOT NULL,
+    cc TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    claimed_by TEXT,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, not_before);
+"""
+
+SUBJECTS = {
+    "quotation": "Quotation {number} from CM Infotech",
+    "po": "Purchase Order {number} from CM Infotech",
+    "invoice": "Tax Invoice {number} from CM Infotech",
+}
+BODY = """Dear {contact},
+
+Please find attached {label} {number}.
+
+Regards,
+{signature}
+"""
+
+
+def default_recipients(document):
+    """(to, cc) addresses taken from the document itself"""
+    kind = kind_of(document)
+    if kind == "quotation":
+        return [document.vendor_email], []
+    if kind == "po":
+        return [document.vendor_email], []
+    return [document.buyer.email], []
+
+
+def _addresses(values):
+    return [value.strip() for value in values if value and "@" in value]
+
+
+class RateLimiter:
+    """Token bucket: rate_per_minute on average, bursts of up to burst"""
+
+    def __init__(self, rate_per_minute, burst=5):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class _Connection:
+    __slots__ = ("smtp", "sent", "last_used")
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SmtpPool:
+    """Up to size open SMTP connections, handed out one per send"""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, user=SMTP_USER, password=SMTP_PASSWORD,
+                 starttls=SMTP_STARTTLS, size=SMTP_CONNECTIONS):
+        self.host, self.port = host, port
+        self.user, self.password = user, password
+        self.starttls = starttls
+        self._idle = queue.LifoQueue()
+        self.size = size
+        self._slots = threading.BoundedSemaphore(size)
+        self.opened = 0
+
+    def _open(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        if self.starttls:
+            smtp.starttls(context=ssl.create_default_context())
+        if self.user:
+            smtp.login(self.user, self.password)
+        self.opened += 1
+        return _Connection(smtp)
+
+    def _get(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+        if time.monotonic() - conn.last_used > IDLE_SECONDS:
+            try:
+                if conn.smtp.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected("NOOP failed")
+            except (smtplib.SMTPException, OSError):
+                self._discard(conn)
+                return self._open()
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.smtp.close()
+
+    def send(self, message):
+        """Send an EmailMessage on a pooled connection (reconnects once if it was dropped)"""
+        with self._slots:
+            conn = self._get()
+            try:
+                try:
+                    conn.smtp.send_message(message)
+                except smtplib.SMTPServerDisconnected:
+                    self._discard(conn)
+                    conn = self._open()
+                    conn.smtp.send_message(message)
+            except BaseException:
+                self._discard(conn)
+                raise
+            conn.sent += 1
+            conn.last_used = time.monotonic()
+            if conn.sent >= MESSAGES_PER_CONNECTION:
+                self._discard(conn)
+            else:
+                self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+def is_temporary(error):
+    """True for errors worth retrying later"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+class Outbox:
+    """Queued emails with stored PDFs attached"""
+
+    def __init__(self, path=None):
+        self.store = DocumentStore(path)
+        ensure_schema(self.conn, self.store.path, OUTBOX_SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(outbox)")}
+        for column, kind in (("claimed_by", "TEXT"), ("claimed_at", "REAL")):
+            if column not in columns:  # outbox tables created before claims were recorded
+                self.conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {kind}")
+
+    @property
+    def conn(self):
+        return connect(self.store.path)
+
+    def enqueue(self, document_id, to, cc=(), sender="", subject="", body="", contact=""):
+        """Queue a stored document for sending; returns the message id.
+
+        subject and body default to the document kind's templates.
+        """
+        document = self.store.get(document_id)
+        if document is None:
+            raise KeyError(f"No stored document {document_id}")
+        to, cc = _addresses(to), _addresses(cc)
+        if not to:
+            raise ValueError("No valid recipient address")
+        sender = sender or SMTP_SENDER
+        if not sender:
+            raise ValueError("No sender address (set SMTP_SENDER)")
+        kind = kind_of(document)
+        number = self.conn.execute("SELECT number FROM documents WHERE id = ?", (document_id,)).fetchone()[0]
+        label = {"quotation": "our quotation", "po": "purchase order", "invoice": "tax invoice"}[kind]
+        subject = subject or SUBJECTS[kind].format(number=number)
+        contact = contact or {"quotation": getattr(document, "vendor_contact", ""),
+                              "po": getattr(document, "vendor_contact", "")}.get(kind) or "Sir/Madam"
+        body = body or BODY.format(contact=contact, label=label, number=number,
+                                   signature="CM Infotech")
+        return self.conn.execute(
+            "INSERT INTO outbox (document_id, sender, recipients, cc, subject, body, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) RETURNING id",
+            (document_id, sender, json.dumps(to), json.dumps(cc), subject, body,
+             time.time())).fetchone()[0]
+
+    def message(self, row):
+        """EmailMessage for an outbox row (id, document_id, sender, recipients, cc, subject, body)"""
+        _, document_id, sender, recipients, cc, subject, body = row
+        opened = self.store.open_pdf(document_id)
+        if opened is None:
+            raise KeyError(f"Stored document {document_id} has no PDF")
+        filename, size, blob = opened
+        with blob:
+            data = blob.read()
+        message = EmailMessage()
+        message["From"] = sender
+        message["To"] = ", ".join(json.loads(recipients))
+        if json.loads(cc):
+            message["Cc"] = ", ".join(json.loads(cc))
+        message["Subject"] = subject
+        message["Date"] = formatdate(localtime=True)
+        message["Message-ID"] = make_msgid(domain=sender.rpartition("@")[2] or None)
+        message.set_content(body)
+        message.add_attachment(data, maintype="application", subtype="pdf", filename=filename)
+        return message
+
+    def recover(self, lease=LEASE_SECONDS):
+        """Requeue messages whose sender died or whose claim expired; returns the count"""
+        stale = [(QUEUED, message_id, SENDING, claimed_at) for message_id, claimed_by, claimed_at in self.conn.execute(
+            "SELECT id, claimed_by, claimed_at FROM outbox WHERE status = ?", (SENDING,))
+            if not runner_alive(claimed_by) or (claimed_at or 0) < time.time() - lease]
+        self.conn.executemany("UPDATE outbox SET status = ?, claimed_by = NULL WHERE id = ? AND status = ? "
+                              "AND claimed_at IS ?", stale)
+        return len(stale)
+
+    def claim(self, limit, claimed_by=None):
+        now = time.time()
+        return self.conn.execute(
+            "UPDATE outbox SET status = ?, claimed_by = ?, claimed_at = ?, attempts = attempts + 1 "
+            "WHERE id IN (SELECT id FROM outbox WHERE status = ? AND not_before <= ? ORDER BY id LIMIT ?) "
+            "RETURNING id, document_id, sender, recipients, cc, subject, body, attempts",
+            (SENDING, claimed_by or runner_id(), now, QUEUED, now, limit)).fetchall()
+
+    def _deliver(self, pool, limiter, row):
+        limiter.acquire()
+        pool.send(self.message(row))
+
+    def send_pending(self, pool=None, limiter=None, limit=None, batch_size=20):
+        """Send due messages, one per pooled connection at a time; returns (sent, failed, retrying)"""
+        own_pool = pool is None
+        pool = pool or SmtpPool()
+        limiter = limiter or RateLimiter(SMTP_RATE_PER_MINUTE)
+        counts = {SENT: 0, FAILED: 0, QUEUED: 0}
+        # Messages left "sending" by a dead or stalled sender go out again
+        self.recover()
+        try:
+            with ThreadPoolExecutor(max_workers=pool.size) as executor:
+                while limit is None or sum(counts.values()) < limit:
+                    size = batch_size if limit is None else min(batch_size, limit - sum(counts.values()))
+                    rows = self.claim(size)
+                    if not rows:
+                        break
+                    futures = {executor.submit(self._deliver, pool, limiter, row[:-1]): row for row in rows}
+                    for future in as_completed(futures):
+                        message_id, attempts = futures[future][0], futures[future][-1]
+                        error = future.exception()
+                        if error is None:
+                            self.conn.execute("UPDATE outbox SET status = ?, sent_at = ?, error = NULL, "
+                                              "claimed_by = NULL WHERE id = ?", (SENT, time.time(), message_id))
+                            counts[SENT] += 1
+                        elif is_temporary(error) and attempts < MAX_ATTEMPTS:
+                            delay = min(BACKOFF_MAX_SECONDS, BACKOFF_SECONDS * 2 ** (attempts - 1))
+                            self.conn.execute("UPDATE outbox SET status = ?, not_before = ?, error = ?, "
+                                              "claimed_by = NULL WHERE id = ?",
+                                              (QUEUED, time.time() + delay, f"{type(error).__name__}: {error}",
+                                               message_id))
+                            counts[QUEUED] += 1
+                        else:
+                            self.conn.execute("UPDATE outbox SET status = ?, error = ?, claimed_by = NULL WHERE id = ?",
+                                              (FAILED, f"{type(error).__name__}: {error}", message_id))
+                            counts[FAILED] += 1
+        finally:
+            if own_pool:
+                pool.close()
+        return counts[SENT], counts[FAILED], counts[QUEUED]
+
+    def next_due(self):
+        """Earliest not_before of a queued message (time.time() scale), or None"""
+        return self.conn.execute("SELECT MIN(not_before) FROM outbox WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+    def counts(self):
+        """Messages per status"""
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+
+    def failures(self, limit=20):
+        return self.conn.execute(
+            "SELECT o.id, d.number, o.recipients, o.error FROM outbox o JOIN documents d ON d.id = o.document_id "
+            "WHERE o.status = ? ORDER BY o.id DESC LIMIT ?", (FAILED, limit)).fetchall()
+
+
+_sender = None
+_sender_lock = threading.Lock()
+_wake = threading.Event()
+
+
+def _keep_sending(path):
+    global _sender
+    outbox = Outbox(path)
+    while True:
+        outbox.send_pending()
+        with _sender_lock:
+            due = outbox.next_due()
+            if due is None:
+                # Decided under the lock, so a message queued now starts a new sender
+                _sender = None
+                return
+            _wake.clear()
+        _wake.wait(max(0.0, due - time.time()))
+
+
+def start_sending(path=None):
+    """Drain the outbox on a background thread (one at a time per process).
+
+    The thread keeps running until no message is queued, so retries fire
+    when their backoff ends; a running thread is woken to send new messages.
+    """
+    global _sender
+    with _sender_lock:
+        if _sender is None or not _sender.is_alive():
+            _sender = threading.Thread(target=_keep_sending, args=(path,), name="outbox", daemon=True)
+            _sender.start()
+        else:
+            _wake.set()
+    return _sender
+
+
+# --- Local SMTP stand-in ---
+
+class SinkServer:
+    """Minimal SMTP server that saves every message it accepts as .eml.
+
+    The first `reject` messages are refused with a temporary 451, to try
+    out retries.
+    """
+
+    def __init__(self, directory, reject=0):
+        self.directory = directory
+        self.reject = reject
+        self.received = 0
+        os.makedirs(directory, exist_ok=True)
+
+    async def handle(self, reader, writer):
+        reply = lambda line: writer.write(line.encode("ascii") + b"\r\n")
+        reply("220 localhost SMTP sink ready")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                verb = line.decode("latin-1").strip().split(" ", 1)[0].upper()
+                if verb in ("EHLO", "HELO"):
+                    reply("250-localhost" if verb == "EHLO" else "250 localhost")
+                    if verb == "EHLO":
+                        reply("250 8BITMIME")
+                elif verb == "DATA":
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    while True:
+                        data = await reader.readline()
+                        if data in (b".\r\n", b".\n", b""):
+                            break
+                        # RFC 5321 4.5.2: drop the leading "." the client added
+                        lines.append(data[1:] if data.startswith(b".") else data)
+                    if self.reject > 0:
+                        self.reject -= 1
+                        reply("451 Try again later")
+                        await writer.drain()
+                        continue
+                    self.received += 1
+                    path = os.path.join(self.directory, f"{time.time():.6f}_{self.received}.eml")
+                    with open(path, "wb") as f:
+                        f.writelines(lines)
+                    reply("250 OK: queued")
+                elif verb == "QUIT":
+                    reply("221 Bye")
+                    break
+                elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                    reply("250 OK")
+                else:
+                    reply("502 Command not implemented")
+                await writer.drain()
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def serve_sink(host, port, directory, reject=0):
+    sink = SinkServer(directory, reject)
+    server = await asyncio.start_server(sink.handle, host, port)
+    print(f"SMTP sink on {host}:{port}, saving messages to {directory}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Email outbox for generated documents")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("send", help="send every due message")
+    commands.add_parser("status", help="message counts and recent failures")
+    sink = commands.add_parser("sink", help="run a local SMTP stand-in")
+    sink.add_argument("--host", default="127.0.0.1")
+    sink.add_argument("--port", type=int, default=8025)
+    sink.add_argument("--dir", default=os.path.join("tmp", "outbox_sink"))
+    sink.add_argument("--reject", type=int, default=0, help="refuse the first N messages with 451")
+    args = parser.parse_args()
+    if args.command == "sink":
+        try:
+            asyncio.run(serve_sink(args.host, args.port, args.dir, args.reject))
+        except KeyboardInterrupt:
+            pass
+        return
+    outbox = Outbox()
+    if args.command == "send":
+        pool = SmtpPool()
+        started = time.perf_counter()
+        try:
+            sent, failed, retrying = outbox.send_pending(pool=pool)
+        finally:
+            pool.close()
+        print(f"{sent} sent, {failed} failed, {retrying} to retry, over {pool.opened} connection(s) "
+              f"in {time.perf_counter() - started:.1f}s")
+    else:
+        print(outbox.counts())
+        for message_id, number, recipients, error in outbox.failures():
+            print(f"  #{message_id} {number} -> {', '.join(json.loads(recipients))}: {error}")
+
+
+if __name__ == "__main__":
+    main()
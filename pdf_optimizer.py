@@ -0,0 +1,112 @@
+import hashlib
+import math
+import os
+import tempfile
+import threading
+
+from PIL import Image
+
+# --- PDF Size Optimizer ---
+# Logos and stamps are uploaded at camera/scanner resolution but print only
+# 20-50 mm wide. Before FPDF embeds an image it is resampled to TARGET_DPI at
+# its printed width and written to a content-addressed file, so the same
+# picture is parsed and embedded once per document no matter how many pages
+# or which upload path it came from. Content streams are always compressed.
+
+TARGET_DPI = int(os.environ.get("PDF_IMAGE_DPI", "200"))
+JPEG_QUALITY = int(os.environ.get("PDF_IMAGE_QUALITY", "85"))
+IMAGE_CACHE_DIR = os.environ.get("PDF_IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pdf_images"))
+MM_PER_INCH = 25.4
+
+_digest_cache = {}
+_optimized_cache = {}
+_lock = threading.Lock()
+
+
+def file_digest(path):
+    """sha256 of a file's contents, memoized on (path, size, mtime)"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _digest_cache.get(key)
+    if digest is None:
+        with open(path, "rb") as fh:
+            digest = hashlib.sha256(fh.read()).hexdigest()
+        _digest_cache[key] = digest
+    return digest
+
+
+def target_pixels(print_mm, dpi=TARGET_DPI):
+    """Pixels needed to print print_mm wide at dpi"""
+    return max(1, int(math.ceil(print_mm / MM_PER_INCH * dpi)))
+
+
+def _print_width(size, w, h):
+    """Printed width in mm from the w/h passed to FPDF.image (0 = auto)"""
+    if w:
+        return w
+    if h:
+        return h * size[0] / float(size[1])
+    return None
+
+
+def optimized_image(path, w=0, h=0, dpi=TARGET_DPI):
+    """Path of a copy of path resampled for its printed size.
+
+    Returns the original path when the file can't be read or is already no
+    larger than needed and already a JPEG.
+    """
+    try:
+        digest = file_digest(path)
+        with Image.open(path) as img:
+            size, fmt, mode = img.size, img.format, img.mode
+    except (OSError, ValueError):
+        return path
+    print_mm = _print_width(size, w, h)
+    width = min(size[0], target_pixels(print_mm, dpi)) if print_mm else size[0]
+    if width == size[0] and fmt == "JPEG" and mode in ("RGB", "L"):
+        return path
+
+    key = (digest, width)
+    cached = _optimized_cache.get(key)
+    if cached and os.path.exists(cached):
+        return cached
+    with _lock:
+        cached = _optimized_cache.get(key)
+        if cached and os.path.exists(cached):
+            return cached
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        out_path = os.path.join(IMAGE_CACHE_DIR, f"{digest[:32]}_{width}.jpg")
+        if not os.path.exists(out_path):
+            with Image.open(path) as img:
+                if img.mode in ("RGBA", "LA", "P"):
+                    # Flatten transparency onto the white page
+                    img = img.convert("RGBA")
+                    background = Image.new("RGB", img.size, (255, 255, 255))
+                    background.paste(img, mask=img.split()[-1])
+                    img = background
+                elif img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                if width != img.size[0]:
+                    height = max(1, int(round(img.size[1] * width / float(img.size[0]))))
+                    img = img.resize((width, height), Image.LANCZOS)
+                # Write then rename so concurrent readers never see half a file
+                tmp_path = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                img.save(tmp_path, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+                os.replace(tmp_path, out_path)
+        _optimized_cache[key] = out_path
+        return out_path
+
+
+class PdfOptimizerMixin:
+    """FPDF mixin: resampled, content-addressed images and compressed streams"""
+
+    def image(self, name, x=None, y=None, w=0, h=0, type='', link=''):
+        if name and os.path.exists(name):
+            name = optimized_image(name, w, h)
+            type = ''
+        return super().image(name, x, y, w, h, type, link)
+
+    def _enddoc(self):
+        # Page streams are compressed while the document is written out
+        self.set_compression(True)
+        return super()._enddoc()
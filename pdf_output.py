@@ -0,0 +1,71 @@
+import datetime
+import hashlib
+import json
+import os
+
+# --- Deterministic PDF Output ---
+# FPDF numbers objects in insertion order (fonts and images by first use),
+# so for the same payload the only varying bytes are the /CreationDate in the
+# info dictionary. In deterministic mode that date is taken from the
+# document's own date (or a fixed epoch), so identical payloads give
+# identical bytes and can be deduplicated by content hash.
+
+FIXED_CREATION_DATE = datetime.datetime(2000, 1, 1)
+DOCUMENT_DATE_FORMATS = ("%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y")
+PRODUCER = "PyFPDF 1.7.2 http://pyfpdf.googlecode.com/"
+
+
+def canonical_json(payload):
+    """Stable byte encoding of a payload: sorted keys, no whitespace"""
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def payload_digest(payload, *files):
+    """sha256 of a payload plus the contents of any image files it renders"""
+    digest = hashlib.sha256(canonical_json(payload))
+    for path in files:
+        if path and os.path.exists(path):
+            with open(path, "rb") as fh:
+                digest.update(hashlib.sha256(fh.read()).digest())
+        else:
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def pdf_digest(pdf_bytes):
+    """sha256 of rendered PDF bytes"""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def document_creation_date(date_text):
+    """Creation date derived from the document date, or the fixed epoch"""
+    if isinstance(date_text, (datetime.date, datetime.datetime)):
+        return datetime.datetime(date_text.year, date_text.month, date_text.day)
+    for fmt in DOCUMENT_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(str(date_text).strip(), fmt)
+        except ValueError:
+            continue
+    return FIXED_CREATION_DATE
+
+
+class DeterministicMixin:
+    """FPDF mixin: set creation_date to pin the /CreationDate entry"""
+    creation_date = None
+
+    def _putinfo(self):
+        if self.creation_date is None:
+            return super()._putinfo()
+        self._out('/Producer ' + self._textstring(PRODUCER))
+        for key in ('title', 'subject', 'author', 'keywords', 'creator'):
+            if hasattr(self, key):
+                self._out('/%s %s' % (key.capitalize(), self._textstring(getattr(self, key))))
+        self._out('/CreationDate ' + self._textstring('D:' + self.creation_date.strftime('%Y%m%d%H%M%S')))
+
+
+def pdf_to_bytes(pdf):
+    """Finish an FPDF document and return its bytes"""
+    output = pdf.output(dest="S")
+    if isinstance(output, str):
+        return output.encode("latin-1")
+    return bytes(output)
@@ -0,0 +1,238 @@
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+from pdf_output import payload_digest
+from unicode_fonts import FALLBACK_FONT, FONT_FAMILIES
+
+# --- Raster Preview ---
+# A preview runs the normal builder but stops before FPDF writes the file.
+# The builder's page content streams (FPDF's draw ops: rectangles, lines,
+# text runs, including justified TJ arrays and Tw word spacing, images) are
+# then painted onto a PIL canvas at screen
+# resolution. Nothing here touches document number sequences. PNGs are
+# cached by payload hash, so an unchanged form costs a dictionary lookup.
+
+PREVIEW_DPI = 96
+PREVIEW_CACHE_SIZE = 32
+PAGE_GAP = 12
+GAP_COLOR = (200, 200, 200)
+
+_TOKEN = re.compile(rb"\((?:\\.|[^\\)])*\)|/[^\s/\[\]()]+|\[|\]|[-+]?(?:\d+\.?\d*|\.\d+)|[A-Za-z*']+", re.S)
+_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+
+_preview_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def finish_pages(pdf):
+    """Close the last page (footer, page-count alias) without writing the PDF.
+
+    Passed to a builder as finish=, so it returns the FPDF object instead of
+    bytes.
+    """
+    if pdf.state != 3:
+        if pdf.page == 0:
+            pdf.add_page()
+        pdf.in_footer = 1
+        pdf.footer()
+        pdf.in_footer = 0
+        pdf._endpage()
+        alias = getattr(pdf, "str_alias_nb_pages", "")
+        if alias:
+            total = str(pdf.page)
+            wide_alias = alias.encode("utf-16-be").decode("latin-1")
+            wide_total = total.encode("utf-16-be").decode("latin-1")
+            for n in range(1, pdf.page + 1):
+                pdf.pages[n] = pdf.pages[n].replace(wide_alias, wide_total).replace(alias, total)
+        pdf.state = 3
+    return pdf
+
+
+def _unescape(raw):
+    out, i = bytearray(), 0
+    while i < len(raw):
+        ch = raw[i:i + 1]
+        if ch == b"\\" and i + 1 < len(raw):
+            nxt = raw[i + 1:i + 2]
+            out += _ESCAPES.get(nxt, nxt)
+            i += 2
+        else:
+            out += ch
+            i += 1
+    return bytes(out)
+
+
+@lru_cache(maxsize=128)
+def _truetype(path, size_px):
+    return ImageFont.truetype(path, max(1, size_px))
+
+
+class _PageCanvas:
+    """Interprets one FPDF page stream onto a PIL image"""
+
+    def __init__(self, pdf, w_pt, h_pt, dpi):
+        self.pdf = pdf
+        self.scale = dpi / 72.0
+        self.h_pt = h_pt
+        self.image = Image.new("RGB", (int(round(w_pt * self.scale)), int(round(h_pt * self.scale))), "white")
+        self.draw = ImageDraw.Draw(self.image)
+        self.fonts = {"/F%d" % f["i"]: f for f in pdf.fonts.values()}
+        self.images = {"/I%d" % info["i"]: name for name, info in pdf.images.items()}
+
+    def _xy(self, x, y):
+        return (x * self.scale, (self.h_pt - y) * self.scale)
+
+    def _font(self, name, size):
+        font = self.fonts.get(name, {})
+        path = font.get("ttffile") or FONT_FAMILIES[FALLBACK_FONT][""]
+        return _truetype(path, int(round(size * self.scale))), font.get("type") == "TTF"
+
+    def paint(self, stream):
+        state = {"fill": (0, 0, 0), "stroke": (0, 0, 0), "lw": 1.0, "cm": None, "tw": 0.0}
+        stack, path, operands = [], [], []
+        font, pos = None, (0.0, 0.0)
+        for token in _TOKEN.findall(stream):
+            # Operands: strings stay bytes, names become str, numbers float
+            head = token[:1]
+            if head == b"(":
+                operands.append(_unescape(token[1:-1]))
+                continue
+            if head in b"/[]":
+                operands.append(token.decode("latin-1"))
+                continue
+            if head.isdigit() or head in b"-+.":
+                operands.append(float(token))
+                continue
+            op = token.decode("latin-1")
+            nums = [t for t in operands if isinstance(t, float)]
+            if op == "q":
+                stack.append(dict(state))
+            elif op == "Q":
+                state = stack.pop() if stack else state
+            elif op in ("g", "G"):
+                grey = int(round(nums[-1] * 255))
+                state["fill" if op == "g" else "stroke"] = (grey, grey, grey)
+            elif op in ("rg", "RG"):
+                state["fill" if op == "rg" else "stroke"] = tuple(int(round(v * 255)) for v in nums[-3:])
+            elif op == "w":
+                state["lw"] = nums[-1]
+            elif op == "m":
+                path.append([self._xy(*nums[-2:])])
+            elif op == "l" and path:
+                path[-1].append(self._xy(*nums[-2:]))
+            elif op == "re":
+                x, y, w, h = nums[-4:]
+                (x0, y0), (x1, y1) = self._xy(x, y), self._xy(x + w, y + h)
+                path.append(("rect", (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))))
+            elif op in ("S", "f", "B", "f*", "B*", "n"):
+                self._paint_path(path, state, fill=op[0] in "fB", stroke=op[0] in "SB")
+                path = []
+            elif op == "cm":
+                state["cm"] = nums[-6:]
+            elif op == "Do":
+                self._paint_image(operands[-1], state["cm"])
+            elif op == "Tf":
+                font = operands[-2], nums[-1]
+            elif op == "Td":
+                pos = tuple(nums[-2:])
+            elif op == "Tw":
+                state["tw"] = nums[-1]
+            elif op == "Tj" and font:
+                self._show(operands[-1:], font, pos, state)
+            elif op == "TJ" and font:
+                self._show([t for t in operands if not isinstance(t, str)], font, pos, state)
+            operands = []
+        return self.image
+
+    def _show(self, items, font, pos, state):
+        # Text runs and TJ offsets (thousandths of the font size; positive moves left)
+        pil_font, unicode_font = self._font(*font)
+        size = font[1]
+        x, y = pos
+        for item in items:
+            if isinstance(item, float):
+                x -= item / 1000 * size
+                continue
+            text = item.decode("utf-16-be", "replace") if unicode_font else item.decode("latin-1")
+            # Tw widens every single-byte space (unicode fonts justify with TJ instead)
+            pieces = text.split(" ") if state["tw"] and not unicode_font else [text]
+            for i, piece in enumerate(pieces):
+                if i:
+                    piece = " " + piece
+                    x += state["tw"]
+                self.draw.text(self._xy(x, y), piece, fill=state["fill"], font=pil_font, anchor="ls")
+                x += pil_font.getlength(piece) / self.scale
+
+    def _paint_path(self, path, state, fill, stroke):
+        width = max(1, int(round(state["lw"] * self.scale)))
+        for shape in path:
+            if isinstance(shape, tuple):
+                box = shape[1]
+                self.draw.rectangle(box, fill=state["fill"] if fill else None,
+                                    outline=state["stroke"] if stroke else None, width=width if stroke else 0)
+            elif len(shape) > 1:
+                if fill:
+                    self.draw.polygon(shape, fill=state["fill"])
+                if stroke:
+                    self.draw.line(shape, fill=state["stroke"], width=width)
+
+    def _paint_image(self, name, cm):
+        path = self.images.get(name)
+        if not cm or not path or not os.path.exists(path):
+            return
+        w, _, _, h, x, y = cm
+        left, top = self._xy(x, y + h)
+        size = (max(1, int(round(w * self.scale))), max(1, int(round(h * self.scale))))
+        with Image.open(path) as img:
+            self.image.paste(img.convert("RGB").resize(size, Image.LANCZOS), (int(round(left)), int(round(top))))
+
+
+def rasterize(pdf, dpi=PREVIEW_DPI):
+    """One PIL image per page of a finished (but unwritten) FPDF document"""
+    pages = []
+    for n in range(1, pdf.page + 1):
+        w_pt, h_pt = pdf.fw_pt, pdf.fh_pt
+        if pdf.orientation_changes.get(n):
+            w_pt, h_pt = h_pt, w_pt
+        pages.append(_PageCanvas(pdf, w_pt, h_pt, dpi).paint(pdf.pages[n].encode("latin-1")))
+    return pages
+
+
+def stack_pages(pages):
+    """Pages stacked vertically on one canvas, separated by a grey gap"""
+    width = max(page.width for page in pages)
+    height = sum(page.height for page in pages) + PAGE_GAP * (len(pages) - 1)
+    sheet = Image.new("RGB", (width, height), GAP_COLOR)
+    y = 0
+    for page in pages:
+        sheet.paste(page, (0, y))
+        y += page.height + PAGE_GAP
+    return sheet
+
+
+def preview_png(builder, payload, *images, dpi=PREVIEW_DPI):
+    """PNG preview of builder(payload, *images), cached by payload hash.
+
+    builder is one of the create_*_pdf functions; it must accept finish=.
+    """
+    key = (builder.__name__, dpi, payload_digest(payload, *images))
+    with _lock:
+        png = _preview_cache.get(key)
+        if png is not None:
+            _preview_cache.move_to_end(key)
+            return png
+    pdf = builder(dict(payload), *images, finish=finish_pages)
+    buffer = io.BytesIO()
+    stack_pages(rasterize(pdf, dpi)).save(buffer, format="PNG", optimize=False)
+    png = buffer.getvalue()
+    with _lock:
+        _preview_cache[key] = png
+        while len(_preview_cache) > PREVIEW_CACHE_SIZE:
+            _preview_cache.popitem(last=False)
+    return png
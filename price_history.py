@@ -0,0 +1,106 @@
+import datetime
+import os
+import re
+
+from document_store import DocumentStore
+
+# --- Vendor Price History ---
+# What each vendor charged for a product, from the stored POs. The full
+# history is read from document_lines through its (kind, product, vendor,
+# doc_date) index; the latest unit price per product and vendor is kept
+# precomputed in the vendor_prices table, which DocumentStore.put refreshes
+# for just the (product, vendor) pairs of the PO it stores. A suggestion for
+# a whole PO is therefore one lookup on vendor_prices, not a history scan.
+# Prices are basic (pre-GST) unit prices.
+#
+#   python price_history.py "GstarCAD Professional" [--history]
+
+RECENT_DAYS = int(os.environ.get("PRICE_RECENT_DAYS", "365"))
+
+_SPACES = re.compile(r"\s+")
+
+
+def _product(name):
+    # The product label document_lines stores for a line's name
+    return _SPACES.sub(" ", str(name or "")).strip()
+
+
+def _since(recent_days, today=None):
+    if not recent_days:
+        return None
+    return ((today or datetime.date.today()) - datetime.timedelta(days=recent_days)).isoformat()
+
+
+def latest_prices(products, recent_days=RECENT_DAYS, path=None):
+    """{product: [{vendor, unit_price, quantity, doc_date, number}]}, cheapest first.
+
+    Only each vendor's latest PO for the product counts, and only if it is
+    dated within recent_days (0 or None for any date).
+    """
+    names = {}  # stored product label -> the names asked for
+    for name in set(products):
+        if _product(name):
+            names.setdefault(_product(name), []).append(name)
+    if not names:
+        return {}
+    store = DocumentStore(path)
+    store.ensure_rollups()
+    sql = ("SELECT p.product, p.vendor, p.unit_price, p.quantity, p.doc_date, d.number FROM vendor_prices p "
+           f"JOIN documents d ON d.id = p.doc_id WHERE p.product IN ({', '.join('?' * len(names))})")
+    args = list(names)
+    since = _since(recent_days)
+    if since:
+        sql += " AND p.doc_date >= ?"
+        args.append(since)
+    result = {}
+    for product, vendor, unit_price, quantity, doc_date, number in store.conn.execute(
+            sql + " ORDER BY p.product, p.unit_price, p.doc_date DESC", args):
+        row = {"vendor": vendor, "unit_price": round(unit_price, 2), "quantity": quantity, "doc_date": doc_date,
+               "number": number}
+        for name in names[product]:
+            result.setdefault(name, []).append(row)
+    return result
+
+
+def cheapest_vendor(product, recent_days=RECENT_DAYS, path=None):
+    """The cheapest latest-price row for a product, or None"""
+    offers = latest_prices((product,), recent_days, path).get(product)
+    return offers[0] if offers else None
+
+
+def price_history(product, vendor=None, since=None, path=None):
+    """[{doc_date, vendor, unit_price, quantity, number}] for a product, newest first"""
+    store = DocumentStore(path)
+    store.ensure_rollups()
+    sql = ("SELECT l.doc_date, l.vendor, l.amount / l.quantity, l.quantity, d.number FROM document_lines l "
+           "JOIN documents d ON d.id = l.doc_id WHERE l.kind = 'po' AND l.product = ? AND l.quantity > 0")
+    args = [_product(product)]
+    if vendor:
+        sql += " AND l.vendor = ?"
+        args.append(vendor)
+    if since:
+        sql += " AND l.doc_date >= ?"
+        args.append(since)
+    return [{"doc_date": doc_date, "vendor": vendor, "unit_price": round(unit_price, 2), "quantity": quantity,
+             "number": number}
+            for doc_date, vendor, unit_price, quantity, number in store.conn.execute(
+                sql + " ORDER BY l.doc_date DESC, l.doc_id DESC", args)]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Latest vendor prices and price history for a product")
+    parser.add_argument("product")
+    parser.add_argument("--days", type=int, default=RECENT_DAYS, help="recent window for latest prices (0: any)")
+    parser.add_argument("--history", action="store_true", help="list every PO line for the product")
+    parser.add_argument("--vendor", help="history of one vendor only")
+    parser.add_argument("--db", help="document store path")
+    args = parser.parse_args()
+    for row in latest_prices((args.product,), args.days, args.db).get(args.product, []):
+        print(f"{row['vendor'][:40]:<42}{row['unit_price']:>14,.2f}  {row['doc_date']}  {row['number']}")
+    if args.history:
+        print()
+        for row in price_history(args.product, args.vendor, path=args.db):
+            print(f"{row['doc_date']}  {row['vendor'][:40]:<42}{row['unit_price']:>14,.2f}"
+                  f"{row['quantity']:>6g}  {row['number']}")
@@ -0,0 +1,264 @@
+import datetime
+import os
+import sqlite3
+import threading
+
+from document_store import DocumentStore, ensure_schema
+from margin_report import customer_key, product_key
+
+# --- PO / Invoice Reconciliation ---
+# Every invoice line to an end user should have a PO line to a vendor for
+# the same customer (the PO's end_company), product and quantity. Lines of
+# both kinds are copied into recon_lines with their normalized customer and
+# product keys. Lines only ever match within their (customer_key,
+# product_key) group, read through the (kind, customer_key, product_key)
+# index, so a run touches the groups of new lines and nothing else.
+#
+# Runs are incremental: only documents stored (or re-generated) since the
+# last run's watermark are read. A re-generated document drops its old
+# lines. Every group that gained or lost a line is matched again from
+# scratch, so the result depends only on the lines in the group, never on
+# the order documents arrived in: an incremental run and a run over a fresh
+# store agree.
+#
+# Tolerance rules: a pair matches when the PO is dated within
+# RECON_DATE_WINDOW_DAYS of the invoice and the quantities differ by at
+# most RECON_QTY_TOLERANCE units. In-tolerance pairs are made first
+# (invoices in date order, each taking its closest PO); remaining lines
+# then pair up as quantity mismatches. Lines left open are reported as
+# "no PO" (invoices) or "no invoice" (POs).
+#
+# The app reconciles on a background thread (start_reconciling) after it
+# stores a document, so the dashboard only reads the results.
+#
+#   python reconciliation.py run | status | list [--status "no PO"]
+
+DATE_WINDOW_DAYS = int(os.environ.get("RECON_DATE_WINDOW_DAYS", "90"))
+QTY_TOLERANCE = float(os.environ.get("RECON_QTY_TOLERANCE", "0"))
+
+MATCHED = "matched"
+QTY_MISMATCH = "quantity mismatch"
+NO_PO = "no PO"
+NO_INVOICE = "no invoice"
+OPEN = {"invoice": NO_PO, "po": NO_INVOICE}
+VERSION = "2"  # bump to re-match every group on the next run
+
+RECON_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recon_lines (
+    doc_id INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    doc_date TEXT,
+    customer_key TEXT NOT NULL,
+    product_key TEXT NOT NULL,
+    quantity REAL NOT NULL,
+    status TEXT NOT NULL,
+    match_doc INTEGER,
+    match_line INTEGER,
+    PRIMARY KEY (doc_id, line)
+);
+CREATE INDEX IF NOT EXISTS recon_lines_open ON recon_lines (kind, customer_key, product_key, status);
+CREATE INDEX IF NOT EXISTS recon_lines_status ON recon_lines (status);
+CREATE INDEX IF NOT EXISTS documents_created ON documents (created_at, id);
+CREATE TABLE IF NOT EXISTS recon_state (
+    name TEXT PRIMARY KEY,
+    value
+);
+"""
+
+
+def _ordinal(iso_date):
+    return datetime.date.fromisoformat(iso_date).toordinal() if iso_date else None
+
+
+def _pairs(invoices, pos, in_tolerance):
+    # Pair open invoices (in order) with their closest open PO; pairs are removed from both lists
+    pairs = []
+    for invoice in list(invoices):
+        day, quantity = invoice[2], invoice[3]
+        candidates = [po for po in pos if (day is None or po[2] is None or abs(po[2] - day) <= DATE_WINDOW_DAYS)
+                      and (abs(po[3] - quantity) <= QTY_TOLERANCE) == in_tolerance]
+        if not candidates:
+            continue
+        best = min(candidates, key=lambda po: (abs(po[3] - quantity),
+                                               abs(po[2] - day) if day is not None and po[2] is not None else 0,
+                                               po[0], po[1]))
+        invoices.remove(invoice)
+        pos.remove(best)
+        pairs.append((invoice, best))
+    return pairs
+
+
+class Reconciler:
+    """Incremental matching of invoice lines to PO lines"""
+
+    def __init__(self, path=None):
+        self.store = DocumentStore(path)
+        ensure_schema(self.conn, self.store.path, RECON_SCHEMA)
+
+    @property
+    def conn(self):
+        return self.store.conn
+
+    def _watermark(self):
+        row = self.conn.execute("SELECT value FROM recon_state WHERE name = 'watermark'").fetchone()
+        return tuple(float(part) for part in row[0].split(":")) if row else (0.0, 0)
+
+    def _release(self, doc_id):
+        # Drop a re-generated document's lines; returns the groups they were in
+        conn = self.conn
+        groups = conn.execute("SELECT DISTINCT customer_key, product_key FROM recon_lines WHERE doc_id = ?",
+                              (doc_id,)).fetchall()
+        conn.execute("DELETE FROM recon_lines WHERE doc_id = ?", (doc_id,))
+        return groups
+
+    def _match_group(self, customer, product):
+        # Re-match one (customer, product) group from scratch; only changed rows are written
+        conn = self.conn
+        lines = {}
+        for kind in ("invoice", "po"):
+            lines[kind] = [
+                (doc_id, line, _ordinal(doc_date), quantity, (status, match_doc, match_line))
+                for doc_id, line, doc_date, quantity, status, match_doc, match_line in conn.execute(
+                    "SELECT doc_id, line, doc_date, quantity, status, match_doc, match_line FROM recon_lines "
+                    "WHERE kind = ? AND customer_key = ? AND product_key = ? ORDER BY doc_date, doc_id, line",
+                    (kind, customer, product))]
+        invoices, pos = list(lines["invoice"]), list(lines["po"])
+        result = {(row[0], row[1]): (OPEN[kind], None, None) for kind in lines for row in lines[kind]}
+        for status, in_tolerance in ((MATCHED, True), (QTY_MISMATCH, False)):
+            for invoice, po in _pairs(invoices, pos, in_tolerance):
+                result[invoice[:2]] = (status, po[0], po[1])
+                result[po[:2]] = (status, invoice[0], invoice[1])
+        conn.executemany(
+            "UPDATE recon_lines SET status = ?, match_doc = ?, match_line = ? WHERE doc_id = ? AND line = ?",
+            [(*result[row[:2]], *row[:2]) for kind in lines for row in lines[kind] if result[row[:2]] != row[4]])
+
+    def run(self):
+        """Reconcile documents stored since the last run; returns {documents, lines}"""
+        self.store.ensure_rollups()
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            created, last_id = self._watermark()
+            documents = conn.execute(
+                "SELECT id, created_at FROM documents WHERE kind IN ('invoice', 'po') "
+                "AND (created_at > ? OR (created_at = ? AND id > ?)) ORDER BY created_at, id",
+                (created, created, last_id)).fetchall()
+            groups = set()
+            lines = 0
+            for doc_id, _ in documents:
+                groups.update(self._release(doc_id))
+                rows = [(doc_id, line, kind, doc_date, customer_key(customer), product_key(product), quantity,
+                         OPEN[kind])
+                        for line, kind, doc_date, customer, product, quantity in conn.execute(
+                            "SELECT line, kind, doc_date, customer, product, quantity FROM document_lines "
+                            "WHERE doc_id = ?", (doc_id,))]
+                conn.executemany(
+                    "INSERT INTO recon_lines (doc_id, line, kind, doc_date, customer_key, product_key, quantity, status) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                groups.update((row[4], row[5]) for row in rows)
+                lines += len(rows)
+            version = conn.execute("SELECT value FROM recon_state WHERE name = 'version'").fetchone()
+            if version is None or version[0] != VERSION:
+                groups.update(conn.execute("SELECT DISTINCT customer_key, product_key FROM recon_lines"))
+                conn.execute("INSERT OR REPLACE INTO recon_state (name, value) VALUES ('version', ?)", (VERSION,))
+            for customer, product in sorted(groups):
+                self._match_group(customer, product)
+            if documents:
+                conn.execute("INSERT OR REPLACE INTO recon_state (name, value) VALUES ('watermark', ?)",
+                             (f"{documents[-1][1]!r}:{documents[-1][0]}",))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return {"documents": len(documents), "lines": lines}
+
+    def summary(self):
+        """{kind: {status: lines}}"""
+        result = {"invoice": {}, "po": {}}
+        for kind, status, lines in self.conn.execute(
+                "SELECT kind, status, COUNT(*) FROM recon_lines GROUP BY kind, status"):
+            result[kind][status] = lines
+        return result
+
+    def findings(self, statuses=(NO_PO, NO_INVOICE, QTY_MISMATCH), limit=1000):
+        """Flagged lines with document numbers: [{kind, number, doc_date, customer, product, quantity, status, match}]"""
+        rows = self.conn.execute(
+            "SELECT r.kind, d.number, r.doc_date, l.customer, l.product, r.quantity, r.status, m.number, mr.quantity "
+            "FROM recon_lines r JOIN documents d ON d.id = r.doc_id "
+            "JOIN document_lines l ON l.doc_id = r.doc_id AND l.line = r.line "
+            "LEFT JOIN documents m ON m.id = r.match_doc "
+            "LEFT JOIN recon_lines mr ON mr.doc_id = r.match_doc AND mr.line = r.match_line "
+            f"WHERE r.status IN ({', '.join('?' * len(statuses))}) "
+            "AND NOT (r.kind = 'po' AND r.status = ?) ORDER BY r.doc_date DESC, d.number LIMIT ?",
+            (*statuses, QTY_MISMATCH, limit))
+        # A mismatch is listed once, from its invoice side
+        return [{"kind": kind, "number": number, "doc_date": doc_date, "customer": customer, "product": product,
+                 "quantity": quantity, "status": status, "match": match, "match_quantity": match_quantity}
+                for kind, number, doc_date, customer, product, quantity, status, match, match_quantity in rows]
+
+
+_runner = None
+_rerun = False
+_runner_lock = threading.Lock()
+
+
+def _run(path):
+    global _runner, _rerun
+    while True:
+        try:
+            Reconciler(path).run()
+        except sqlite3.OperationalError:
+            pass  # store busy; the next start_reconciling() picks the documents up
+        with _runner_lock:
+            if not _rerun:
+                _runner = None
+                return
+            _rerun = False
+
+
+def start_reconciling(path=None):
+    """Reconcile new documents on a background thread (one at a time per process).
+
+    A call while a run is in progress makes it run once more when done.
+    """
+    global _runner, _rerun
+    with _runner_lock:
+        if _runner is not None:
+            _rerun = True
+        else:
+            _runner = threading.Thread(target=_run, args=(path,), name="reconciliation", daemon=True)
+            _runner.start()
+
+
+def is_reconciling():
+    """True while this process's background reconciliation is running"""
+    return _runner is not None
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Match invoice lines to PO lines")
+    parser.add_argument("--db", help="document store path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("run", help="reconcile documents stored since the last run")
+    commands.add_parser("status", help="line counts per kind and status")
+    listing = commands.add_parser("list", help="flagged lines")
+    listing.add_argument("--status", action="append", choices=(NO_PO, NO_INVOICE, QTY_MISMATCH))
+    args = parser.parse_args()
+
+    reconciler = Reconciler(args.db)
+    if args.command == "run":
+        started = time.perf_counter()
+        result = reconciler.run()
+        print(f"{result['documents']} documents, {result['lines']} lines in {time.perf_counter() - started:.2f} s")
+    elif args.command == "status":
+        for kind, counts in reconciler.summary().items():
+            print(kind, ", ".join(f"{status}: {lines}" for status, lines in sorted(counts.items())))
+    else:
+        for row in reconciler.findings(tuple(args.status or (NO_PO, NO_INVOICE, QTY_MISMATCH))):
+            print(f"{row['doc_date']}  {row['kind']:<8}{row['number']:<24}{row['status']:<18}"
+                  f"{row['quantity']:>6g}  {row['product'][:40]}  {row['customer'][:30]}"
+                  + (f"  <-> {row['match']} ({row['match_quantity']:g})" if row["match"] else ""))
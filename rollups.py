@@ -0,0 +1,246 @@
+import re
+
+# --- Materialized Rollups ---
+# Document counts, quantities, taxable amount, GST and totals per fiscal
+# quarter, sales person, customer and product, kept in the document store.
+# DocumentStore.put adds a document's contribution in the same transaction
+# that stores it (and takes back the old one when a number is re-generated),
+# so reading the dashboard is a lookup on a few hundred rows, never a scan
+# of the documents.
+#
+# Invoices are revenue, quotations the pipeline and POs purchases; the
+# rollups keep them apart by kind.
+#
+# document_lines holds one row per document line (customer, vendor,
+# product, quantity, amount, GST) under the same rules, so reports over a
+# date range stream plain rows instead of decoding every document.
+# vendor_prices keeps the latest PO unit price per product and vendor; a
+# stored PO refreshes only the (product, vendor) pairs it touches.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    kind TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    key TEXT NOT NULL,
+    documents INTEGER NOT NULL,
+    quantity REAL NOT NULL,
+    amount REAL NOT NULL,
+    gst REAL NOT NULL,
+    total REAL NOT NULL,
+    PRIMARY KEY (kind, dimension, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS document_lines (
+    doc_id INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    doc_date TEXT,
+    customer TEXT NOT NULL,
+    vendor TEXT,
+    product TEXT NOT NULL,
+    quantity REAL NOT NULL,
+    amount REAL NOT NULL,
+    gst REAL NOT NULL,
+    PRIMARY KEY (doc_id, line)
+);
+CREATE INDEX IF NOT EXISTS document_lines_kind_date ON document_lines (kind, doc_date);
+CREATE INDEX IF NOT EXISTS document_lines_product ON document_lines (kind, product, vendor, doc_date);
+CREATE TABLE IF NOT EXISTS vendor_prices (
+    product TEXT NOT NULL,
+    vendor TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    doc_date TEXT,
+    unit_price REAL NOT NULL,
+    quantity REAL NOT NULL,
+    PRIMARY KEY (product, vendor)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+DIMENSIONS = ("quarter", "sales_person", "customer", "product")
+VERSION = "3"  # bump to rebuild every store's derived tables on next read
+UNASSIGNED = "Unassigned"
+
+_SPACES = re.compile(r"\s+")
+_SALES_PERSON = re.compile(r"^[A-Z]+/([A-Z]{2,3})/")
+
+
+def fiscal_quarter(iso_date):
+    """"FY2025-26 Q1" for an ISO date (the fiscal year starts in April)"""
+    if not iso_date:
+        return UNASSIGNED
+    year, month = int(iso_date[:4]), int(iso_date[5:7])
+    start = year if month >= 4 else year - 1
+    return f"FY{start}-{str(start + 1)[2:]} Q{(month - 4) % 12 // 3 + 1}"
+
+
+def _label(text):
+    return _SPACES.sub(" ", str(text or "")).strip() or UNASSIGNED
+
+
+def sales_person(kind, document):
+    """Sales person code of a document ("SD", "CP", ...), or UNASSIGNED"""
+    if kind == "quotation":
+        return _label(document.sales_person_code)
+    if kind == "po":
+        match = _SALES_PERSON.match(document.po_number or "")
+        return match.group(1) if match else UNASSIGNED
+    return UNASSIGNED  # invoice numbers carry no sales person
+
+
+def customer(kind, document):
+    """The paying customer: invoice buyer, PO end user or quotation recipient"""
+    return _label({"invoice": lambda: document.buyer.name,
+                   "po": lambda: document.end_company,
+                   "quotation": lambda: document.vendor_name}[kind]())
+
+
+def lines(kind, document):
+    """[(product, quantity, amount, gst)] for a document's lines"""
+    if kind == "invoice":
+        taxable = sum(item.amount for item in document.items)
+        tax = (document.sgst or 0) + (document.cgst or 0)
+        return [(_label(item.description), item.quantity, item.amount,
+                 tax * item.amount / taxable if taxable else 0.0) for item in document.items]
+    return [(_label(p.name), p.qty, p.basic * p.qty, p.gst_amount * p.qty) for p in document.products]
+
+
+def facts(kind, doc_date, document):
+    """{(dimension, key): (documents, quantity, amount, gst, total)} for one document"""
+    items = lines(kind, document)
+    quantity = sum(item[1] for item in items)
+    amount = sum(item[2] for item in items)
+    gst = sum(item[3] for item in items)
+    whole = (1, quantity, amount, gst, amount + gst)
+    result = {
+        ("quarter", fiscal_quarter(doc_date)): whole,
+        ("sales_person", sales_person(kind, document)): whole,
+        ("customer", customer(kind, document)): whole,
+    }
+    for product, qty, line_amount, line_gst in items:
+        documents, q, a, g, t = result.get(("product", product), (0, 0.0, 0.0, 0.0, 0.0))
+        result[("product", product)] = (1, q + qty, a + line_amount, g + line_gst, t + line_amount + line_gst)
+    return result
+
+
+def apply(conn, kind, doc_date, document, sign=1):
+    """Add (sign=1) or take back (sign=-1) one document's contribution"""
+    conn.executemany(
+        "INSERT INTO rollups (kind, dimension, key, documents, quantity, amount, gst, total) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (kind, dimension, key) DO UPDATE SET documents = documents + excluded.documents, "
+        "quantity = quantity + excluded.quantity, amount = amount + excluded.amount, "
+        "gst = gst + excluded.gst, total = total + excluded.total",
+        [(kind, dimension, key, *(sign * value for value in values))
+         for (dimension, key), values in facts(kind, doc_date, document).items()])
+    if sign < 0:
+        conn.execute("DELETE FROM rollups WHERE kind = ? AND documents <= 0", (kind,))
+
+
+def index_lines(conn, doc_id, kind, doc_date, document):
+    """Replace the document_lines rows of doc_id"""
+    conn.execute("DELETE FROM document_lines WHERE doc_id = ?", (doc_id,))
+    vendor = _label(document.vendor_name) if kind == "po" else None
+    buyer = customer(kind, document)
+    conn.executemany(
+        "INSERT INTO document_lines (doc_id, line, kind, doc_date, customer, vendor, product, quantity, amount, gst) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(doc_id, i, kind, doc_date, buyer, vendor, *item) for i, item in enumerate(lines(kind, document))])
+
+
+def price_keys(kind, document):
+    """{(product, vendor)} a PO contributes to vendor_prices (empty for other kinds)"""
+    if kind != "po" or document is None:
+        return set()
+    vendor = _label(document.vendor_name)
+    return {(_label(p.name), vendor) for p in document.products}
+
+
+_LATEST_PRICE = (
+    "SELECT product, vendor, doc_id, doc_date, amount / quantity, quantity FROM document_lines "
+    "WHERE kind = 'po' AND product = ? AND vendor = ? AND quantity > 0 "
+    "ORDER BY doc_date DESC, doc_id DESC LIMIT 1")
+
+
+def refresh_prices(conn, keys):
+    """Recompute the vendor_prices rows of (product, vendor) keys from document_lines"""
+    for product, vendor in keys:
+        row = conn.execute(_LATEST_PRICE, (product, vendor)).fetchone()
+        if row is None:
+            conn.execute("DELETE FROM vendor_prices WHERE product = ? AND vendor = ?", (product, vendor))
+        else:
+            conn.execute("INSERT OR REPLACE INTO vendor_prices (product, vendor, doc_id, doc_date, unit_price, quantity) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", row)
+
+
+def iter_lines(conn, kinds, since=None, until=None, columns="kind, customer, product, quantity, amount"):
+    """Cursor over document_lines of kinds; since/until are inclusive ISO dates"""
+    sql = f"SELECT {columns} FROM document_lines WHERE kind IN ({', '.join('?' * len(kinds))})"
+    args = list(kinds)
+    if since:
+        sql += " AND doc_date >= ?"
+        args.append(since)
+    if until:
+        sql += " AND doc_date <= ?"
+        args.append(until)
+    return conn.execute(sql, args)
+
+
+def read(conn, dimension, kind="invoice"):
+    """[{key, documents, quantity, amount, gst, total}] for one dimension, largest total first"""
+    rows = conn.execute(
+        "SELECT key, documents, quantity, amount, gst, total FROM rollups "
+        "WHERE kind = ? AND dimension = ? ORDER BY total DESC, key", (kind, dimension))
+    return [{"key": key, "documents": documents, "quantity": quantity, "amount": round(amount, 2),
+             "gst": round(gst, 2), "total": round(total, 2)}
+            for key, documents, quantity, amount, gst, total in rows]
+
+
+def totals(conn, kind="invoice"):
+    """{documents, amount, gst, total} over all documents of kind"""
+    row = conn.execute("SELECT COALESCE(SUM(documents), 0), COALESCE(SUM(amount), 0), COALESCE(SUM(gst), 0), "
+                       "COALESCE(SUM(total), 0) FROM rollups WHERE kind = ? AND dimension = 'quarter'",
+                       (kind,)).fetchone()
+    return {"documents": row[0], "amount": round(row[1], 2), "gst": round(row[2], 2), "total": round(row[3], 2)}
+
+
+def touch(conn):
+    """Count one more stored document in the 'generation' row (see generation)"""
+    conn.execute("INSERT INTO rollup_meta (name, value) VALUES ('generation', 1) "
+                 "ON CONFLICT (name) DO UPDATE SET value = value + 1")
+
+
+def generation(conn):
+    """Changes whenever a document is stored; cache keys for reports over the store"""
+    row = conn.execute("SELECT value FROM rollup_meta WHERE name = 'generation'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def is_built(conn):
+    row = conn.execute("SELECT value FROM rollup_meta WHERE name = 'version'").fetchone()
+    return row is not None and row[0] == VERSION
+
+
+def rebuild(conn, documents):
+    """Recompute every derived table from (doc_id, kind, doc_date, model) rows, in one transaction"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM rollups")
+        conn.execute("DELETE FROM document_lines")
+        conn.execute("DELETE FROM vendor_prices")
+        for doc_id, kind, doc_date, document in documents:
+            apply(conn, kind, doc_date, document)
+            index_lines(conn, doc_id, kind, doc_date, document)
+        conn.execute(
+            "INSERT INTO vendor_prices (product, vendor, doc_id, doc_date, unit_price, quantity) "
+            "SELECT product, vendor, doc_id, doc_date, unit_price, quantity FROM ("
+            "  SELECT product, vendor, doc_id, doc_date, amount / quantity AS unit_price, quantity, ROW_NUMBER() "
+            "  OVER (PARTITION BY product, vendor ORDER BY doc_date DESC, doc_id DESC) AS recent "
+            "  FROM document_lines WHERE kind = 'po' AND quantity > 0) WHERE recent = 1")
+        conn.execute("INSERT OR REPLACE INTO rollup_meta (name, value) VALUES ('version', ?)", (VERSION,))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
@@ -0,0 +1,86 @@
+import json
+import os
+import subprocess
+import sys
+
+# --- Startup Budget ---
+# Checks that each app module imports within its time budget and without
+# pulling in the dependencies that lazy_imports defers. Every module is timed
+# in a fresh interpreter with streamlit already imported (the framework's own
+# cost is the same for every app and is reported separately); the best of a
+# few runs is kept to smooth out noise. An app that starts the render
+# warm-up (warmup.py) from main() is checked for deferred imports after the
+# warm-up has finished too, since that is the path a real session takes.
+# Exits non-zero on any violation so
+# it can gate a deploy:
+#
+#   python startup_budget.py
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RUNS = 3
+
+# Seconds to import each app module once streamlit is loaded
+BUDGETS = {
+    "PO_TAX_QUOT": 0.25,
+    "NEW_DEEp": 0.20,
+    "m_a_i_n": 0.20,
+    "PO_TAX_STREAm-ExcEL": 0.20,
+}
+DEFERRED = ("pandas", "num2words", "openpyxl", "xlrd")
+
+_PROBE = """
+import importlib, json, sys, time
+sys.path.insert(0, {base!r})
+started = time.perf_counter()
+import streamlit
+framework = time.perf_counter() - started
+started = time.perf_counter()
+module = importlib.import_module({module!r})
+seconds = time.perf_counter() - started
+started = time.perf_counter()
+if hasattr(module, "start_warm_up"):
+    module.start_warm_up().join()
+print(json.dumps({{"framework": framework, "seconds": seconds, "warm_up": time.perf_counter() - started,
+                  "loaded": [name for name in {deferred!r} if name in sys.modules]}}))
+"""
+
+
+def measure(module, runs=RUNS):
+    """Best-of-runs import time of module: {"framework", "seconds", "warm_up", "loaded"}"""
+    best = None
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(base=BASE_DIR, module=module, deferred=DEFERRED)],
+            capture_output=True, text=True, check=True, cwd=BASE_DIR).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+
+def check(budgets=BUDGETS):
+    """[(module, result, problems)] for every module in budgets"""
+    report = []
+    for module, budget in budgets.items():
+        result = measure(module)
+        problems = []
+        if result["seconds"] > budget:
+            problems.append(f"took {result['seconds'] * 1000:.0f} ms, budget {budget * 1000:.0f} ms")
+        if result["loaded"]:
+            problems.append(f"imported {', '.join(result['loaded'])} at startup or warm-up")
+        report.append((module, result, problems))
+    return report
+
+
+def main():
+    failed = False
+    for module, result, problems in check():
+        status = "FAIL" if problems else "ok"
+        print(f"{module:<22}{result['seconds'] * 1000:7.0f} ms  (streamlit {result['framework'] * 1000:.0f} ms)  "
+              f"{status}{': ' + '; '.join(problems) if problems else ''}")
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
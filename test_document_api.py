@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+import pytest
+
+from document_api import DocumentService, make_handler
+from document_store import DocumentStore
+from test_reconciliation import invoice
+
+
+async def send(service, request):
+    server = await asyncio.start_server(make_handler(service), "127.0.0.1", 0)
+    async with server:
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(request)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), body
+
+
+async def post(service, target, payload):
+    body = json.dumps(payload).encode("utf-8")
+    return await send(service, f"POST {target} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+                      .encode("latin-1") + body)
+
+
+def test_posted_invoice_is_stored_and_counted(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+    service = DocumentService(workers=1, queue=1, store_path=path)
+    payload = invoice("API/001", "01-04-2025", "Acme Pvt Ltd", [("GstarCAD Pro", 2, 500)]).to_dict()
+    status, body = asyncio.run(post(service, "/v1/invoice", payload))
+    service.executor.shutdown()
+    assert status == 200 and body.startswith(b"%PDF")
+    store = DocumentStore(path)
+    doc_id, document = store.find("invoice", "API/001")
+    assert store.pdf(doc_id) == body
+    assert store.rollup_totals()["documents"] == 1
+    assert store.rollup_totals()["amount"] == 1000.0
+
+
+@pytest.mark.parametrize("length", ["abc", "-5", "1.5"])
+def test_invalid_content_length_is_a_bad_request(tmp_path, length):
+    service = DocumentService(workers=1, queue=1, store_path=str(tmp_path / "store.sqlite3"))
+    request = f"POST /v1/invoice HTTP/1.1\r\nContent-Length: {length}\r\nConnection: close\r\n\r\n{{}}"
+    status, body = asyncio.run(send(service, request.encode("latin-1")))
+    service.executor.shutdown()
+    assert status == 400
+    assert json.loads(body) == {"error": "Invalid Content-Length"}
@@ -0,0 +1,31 @@
+import pytest
+
+from document_models import DocumentError
+from mail_merge import personalize
+
+ROW = {"End User Company": "Acme Pvt Ltd", "End User Contact": "R. Shah", "End User Address": "Vadodara"}
+
+
+def template(**fields):
+    return dict({"subject": "", "intro_paragraph": "", "price_validity": ""}, **fields)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Quote for {company}", "Quote for Acme Pvt Ltd"),
+    ("Dear {contact}, {company} ({address})", "Dear R. Shah, Acme Pvt Ltd (Vadodara)"),
+    ("{0} and {1}", "{0} and {1}"),
+    ("Set {a", "Set {a"),
+    ("a} b {", "a} b {"),
+    ("{company.name} {{company}}", "{company.name} {Acme Pvt Ltd}"),
+    ("{unknown} {}", "{unknown} {}"),
+])
+def test_only_known_placeholders_are_filled(text, expected):
+    payload = personalize(template(subject=text, intro_paragraph=text), ROW, "Q1")
+    assert payload["subject"] == payload["intro_paragraph"] == expected
+    assert payload["vendor_name"] == "Acme Pvt Ltd"
+    assert payload["quotation_number"] == "Q1"
+
+
+def test_non_text_template_field_is_a_document_error():
+    with pytest.raises(DocumentError):
+        personalize(template(subject=["{company}"]), ROW, "Q1")
@@ -0,0 +1,66 @@
+import asyncio
+import email
+import functools
+import glob
+import threading
+import time
+
+import pytest
+
+import outbox
+from document_store import DocumentStore
+from outbox import SENT, Outbox, SinkServer, SmtpPool, start_sending
+from test_reconciliation import invoice
+
+
+@pytest.fixture
+def sink(tmp_path):
+    """A SinkServer on its own event loop thread; yields (server, port)"""
+    server = SinkServer(str(tmp_path / "sink"))
+    loop = asyncio.new_event_loop()
+    listener = loop.run_until_complete(asyncio.start_server(server.handle, "127.0.0.1", 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield server, listener.sockets[0].getsockname()[1]
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def test_failed_send_is_retried_after_backoff(tmp_path, sink, monkeypatch):
+    server, port = sink
+    server.reject = 1
+    monkeypatch.setattr(outbox, "SmtpPool", functools.partial(SmtpPool, host="127.0.0.1", port=port))
+    monkeypatch.setattr(outbox, "BACKOFF_SECONDS", 0.5)
+    path = str(tmp_path / "store.sqlite3")
+    doc_id = DocumentStore(path).put(invoice("INV1", "01-04-2025", "Acme Pvt Ltd", [("GstarCAD Pro", 1, 100)]),
+                                     b"%PDF-1.4 test")
+    box = Outbox(path)
+    box.enqueue(doc_id, ["buyer@example.com"], sender="sales@example.com")
+
+    start_sending(path)
+    deadline = time.time() + 10
+    while box.counts().get(SENT) != 1 and time.time() < deadline:
+        time.sleep(0.05)
+    assert box.counts() == {SENT: 1}
+    assert box.conn.execute("SELECT attempts FROM outbox").fetchone()[0] == 2
+    assert server.received == 1 and server.reject == 0
+
+
+def test_sink_removes_the_leading_dot_of_data_lines(sink):
+    server, port = sink
+
+    async def session():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await reader.readline()
+        for command in (b"HELO test", b"MAIL FROM:<a@example.com>", b"RCPT TO:<b@example.com>", b"DATA"):
+            writer.write(command + b"\r\n")
+            await reader.readline()
+        writer.write(b"Subject: dots\r\n\r\n.single\r\n..double\r\nplain\r\n.\r\nQUIT\r\n")
+        await writer.drain()
+        await reader.read()
+        writer.close()
+
+    asyncio.run(session())
+    [path] = glob.glob(f"{server.directory}/*.eml")
+    with open(path, "rb") as f:
+        assert email.message_from_bytes(f.read()).get_payload() == "single\r\n.double\r\nplain\r\n"
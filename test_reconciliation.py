@@ -0,0 +1,73 @@
+import random
+
+from document_models import Invoice, PurchaseOrder
+from document_store import DocumentStore
+from reconciliation import MATCHED, NO_INVOICE, QTY_MISMATCH, Reconciler
+
+
+def invoice(number, date, customer, lines):
+    basic = sum(quantity * rate for _, quantity, rate in lines)
+    return Invoice.from_dict({
+        "invoice": {"invoice_no": number, "date": date},
+        "Reference": {"Suppliers_Reference": "NA", "Other": "NA"},
+        "vendor": {"name": "CM Infotech", "address": "Ahmedabad", "gst": "24ANMPP4891R1ZX", "msme": ""},
+        "buyer": {"name": customer, "address": "Vadodara", "gst": "NA"},
+        "invoice_details": {"buyers_order_no": "Online", "buyers_order_date": date, "dispatched_through": "Online",
+                            "terms_of_delivery": "Online", "destination": "Vadodara"},
+        "items": [{"description": product, "hsn": "997331", "quantity": quantity, "unit_rate": rate}
+                  for product, quantity, rate in lines],
+        "totals": {"basic_amount": basic, "sgst": basic * 0.09, "cgst": basic * 0.09, "final_amount": basic * 1.18,
+                   "amount_in_words": "", "tax_in_words": ""},
+        "declaration": "",
+    })
+
+
+def purchase_order(number, date, customer, lines):
+    return PurchaseOrder.from_dict({
+        "po_number": number, "po_date": date, "vendor_name": "Arkance IN Pvt. Ltd.", "end_company": customer,
+        "products": [{"name": product, "basic": rate, "qty": quantity} for product, quantity, rate in lines],
+        "grand_total": sum(quantity * rate * 1.18 for _, quantity, rate in lines),
+    })
+
+
+def reconcile(path, documents, incremental):
+    store = DocumentStore(str(path))
+    reconciler = Reconciler(str(path))
+    for document in documents:
+        store.put(document)
+        if incremental:
+            reconciler.run()
+    reconciler.run()
+    return {(row["kind"], row["number"], row["product"], row["status"], row["match"])
+            for row in reconciler.findings((MATCHED, QTY_MISMATCH, NO_INVOICE, "no PO"), limit=100000)}, \
+        reconciler.summary()
+
+
+def test_in_tolerance_po_replaces_a_quantity_mismatch(tmp_path):
+    documents = [
+        invoice("INV1", "01-04-2025", "Acme Pvt Ltd", [("GstarCAD Pro", 5, 100)]),
+        purchase_order("CMI/SD/2025/Q1_001", "02-04-2025", "ACME PVT. LTD.", [("GstarCAD Pro", 3, 80)]),
+        purchase_order("CMI/SD/2025/Q1_002", "03-04-2025", "Acme Pvt. Ltd.", [("GstarCAD Pro", 5, 80)]),
+    ]
+    findings, summary = reconcile(tmp_path / "incremental.sqlite3", documents, incremental=True)
+    assert ("invoice", "INV1", "GstarCAD Pro", MATCHED, "CMI/SD/2025/Q1_002") in findings
+    assert ("po", "CMI/SD/2025/Q1_001", "GstarCAD Pro", NO_INVOICE, None) in findings
+    assert summary["invoice"] == {MATCHED: 1}
+    assert (findings, summary) == reconcile(tmp_path / "fresh.sqlite3", documents, incremental=False)
+
+
+def test_incremental_runs_match_a_run_from_scratch(tmp_path):
+    rng = random.Random(7)
+    customers = ("Acme Pvt Ltd", "Baldridge & Associates", "Delta Designs LLP")
+    products = ("GstarCAD Pro", "Archline.XP 2025", "Adobe Acrobat Pro DC")
+    documents = []
+    for i in range(120):
+        date = f"{rng.randint(1, 28):02d}-{rng.randint(1, 6):02d}-2025"
+        lines = [(product, rng.randint(1, 4), 100) for product in rng.sample(products, rng.randint(1, 2))]
+        if rng.random() < 0.5:
+            documents.append(invoice(f"INV{i}", date, rng.choice(customers), lines))
+        else:
+            documents.append(purchase_order(f"CMI/SD/2025/Q1_{i:03d}", date, rng.choice(customers), lines))
+    documents += documents[:10]  # re-generated numbers replace their earlier lines
+    assert (reconcile(tmp_path / "incremental.sqlite3", documents, incremental=True)
+            == reconcile(tmp_path / "fresh.sqlite3", documents, incremental=False))
@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+import startup_budget
+
+# Wall-clock budgets only hold on a quiet machine; set STARTUP_BUDGET_TIMING=1 to check them too
+TIMING = os.environ.get("STARTUP_BUDGET_TIMING") == "1"
+
+
+@pytest.fixture(scope="module")
+def report():
+    return startup_budget.check()
+
+
+def test_app_modules_defer_heavy_imports(report):
+    failures = [f"{module}: imported {', '.join(result['loaded'])}" for module, result, _ in report if result["loaded"]]
+    assert not failures, "\n".join(failures)
+
+
+@pytest.mark.skipif(not TIMING, reason="set STARTUP_BUDGET_TIMING=1 to check import times")
+def test_app_modules_import_within_budget(report):
+    failures = [f"{module}: took {result['seconds'] * 1000:.0f} ms, budget {startup_budget.BUDGETS[module] * 1000:.0f} ms"
+                for module, result, _ in report if result["seconds"] > startup_budget.BUDGETS[module]]
+    assert not failures, "\n".join(failures)
@@ -0,0 +1,17 @@
+from document_store import DocumentStore
+from margin_report import deal_margins
+from test_reconciliation import invoice, purchase_order
+from top_report import ALL, top_n
+
+
+def test_spellings_of_one_customer_rank_and_net_as_one(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+    store = DocumentStore(path)
+    store.put(invoice("INV1", "01-04-2025", "ACME PVT LTD", [("GstarCAD Pro", 5, 100)]))
+    store.put(purchase_order("CMI/SD/2025/Q1_001", "02-04-2025", "Acme Pvt. Ltd.", [("GSTARCAD PRO", 5, 80)]))
+    report = top_n(by="margin", path=path)
+    customers = report["customers"][ALL]
+    assert [(row["customer"], row["revenue"], row["cost"], row["margin"]) for row in customers] == \
+        [("ACME PVT LTD", 500.0, 400.0, 100.0)]
+    assert [row["product"] for row in report["products"][ALL]] == ["GstarCAD Pro"]
+    assert deal_margins(path=path)["totals"]["margin"] == customers[0]["margin"]
@@ -0,0 +1,135 @@
+import heapq
+from functools import lru_cache
+
+from document_store import DocumentStore
+from margin_report import customer_key, product_key
+
+# --- Top Products and Customers ---
+# Ranks products and customers by revenue or margin over a date range, per
+# product family. One pass streams the invoice (revenue) and PO (cost) lines
+# of the range out of the document store's document_lines table, summing
+# per product and per customer; each family then keeps its best N in a
+# bounded min-heap, so nothing holds more than the per-key sums at a time.
+# Margin is invoice revenue minus what the POs of the same range paid
+# vendors for the same product (or for the same end customer). Names are
+# matched on margin_report's keys, so both reports agree on who is who; a
+# row shows the first spelling seen.
+#
+#   python top_report.py 2025-04-01 2026-03-31 --by margin -n 5
+
+FAMILIES = (
+    ("GstarCAD", ("gstarcad",)),
+    ("Archline.XP", ("archline",)),
+    ("Adobe", ("adobe", "creative cloud", "acrobat", "substance 3d")),
+    ("Autodesk", ("autodesk",)),
+)
+OTHER = "Other"
+ALL = "All"
+METRICS = ("revenue", "margin", "cost", "quantity")
+
+
+@lru_cache(maxsize=4096)
+def product_family(name):
+    """Family of a product name ("GstarCAD", "Adobe", ...), or OTHER"""
+    lowered = name.casefold()
+    for family, keywords in FAMILIES:
+        if any(keyword in lowered for keyword in keywords):
+            return family
+    return OTHER
+
+
+class BoundedTop:
+    """The n largest (score, key) pairs pushed so far"""
+    __slots__ = ("n", "_heap")
+
+    def __init__(self, n):
+        self.n = n
+        self._heap = []
+
+    def push(self, score, key, row):
+        entry = (score, key, row)
+        if len(self._heap) < self.n:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+
+    def rows(self):
+        """Largest first"""
+        return [row for _, _, row in sorted(self._heap, key=lambda entry: entry[:2], reverse=True)]
+
+
+def _totals(store, since, until):
+    # {(family, key): [name, revenue, cost, quantity]} for products and for customers
+    products, customers = {}, {}
+    for kind, buyer, product, quantity, amount in store.lines(("invoice", "po"), since, until):
+        column = 1 if kind == "invoice" else 2
+        item = product_key(product)
+        family = product_family(item)
+        for table, key, name in ((products, item, product),
+                                 (customers, customer_key(buyer), buyer)):
+            sums = table.get((family, key))
+            if sums is None:
+                sums = table[(family, key)] = [name, 0.0, 0.0, 0.0]
+            sums[column] += amount
+            if column == 1:
+                sums[3] += quantity
+    return products, customers
+
+
+def _row(label, name, family, sums):
+    revenue, cost, quantity = sums
+    return {label: name, "family": family, "revenue": round(revenue, 2), "cost": round(cost, 2),
+            "margin": round(revenue - cost, 2), "quantity": quantity}
+
+
+def _rank(table, by, n, label):
+    tops = {}
+    overall = {}  # key -> [name, sums...] across families, for the ALL ranking
+    for (family, key), (name, *sums) in table.items():
+        row = _row(label, name, family, sums)
+        top = tops.get(family)
+        if top is None:
+            top = tops[family] = BoundedTop(n)
+        top.push(row[by], key, row)
+        merged = overall.setdefault(key, [name, 0.0, 0.0, 0.0])
+        for i, value in enumerate(sums, 1):
+            merged[i] += value
+    top = tops[ALL] = BoundedTop(n)
+    for key, (name, *sums) in overall.items():
+        row = _row(label, name, ALL, sums)
+        top.push(row[by], key, row)
+    return {group: top.rows() for group, top in tops.items()}
+
+
+def top_n(since=None, until=None, n=10, by="revenue", path=None):
+    """{"products": {family: rows}, "customers": {family: rows}}, best n per family.
+
+    since/until are inclusive ISO dates; by is one of METRICS. The ALL
+    family ranks across every family.
+    """
+    if by not in METRICS:
+        raise ValueError(f"Unknown metric '{by}'")
+    products, customers = _totals(DocumentStore(path), since, until)
+    return {"products": _rank(products, by, n, "product"), "customers": _rank(customers, by, n, "customer")}
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Top products and customers by product family")
+    parser.add_argument("since", nargs="?")
+    parser.add_argument("until", nargs="?")
+    parser.add_argument("-n", type=int, default=10)
+    parser.add_argument("--by", choices=METRICS, default="revenue")
+    parser.add_argument("--db", help="document store path")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    report = top_n(args.since, args.until, args.n, args.by, args.db)
+    for section, groups in report.items():
+        for group, rows in sorted(groups.items()):
+            print(f"\n{section} - {group}")
+            for row in rows:
+                name = row.get("product") or row.get("customer")
+                print(f"  {name[:48]:<50}{row[args.by]:>16,.2f}")
+    print(f"\n{time.perf_counter() - started:.2f} s")
@@ -0,0 +1,202 @@
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+
+import fpdf.fpdf as fpdf_module
+from fpdf.ttfonts import TTFontFile
+
+# --- Unicode TTF Fonts ---
+# The builders render with embedded, subsetted TrueType fonts instead of the
+# latin-1 core Helvetica. Parsing a TTF (cmap, hmtx, ...) is the expensive
+# part, so metrics are parsed once per process (optionally pickled to disk)
+# and injected straight into each new FPDF; subset streams for the same glyph
+# set are reused across documents.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FONT_DIR = os.path.join(BASE_DIR, "fonts")
+
+# family -> {style: ttf path}. Styles missing from a family fall back to the
+# regular face so set_font(family, "B") never fails.
+FONT_FAMILIES = {
+    "Calibri": {
+        "": os.path.join(FONT_DIR, "calibri.ttf"),
+        "B": os.path.join(FONT_DIR, "calibrib.ttf"),
+        "I": os.path.join(FONT_DIR, "calibrii.ttf"),
+        "BI": os.path.join(FONT_DIR, "calibriz.ttf"),
+    },
+    "DejaVu": {
+        "": os.path.join(BASE_DIR, "DejaVuSans.ttf"),
+    },
+}
+DOCUMENT_FONT = "Calibri"
+FALLBACK_FONT = "DejaVu"
+MISSING_GLYPH = "?"
+
+# Set DOC_FONT_CACHE_DIR to persist parsed metrics across processes
+FONT_CACHE_DIR = os.environ.get("DOC_FONT_CACHE_DIR", "")
+SUBSET_CACHE_SIZE = 64
+
+_metrics_cache = {}
+_subset_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _disk_cache_path(ttf_path):
+    stat = os.stat(ttf_path)
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", os.path.basename(ttf_path))
+    return os.path.join(FONT_CACHE_DIR, f"{name}.{stat.st_size}.{stat.st_mtime_ns}.pkl")
+
+
+def _parse_metrics(ttf_path, fontkey):
+    """Parse a TTF the same way FPDF.add_font(uni=True) does"""
+    ttf = TTFontFile()
+    ttf.getMetrics(ttf_path)
+    desc = {
+        'Ascent': int(round(ttf.ascent, 0)),
+        'Descent': int(round(ttf.descent, 0)),
+        'CapHeight': int(round(ttf.capHeight, 0)),
+        'Flags': ttf.flags,
+        'FontBBox': "[%s %s %s %s]" % tuple(int(round(v, 0)) for v in ttf.bbox),
+        'ItalicAngle': int(ttf.italicAngle),
+        'StemV': int(round(ttf.stemV, 0)),
+        'MissingWidth': int(round(ttf.defaultWidth, 0)),
+    }
+    return {
+        'name': re.sub('[ ()]', '', ttf.fullName),
+        'type': 'TTF',
+        'desc': desc,
+        'up': round(ttf.underlinePosition),
+        'ut': round(ttf.underlineThickness),
+        'ttffile': ttf_path,
+        'fontkey': fontkey,
+        'originalsize': os.stat(ttf_path).st_size,
+        'cw': ttf.charWidths,
+    }
+
+
+def font_metrics(ttf_path, fontkey=""):
+    """Parsed metrics for a TTF, cached per process (and on disk if configured)"""
+    metrics = _metrics_cache.get(ttf_path)
+    if metrics is not None:
+        return metrics
+    with _lock:
+        metrics = _metrics_cache.get(ttf_path)
+        if metrics is None:
+            cache_file = _disk_cache_path(ttf_path) if FONT_CACHE_DIR else None
+            if cache_file and os.path.exists(cache_file):
+                with open(cache_file, "rb") as fh:
+                    metrics = pickle.load(fh)
+            else:
+                metrics = _parse_metrics(ttf_path, fontkey)
+                if cache_file:
+                    try:
+                        os.makedirs(FONT_CACHE_DIR, exist_ok=True)
+                        with open(cache_file, "wb") as fh:
+                            pickle.dump(metrics, fh)
+                    except OSError:
+                        pass
+            _metrics_cache[ttf_path] = metrics
+    return metrics
+
+
+def _family_key(family):
+    for name in FONT_FAMILIES:
+        if name.lower() == family.lower():
+            return name
+    return None
+
+
+def resolve_face(family, style=""):
+    """The style whose TTF actually backs family/style.
+
+    Families without bold/italic files draw those styles with the regular
+    face, so they share one font object instead of embedding the file twice.
+    """
+    faces = FONT_FAMILIES[family]
+    for candidate in (style, style.replace("I", ""), ""):
+        if candidate in faces:
+            return candidate
+    return ""
+
+
+def register_face(pdf, family, style=""):
+    """Register one face of a family on pdf using the cached metrics"""
+    style = resolve_face(family, style)
+    fontkey = family.lower() + style
+    if fontkey in pdf.fonts:
+        return
+    path = FONT_FAMILIES[family][style]
+    metrics = font_metrics(path, fontkey)
+    # Same entry FPDF.add_font(uni=True) builds, minus re-reading the file.
+    # The subset list is per document because FPDF appends used glyphs to it.
+    pdf.fonts[fontkey] = {
+        'i': len(pdf.fonts) + 1, 'type': 'TTF',
+        'name': metrics['name'], 'desc': metrics['desc'],
+        'up': metrics['up'], 'ut': metrics['ut'],
+        'cw': metrics['cw'],
+        'ttffile': path, 'fontkey': fontkey,
+        'subset': list(range(0, 57 if hasattr(pdf, 'str_alias_nb_pages') else 32)),
+        'unifilename': None,
+    }
+    pdf.font_files[fontkey] = {'length1': metrics['originalsize'], 'type': "TTF", 'ttffile': path}
+    pdf.font_files[path] = {'type': "TTF"}
+
+
+class UnicodeFontsMixin:
+    """FPDF mixin: families in FONT_FAMILIES are registered on first set_font.
+
+    Registering lazily keeps unused faces out of the output, since FPDF embeds
+    every registered font.
+    """
+
+    def set_font(self, family, style='', size=0):
+        family_key = _family_key(family) if family else None
+        if family_key:
+            face = style.upper().replace("U", "")
+            face = resolve_face(family_key, "BI" if face == "IB" else face)
+            register_face(self, family_key, face)
+            style = face + ("U" if "U" in style.upper() else "")
+        return super().set_font(family, style, size)
+
+
+def sanitize_text(text, family=DOCUMENT_FONT):
+    """Keep every character the font can draw; mark the rest instead of dropping them"""
+    if not isinstance(text, str):
+        text = "" if text is None else str(text)
+    cw = font_metrics(FONT_FAMILIES[family][""])['cw']
+    limit = len(cw)
+    out = []
+    for char in text:
+        code = ord(char)
+        if char in "\n\t" or (code < limit and cw[code]):
+            out.append(char)
+        elif code >= 32:
+            out.append(MISSING_GLYPH)
+    return "".join(out)
+
+
+class CachedTTFontFile(TTFontFile):
+    """TTFontFile whose subsets are reused across documents with the same glyph set"""
+
+    def makeSubset(self, file, subset):
+        key = (file, tuple(sorted(set(subset))))
+        with _lock:
+            hit = _subset_cache.get(key)
+            if hit is not None:
+                _subset_cache.move_to_end(key)
+        if hit is None:
+            stream = TTFontFile.makeSubset(self, file, subset)
+            hit = (stream, dict(self.codeToGlyph), self.maxUni)
+            with _lock:
+                _subset_cache[key] = hit
+                while len(_subset_cache) > SUBSET_CACHE_SIZE:
+                    _subset_cache.popitem(last=False)
+        stream, code_to_glyph, self.maxUni = hit
+        self.codeToGlyph = dict(code_to_glyph)
+        return stream
+
+
+# FPDF looks TTFontFile up as a module global when embedding fonts
+fpdf_module.TTFontFile = CachedTTFontFile
@@ -0,0 +1,155 @@
+import re
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+import normalize
+
+# --- Vendor Registry ---
+# One indexed view of every vendor the app knows: the built-in
+# VENDOR_DATABASE and the Vendors sheet of the uploaded workbook. Records
+# are matched on a name key that ignores case, punctuation and company
+# suffixes ("Pvt. Ltd.", "LLP"), so "MicroGenesis CADSoft Pvt.Ltd." and
+# "Microgenesis Cadsoft Pvt Ltd" are one vendor.
+#
+# Precedence: a non-blank value from the workbook overrides the built-in
+# value of the same field (the upload is the newer data); blanks never
+# erase a built-in value; the first workbook row of a vendor wins; the
+# built-in spelling of the name is kept so dropdown choices stay stable.
+# Different vendors that share a GSTIN across the two sources are reported
+# as duplicates but not merged.
+#
+# A registry is built once per workbook (MasterData.digest) and shared.
+
+FIELDS = ("address", "contact", "mobile", "email", "gst_no", "pan_no", "msme_no")
+SHEET_COLUMNS = {
+    "address": "Vendor Address",
+    "contact": "Contact Person",
+    "mobile": "Mobile",
+    "email": "Email",
+    "gst_no": "GST NO",
+    "pan_no": "PAN NO",
+    "msme_no": "MSME NO",
+}
+NORMALIZERS = {
+    "mobile": normalize.phone,
+    "email": normalize.email,
+    "gst_no": normalize.gstin,
+    "pan_no": normalize.pan,
+    "msme_no": normalize.msme,
+}
+BUILT_IN = "built-in"
+WORKBOOK = "workbook"
+MAX_REGISTRIES = 5
+
+_SUFFIXES = {"pvt", "private", "ltd", "limited", "llp", "inc", "co", "company", "corp", "the"}
+_WORDS = re.compile(r"[a-z0-9]+")
+
+_registries = OrderedDict()
+_lock = threading.Lock()
+
+
+def name_key(name):
+    """Matching key for a vendor name: lower-case words without company suffixes"""
+    words = _WORDS.findall(str(name or "").casefold())
+    return " ".join(word for word in words if word not in _SUFFIXES) or " ".join(words)
+
+
+class VendorRegistry:
+    """Merged vendors with O(1) lookup by name"""
+    __slots__ = ("version", "_records", "_keys", "_gstin_source", "duplicates")
+
+    def __init__(self, version):
+        self.version = version
+        self._records = {}  # display name -> record
+        self._keys = {}  # name_key -> display name
+        self._gstin_source = {}  # display name -> source of its gst_no
+        self.duplicates = []
+
+    def _add(self, name, values, source):
+        key = name_key(name)
+        current = self._keys.get(key)
+        if current is None:
+            record = {"name": name, "sources": (source,)}
+            record.update((field, values.get(field)) for field in FIELDS)
+            self._keys[key] = name
+            self._records[name] = record
+            self._gstin_source[name] = source
+            return
+        record = self._records[current]
+        if source in record["sources"]:
+            return  # first row of a source wins
+        self.duplicates.append({"kind": "name", "key": key, "names": (current, name), "merged": True})
+        for field in FIELDS:
+            if values.get(field):
+                record[field] = values[field]
+        if values.get("gst_no"):
+            self._gstin_source[current] = source
+        record["sources"] += (source,)
+
+    def _freeze(self):
+        self._records = {name: MappingProxyType(record) for name, record in self._records.items()}
+        by_gstin = {}
+        for record in self._records.values():
+            if record["gst_no"]:
+                by_gstin.setdefault(record["gst_no"], []).append(record)
+        for gstin, records in by_gstin.items():
+            sources = {self._gstin_source[record["name"]] for record in records}
+            if len(records) > 1 and len(sources) > 1:
+                self.duplicates.append({"kind": "gstin", "key": gstin,
+                                        "names": tuple(record["name"] for record in records), "merged": False})
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, name):
+        return name in self._records or name_key(name) in self._keys
+
+    def __getitem__(self, name):
+        record = self.get(name)
+        if record is None:
+            raise KeyError(name)
+        return record
+
+    def get(self, name, default=None):
+        """Record for a display name or any spelling with the same name key"""
+        record = self._records.get(name)
+        if record is None:
+            current = self._keys.get(name_key(name))
+            record = self._records[current] if current is not None else None
+        return default if record is None else record
+
+    def names(self):
+        """Display names: built-in vendors first, then workbook-only ones in sheet order"""
+        return tuple(self._records)
+
+
+def build_registry(builtin, master=None):
+    """VendorRegistry from the built-in vendor dict and an optional MasterData"""
+    registry = VendorRegistry(master.digest if master is not None else None)
+    for name, values in builtin.items():
+        registry._add(name, {field: NORMALIZERS.get(field, normalize.text)(values.get(field))
+                             for field in FIELDS}, BUILT_IN)
+    if master is not None:
+        for row in master.vendors.rows():
+            name = row.get(master.vendors.key)
+            if name:
+                registry._add(name, {field: row.get(column) for field, column in SHEET_COLUMNS.items()}, WORKBOOK)
+    registry._freeze()
+    return registry
+
+
+def get_registry(builtin, master=None):
+    """Shared registry for builtin plus master, built once per workbook"""
+    version = (id(builtin), master.digest if master is not None else None)
+    with _lock:
+        registry = _registries.get(version)
+        if registry is not None:
+            _registries.move_to_end(version)
+            return registry
+    registry = build_registry(builtin, master)
+    with _lock:
+        registry = _registries.setdefault(version, registry)
+        while len(_registries) > MAX_REGISTRIES:
+            _registries.popitem(last=False)
+    return registry
@@ -0,0 +1,101 @@
+import importlib
+import threading
+import time
+
+from document_codec import encode_payload
+from document_worker import BUILDERS, DEFAULT_IMAGES, render_blob, resolve_builder
+
+# --- Process Warm-up ---
+# The first document rendered in a fresh process pays for importing PIL and
+# fpdf, parsing font metrics, optimizing the logo and stamp and loading the
+# builders. warm_up() does that up front and renders one throwaway document
+# of each kind, so the first real request runs at steady-state speed. Render
+# pools call it as their process initializer; the app starts it on a
+# background thread when the first session opens. Modules only an upload or
+# the form needs (num2words, openpyxl, xlrd) stay deferred (lazy_imports);
+# warming them would undo the app's startup budget (startup_budget.py).
+#
+#   python warmup.py      prints what each step costs in a cold process
+
+HEAVY_MODULES = ("PIL.Image", "fpdf")
+
+SAMPLES = {
+    "invoice": {
+        "invoice": {"invoice_no": "WARMUP", "date": "01-04-2025"},
+        "Reference": {"Suppliers_Reference": "NA", "Other": "NA"},
+        "vendor": {"name": "CM Infotech", "address": "Ahmedabad", "gst": "24ANMPP4891R1ZX", "msme": "NA"},
+        "buyer": {"name": "Customer", "address": "Vadodara", "gst": "NA"},
+        "invoice_details": {"buyers_order_no": "Online", "buyers_order_date": "01-04-2025",
+                            "dispatched_through": "Online", "terms_of_delivery": "Within Month",
+                            "destination": "Vadodara"},
+        "items": [{"description": "Software License", "hsn": "997331", "quantity": 1.0, "unit_rate": 1000.0}],
+        "totals": {"basic_amount": 1000.0, "sgst": 90.0, "cgst": 90.0, "final_amount": 1180.0,
+                   "amount_in_words": "One Thousand One Hundred And Eighty Only/-",
+                   "tax_in_words": "One Hundred And Eighty Only/-"},
+        "declaration": "We declare that this invoice shows the actual price of the goods described.",
+    },
+    "po": {
+        "po_number": "WARMUP", "po_date": "01-04-2025", "vendor_name": "Vendor", "vendor_address": "Address",
+        "vendor_contact": "Contact", "vendor_mobile": "+91 00000 00000", "gst_no": "NA", "pan_no": "NA",
+        "msme_no": "NA", "bill_to_company": "CM Infotech", "bill_to_address": "Ahmedabad",
+        "ship_to_company": "CM Infotech", "ship_to_address": "Ahmedabad", "end_company": "End User",
+        "end_address": "Address", "end_person": "Contact", "end_mobile": "+91 00000 00000",
+        "end_email": "user@example.com", "products": [{"name": "Software License", "basic": 1000.0,
+                                                       "gst_percent": 18.0, "qty": 1.0}],
+        "grand_total": 1180.0, "amount_words": "One Thousand One Hundred And Eighty Rupees Only",
+        "payment_terms": "30 days", "delivery_terms": "Within 2 weeks", "prepared_by": "Finance",
+        "authorized_by": "CM Infotech", "company_name": "CM Infotech",
+    },
+    "quotation": {
+        "quotation_number": "WARMUP", "quotation_date": "01-04-2025", "vendor_name": "Customer",
+        "vendor_address": "Address", "vendor_email": "user@example.com", "vendor_contact": "Contact",
+        "vendor_mobile": "+91 00000 00000", "products": [{"name": "Software License", "basic": 1000.0,
+                                                          "gst_percent": 18.0, "qty": 1.0}],
+        "price_validity": "30 days", "grand_total": 1180.0, "subject": "Proposal",
+        "intro_paragraph": "This is with reference to your requirement.", "product_name": "Software",
+    },
+}
+
+_warm = threading.Event()
+_lock = threading.Lock()
+_thread = None
+
+
+def warm_up(kinds=None):
+    """Load everything a render needs and render each kind once; returns {step: seconds}"""
+    timings = {}
+
+    def step(name, func, *args):
+        started = time.perf_counter()
+        func(*args)
+        timings[name] = round(time.perf_counter() - started, 3)
+
+    for module in HEAVY_MODULES:
+        step(f"import {module}", importlib.import_module, module)
+    for kind in kinds or BUILDERS:
+        step(f"load {kind} builder", resolve_builder, kind)
+        step(f"render {kind}", render_blob, kind, encode_payload(kind, SAMPLES[kind]), DEFAULT_IMAGES[kind],
+             {"deterministic": True})
+    _warm.set()
+    return timings
+
+
+def start_warm_up():
+    """warm_up() on a background thread, once per process"""
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+            _thread.start()
+    return _thread
+
+
+def is_warm():
+    return _warm.is_set()
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    for name, seconds in warm_up().items():
+        print(f"{name:<24}{seconds * 1000:8.1f} ms")
+    print(f"{'total':<24}{(time.perf_counter() - started) * 1000:8.1f} ms")
@@ -0,0 +1,128 @@
+import io
+import time
+
+from lazy_imports import LazyModule
+
+openpyxl = LazyModule("openpyxl")
+xlrd = LazyModule("xlrd")
+
+# --- Streaming Workbook Loader ---
+# Reads one sheet of an .xlsx (openpyxl read-only mode) or legacy .xls (xlrd)
+# row by row and keeps only the wanted columns, one tuple per column. Unlike
+# pd.read_excel nothing holds the whole sheet as cell objects or a DataFrame,
+# so memory grows with the values kept rather than with the sheet. Repeated
+# values (cities, company names) share one object per column.
+#
+# openpyxl sizes every sheet when the workbook is opened, which means a full
+# scan of any sheet saved without a <dimension> record (Excel always writes
+# one), so a WorkbookReader is opened once and used for all the sheets.
+#
+#   python workbook_loader.py book.xlsx Vendors "Vendor Name" Mobile
+
+PROGRESS_EVERY = 10000  # rows between on_progress calls
+
+_XLS_MAGIC = b"\xd0\xcf\x11\xe0"
+
+
+def is_xls(data):
+    """True for a legacy (BIFF/OLE2) .xls workbook"""
+    return bytes(data[:4]) == _XLS_MAGIC
+
+
+def _xls_value(cell, datemode):
+    if cell.ctype == xlrd.XL_CELL_NUMBER:
+        # xlrd stores every number as float; match openpyxl for whole numbers
+        return int(cell.value) if cell.value.is_integer() else cell.value
+    if cell.ctype == xlrd.XL_CELL_TEXT:
+        return cell.value
+    if cell.ctype == xlrd.XL_CELL_DATE:
+        return xlrd.xldate.xldate_as_datetime(cell.value, datemode)
+    if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(cell.value)
+    return None  # empty, blank or error
+
+
+class WorkbookReader:
+    """Sheets of one .xlsx or .xls, opened once and read row by row"""
+
+    def __init__(self, data):
+        self.legacy = is_xls(data)
+        if self.legacy:
+            self._book = xlrd.open_workbook(file_contents=bytes(data), on_demand=True)
+        else:
+            self._book = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+
+    def sheet_names(self):
+        return self._book.sheet_names() if self.legacy else self._book.sheetnames
+
+    def rows(self, sheet):
+        """(total_rows or None, iterator of value tuples) for sheet"""
+        if sheet not in self.sheet_names():
+            raise ValueError(f"Workbook has no '{sheet}' sheet")
+        if not self.legacy:
+            worksheet = self._book[sheet]
+            return worksheet.max_row, worksheet.iter_rows(values_only=True)
+        worksheet = self._book.sheet_by_name(sheet)
+
+        def rows():
+            for i in range(worksheet.nrows):
+                yield tuple(_xls_value(cell, self._book.datemode) for cell in worksheet.row(i))
+            self._book.unload_sheet(sheet)
+
+        return worksheet.nrows, rows()
+
+    def close(self):
+        if self.legacy:
+            self._book.release_resources()
+        else:
+            self._book.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_columns(book, sheet, columns, key, on_progress=None):
+    """Read the wanted columns of a WorkbookReader sheet: (found_columns, [values per column]).
+
+    The first row is the header; columns not in it are skipped, but key must
+    be present. Rows with none of the wanted values are dropped.
+    on_progress(sheet, rows_read, total_rows) is called every PROGRESS_EVERY
+    rows and once at the end; total_rows is None when the file doesn't say.
+    """
+    total, rows = book.rows(sheet)
+    header = next(rows, None) or ()
+    header = [str(name).strip() if name is not None else "" for name in header]
+    if key not in header:
+        raise ValueError(f"Sheet '{sheet}' has no '{key}' column")
+    wanted = [(name, header.index(name)) for name in columns if name in header]
+    positions = [position for _, position in wanted]
+    values = [[] for _ in wanted]
+    shared = [{} for _ in wanted]
+    total = total - 1 if total else None
+    read = 0
+    for row in rows:
+        read += 1
+        cells = [row[p] if p < len(row) else None for p in positions]
+        if any(cell is not None and cell != "" for cell in cells):
+            for column, seen, cell in zip(values, shared, cells):
+                column.append(seen.setdefault(cell, cell))
+        if on_progress and read % PROGRESS_EVERY == 0:
+            on_progress(sheet, read, total)
+    if on_progress:
+        on_progress(sheet, read, read)
+    return [name for name, _ in wanted], [tuple(column) for column in values]
+
+
+if __name__ == "__main__":
+    import sys
+    path, sheet, key, *rest = sys.argv[1:]
+    with open(path, "rb") as f:
+        data = f.read()
+    started = time.perf_counter()
+    with WorkbookReader(data) as book:
+        found, values = read_columns(book, sheet, [key, *rest], key,
+                                     lambda s, n, t: print(f"{s}: {n}/{t or '?'} rows", file=sys.stderr))
+    print(f"{len(values[0])} rows x {found} in {time.perf_counter() - started:.2f} s")